@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+"""Benchmark Kraken data ingestion end to end on a local Kraken stand-in.
+Runs on a database created for the benchmark, as the test runner does, so
+the data on the configured database is never touched. Results are written as
+JSON so runs of different releases can be compared, i.e
+    python benchmark_ingestion.py --sizes 1000 100000 -o new.json \
+        --compare old.json
+"""
+import argparse
+import json
+import os
+
+
+parser = argparse.ArgumentParser(prog='benchmark_ingestion',
+                                 allow_abbrev=False,
+                                 description='Benchmark Kraken data '
+                                             'ingestion pipelines')
+parser.add_argument('--sizes',
+                    metavar='candles',
+                    type=int,
+                    nargs='+',
+                    default=[1000, 100000, 1000000],
+                    help='total candles loaded on every run')
+parser.add_argument('--symbols',
+                    type=int,
+                    default=6,
+                    help='least symbols the candles are spread across, '
+                         'more are used so none gets more than '
+                         '--max-days candles')
+parser.add_argument('--max-days',
+                    type=int,
+                    default=720,
+                    help='most daily candles served per symbol')
+parser.add_argument('--pipelines',
+                    nargs='+',
+                    default=None,
+                    help='pipelines to run, all of them by default')
+parser.add_argument('--per-row-max-candles',
+                    type=int,
+                    default=10000,
+                    help='skip the per_row pipeline above this size')
+parser.add_argument('--latency',
+                    type=float,
+                    default=0,
+                    help='seconds the stand-in waits before every response')
+parser.add_argument('--no-memory',
+                    dest='measure_memory',
+                    action='store_false',
+                    help='do not run again to measure peak memory')
+parser.add_argument('-o',
+                    metavar='output',
+                    dest='output',
+                    default='ingestion_benchmark.json',
+                    help='file to write the JSON results to')
+parser.add_argument('--compare',
+                    metavar='previous',
+                    default=None,
+                    help='JSON results of a previous run to compare with')
+parser.add_argument('--keepdb',
+                    action='store_true',
+                    help='keep the benchmark database between runs')
+
+
+def main():
+    """Set up django and a benchmark database and run the benchmarks"""
+    args = parser.parse_args()
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'crypto_rest.settings')
+    import django
+    django.setup()
+    from django.db import connection
+    from data_loader.benchmark import run_benchmarks, compare_results
+
+    database_name = connection.settings_dict['NAME']
+    # a name of its own so a test run going on is not affected
+    connection.settings_dict['TEST']['NAME'] = f'benchmark_{database_name}'
+    connection.creation.create_test_db(verbosity=0, autoclobber=True,
+                                       keepdb=args.keepdb)
+    try:
+        report = run_benchmarks(args.sizes,
+                                args.symbols,
+                                args.pipelines,
+                                args.measure_memory,
+                                args.per_row_max_candles,
+                                {'latency': args.latency},
+                                max_days=args.max_days)
+    finally:
+        connection.creation.destroy_test_db(database_name, verbosity=0,
+                                            keepdb=args.keepdb)
+    with open(args.output, 'w', encoding='utf-8') as output:
+        json.dump(report, output, indent=2)
+    print(f'Results written to {args.output}')
+    if args.compare is not None:
+        with open(args.compare, encoding='utf-8') as previous:
+            comparison = compare_results(json.load(previous), report)
+        for pipeline, candles, before, after, ratio in comparison:
+            print(f'{pipeline:>8} {candles:>9} candles {before:>10.0f} -> '
+                  f'{after:>10.0f} rows/s ({ratio:.2f}x)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+"""Benchmark KrakenOHLCList responses with the serializer and with the fast
+path of settings.OHLC_FAST_LIST. Runs on a database created for the
+benchmark, as the test runner does, so the data on the configured database
+is never touched, i.e
+    python benchmark_list.py --sizes 10000 100000 -o list.json
+"""
+import argparse
+import json
+import os
+
+
+parser = argparse.ArgumentParser(prog='benchmark_list',
+                                 allow_abbrev=False,
+                                 description='Benchmark KrakenOHLCList '
+                                             'serialization paths')
+parser.add_argument('--sizes',
+                    metavar='rows',
+                    type=int,
+                    nargs='+',
+                    default=[10000, 100000],
+                    help='total rows listed on every run')
+parser.add_argument('--symbols',
+                    type=int,
+                    default=100,
+                    help='symbols the rows are spread across')
+parser.add_argument('--page-size',
+                    type=int,
+                    default=1000,
+                    help='rows of every page')
+parser.add_argument('--paths',
+                    nargs='+',
+                    default=None,
+                    help='paths to run, all of them by default')
+parser.add_argument('-o',
+                    metavar='output',
+                    dest='output',
+                    default='list_benchmark.json',
+                    help='file to write the JSON results to')
+parser.add_argument('--keepdb',
+                    action='store_true',
+                    help='keep the benchmark database between runs')
+
+
+def main():
+    """Set up django and a benchmark database and run the benchmarks"""
+    args = parser.parse_args()
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'crypto_rest.settings')
+    import django
+    django.setup()
+    from django.db import connection
+    from crypto_data.benchmark import run_benchmarks, speedups
+
+    database_name = connection.settings_dict['NAME']
+    # a name of its own so a test run going on is not affected
+    connection.settings_dict['TEST']['NAME'] = f'benchmark_{database_name}'
+    connection.creation.create_test_db(verbosity=0, autoclobber=True,
+                                       keepdb=args.keepdb)
+    try:
+        report = run_benchmarks(args.sizes,
+                                args.symbols,
+                                args.page_size,
+                                args.paths)
+    finally:
+        connection.creation.destroy_test_db(database_name, verbosity=0,
+                                            keepdb=args.keepdb)
+    with open(args.output, 'w', encoding='utf-8') as output:
+        json.dump(report, output, indent=2)
+    print(f'Results written to {args.output}')
+    for path, rows, ratio in speedups(report):
+        print(f'{path:>10} {rows:>9} rows {ratio:.2f}x the serializer')
+
+
+if __name__ == '__main__':
+    main()
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class CryptoDataConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'crypto_data'
+
+    def ready(self):
+        # connect the signal receivers
+        from crypto_data import signals  # noqa: F401
@@ -0,0 +1,154 @@
+"""Measure KrakenOHLCList responses, read -> represent -> render, with
+KrakenOHLCSerializer and with KrakenOHLCListEncoder (settings.OHLC_FAST_LIST)
+over synthetic rows"""
+import datetime
+import platform
+import time
+from urllib.parse import urlsplit, parse_qsl
+import django
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import override_settings
+from rest_framework.test import APIRequestFactory, force_authenticate
+from crypto_data import views
+from crypto_data.models import KrakenOHLC, KrakenSymbols
+from crypto_data.partitions import ensure_partitions
+from data_loader.benchmark import create_benchmark_symbols, clear_OHLC_data
+
+
+SIZES = (10000, 100000)
+# rows of few symbols span decades of monthly partitions, every page is
+# then planned across hundreds of them whatever the path
+DEFAULT_SYMBOLS = 100
+# biggest page staff users can request, serialization dominates the time
+PAGE_SIZE = 1000
+FIRST_DATE = datetime.date(2000, 1, 1)
+# settings.OHLC_FAST_LIST of every path
+PATHS = {
+    'serializer': False,
+    'fast': True,
+}
+
+
+def create_benchmark_rows(rows: int, symbols: int):
+    """Replace the saved symbols and OHLC with rows spread across amount of
+    symbols, daily from FIRST_DATE, inserted in a single query.
+    @returns:
+        - amount of rows saved.
+    """
+    clear_OHLC_data()
+    create_benchmark_symbols(symbols)
+    days = max(rows // symbols, 1)
+    ensure_partitions(KrakenOHLC, FIRST_DATE,
+                      FIRST_DATE + datetime.timedelta(days=days))
+    fields = {f.name: f.column for f in KrakenOHLC._meta.fields}
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO "{KrakenOHLC._meta.db_table}" '
+            f'("{fields["symbol"]}", "{fields["date"]}", "{fields["open"]}", '
+            f'"{fields["high"]}", "{fields["low"]}", "{fields["close"]}") '
+            f'SELECT s.id, %s + d::integer, 1000000000 + d * 1234567, '
+            f'1100000000 + d * 1234567, 900000000 + d, 1050000000 + d * 7 '
+            f'FROM "{KrakenSymbols._meta.db_table}" s, '
+            f'generate_series(0::bigint, %s) d', [FIRST_DATE, days - 1])
+        cursor.execute(f'ANALYZE "{KrakenOHLC._meta.db_table}"')
+    return KrakenOHLC.objects.count()
+
+
+def list_every_page(user: User, page_size: int):
+    """Request every KrakenOHLCList page as user, rendered as JSON.
+    @returns:
+        - tuple (rows, bytes) listed.
+    """
+    factory = APIRequestFactory()
+    view = views.KrakenOHLCList.as_view()
+    params = {'page_size': page_size}
+    rows = size = 0
+    while params is not None:
+        request = factory.get('/crypto-data/kraken-ohlc/', params)
+        force_authenticate(request, user)
+        response = view(request)
+        response.render()
+        rows += len(response.data['results'])
+        size += len(response.content)
+        next_link = response.data['next']
+        params = (dict(parse_qsl(urlsplit(next_link).query))
+                  if next_link is not None else None)
+    return rows, size
+
+
+def benchmark_path(name: str, user: User, page_size: int):
+    """List every row with the path.
+    @returns:
+        - dict with rows and bytes listed and rows per second.
+    """
+    with override_settings(OHLC_FAST_LIST=PATHS[name]):
+        start = time.perf_counter()
+        rows, size = list_every_page(user, page_size)
+        seconds = time.perf_counter() - start
+    return {
+        'path': name,
+        'rows': rows,
+        'page_size': page_size,
+        'bytes': size,
+        'seconds': seconds,
+        'rows_per_second': rows / seconds if seconds else None,
+    }
+
+
+def run_benchmarks(sizes=SIZES, symbols: int = DEFAULT_SYMBOLS,
+                   page_size: int = PAGE_SIZE, paths=None, report=print):
+    """Benchmark every path listing every size of rows. Requests are made
+    by a staff user so the pages can be big and the response cache is not
+    used, neither is the OHLC cache as no date range is requested.
+    @args:
+        - sizes: total amount of rows of every run.
+        - symbols: amount of symbols the rows are spread across.
+        - page_size: rows of every page.
+        - paths: names on PATHS to run, defaults to all of them.
+        - report: function called with a line of text after every run.
+    @returns:
+        - dict ready to be written as JSON, with the environment and the
+        result of every run.
+    """
+    paths = list(paths or PATHS)
+    user, _ = User.objects.get_or_create(username='benchmark',
+                                         defaults={'is_staff': True})
+    results = []
+    for size in sizes:
+        create_benchmark_rows(size, min(symbols, size))
+        for name in paths:
+            result = benchmark_path(name, user, page_size)
+            results.append(result)
+            report(format_result(result))
+    clear_OHLC_data()
+    return {
+        'created': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'django': django.get_version(),
+        },
+        'results': results,
+    }
+
+
+def format_result(result: dict):
+    """One line summary of a benchmark result"""
+    return (f'{result["path"]:>10} {result["rows"]:>9} rows '
+            f'{result["rows_per_second"]:>10.0f} rows/s '
+            f'{result["bytes"] / 2 ** 20:.1f}MiB')
+
+
+def speedups(report: dict, baseline: str = 'serializer'):
+    """Rows per second of every path over the baseline path on the same
+    rows.
+    @returns:
+        - list of tuples (path, rows, ratio).
+    """
+    baselines = {r['rows']: r['rows_per_second'] for r in report['results']
+                 if r['path'] == baseline}
+    return [(r['path'], r['rows'],
+             r['rows_per_second'] / baselines[r['rows']])
+            for r in report['results']
+            if r['path'] != baseline and baselines.get(r['rows'])]
@@ -0,0 +1,199 @@
+"""
+Columnar store of Kraken candles on memory mapped files, a secondary copy
+of KrakenCandle for analytics and command line reads. Every symbol and
+interval has a directory with one raw array file per column, candles sorted
+by time, and an index file with the amount of rows written. Reads are slices
+of the memory mapped columns, no row is copied nor turned into an object.
+
+Candles are only appended, a batch overlapping stored candles, i.e the
+last candle of a previous load which might have still been open, rewrites
+the stored candles from its first time onwards in place, files never
+shrink so readers holding a mapping never read past the end of a file.
+The data loader keeps the store in sync when settings.CANDLE_STORE_DIR is
+set, see data_loader.bulk_loader.bulk_save_candle_columns.
+"""
+import fcntl
+import json
+import logging
+import os
+from collections import namedtuple
+from pathlib import Path
+import numpy as np
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from crypto_data.models import KrakenCandle
+from crypto_data.symbol_registry import symbol_registry
+
+
+# column name and type, time in unix seconds
+CANDLE_COLUMNS = (('time', np.int64), ('open', np.float64),
+                  ('high', np.float64), ('low', np.float64),
+                  ('close', np.float64), ('vwap', np.float64),
+                  ('volume', np.float64), ('count', np.int64))
+StoredCandles = namedtuple('StoredCandles',
+                           [name for name, _ in CANDLE_COLUMNS])
+INDEX_FILE = 'index.json'
+LOCK_FILE = '.lock'
+# candles read at once from the database by export_candles
+EXPORT_CHUNK_SIZE = 100000
+
+logger = logging.getLogger(__name__)
+
+
+def empty_candles():
+    return StoredCandles(*(np.empty(0, dtype) for _, dtype in CANDLE_COLUMNS))
+
+
+def unique_sorted(candles: StoredCandles):
+    """Sort candles by time keeping the first of candles with the same time"""
+    _, first = np.unique(candles.time, return_index=True)
+    return StoredCandles(*(np.asarray(c)[first] for c in candles))
+
+
+class CandleStore:
+    """Store of candle columns under a root directory.
+    Methods:
+        - read: columns of the candles of a symbol and interval in a time
+        range, as memory mapped arrays.
+        - append: write candles of a symbol and interval.
+        - rows: amount of stored candles of a symbol and interval.
+        - clear: remove the candles of a symbol and interval.
+    """
+    def __init__(self, root):
+        self._root = Path(root)
+
+    @property
+    def root(self):
+        return self._root
+
+    def directory(self, symbol: str, interval: int):
+        return self._root / symbol / str(interval)
+
+    def rows(self, symbol: str, interval: int):
+        try:
+            with open(self.directory(symbol, interval) / INDEX_FILE) as f:
+                return json.load(f)['rows']
+        except FileNotFoundError:
+            return 0
+
+    def _write_rows(self, directory: Path, rows: int):
+        """Replace the index at once so readers see the old or new amount"""
+        temporary = directory / f'{INDEX_FILE}.tmp'
+        with open(temporary, 'w') as f:
+            json.dump({'rows': rows,
+                       'columns': {name: np.dtype(dtype).str
+                                   for name, dtype in CANDLE_COLUMNS}}, f)
+        os.replace(temporary, directory / INDEX_FILE)
+
+    def _columns(self, directory: Path, rows: int):
+        if not rows:
+            return empty_candles()
+        return StoredCandles(*(np.memmap(directory / name, dtype=dtype,
+                                         mode='r', shape=(rows,))
+                               for name, dtype in CANDLE_COLUMNS))
+
+    def read(self, symbol: str, interval: int, start: int = None,
+             end: int = None):
+        """Candles of a symbol and interval from time start up to time end,
+        not included, found by binary search on the time column.
+        @args:
+            - start, end: unix seconds, the first or last candle if None.
+        @returns:
+            - StoredCandles of read only arrays sharing memory with the
+            files.
+        """
+        directory = self.directory(symbol, interval)
+        columns = self._columns(directory, self.rows(symbol, interval))
+        first = (0 if start is None
+                 else int(np.searchsorted(columns.time, start)))
+        last = (len(columns.time) if end is None
+                else int(np.searchsorted(columns.time, end)))
+        return StoredCandles(*(c[first:last] for c in columns))
+
+    def append(self, symbol: str, interval: int, candles: StoredCandles):
+        """Write candles, candles already stored with the same time are
+        replaced. Writers of the same symbol and interval wait for each
+        other.
+        @returns:
+            - amount of candles stored.
+        """
+        # the last of candles with the same time wins as on the database
+        candles = unique_sorted(StoredCandles(*(np.asarray(c)[::-1]
+                                                for c in candles)))
+        if not len(candles.time):
+            return self.rows(symbol, interval)
+        directory = self.directory(symbol, interval)
+        directory.mkdir(parents=True, exist_ok=True)
+        with open(directory / LOCK_FILE, 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            rows = self.rows(symbol, interval)
+            stored = self._columns(directory, rows)
+            position = int(np.searchsorted(stored.time, candles.time[0]))
+            if position < rows:
+                # new candles go first so they win over the stored ones
+                candles = unique_sorted(StoredCandles(*(
+                    np.concatenate([new, old[position:]])
+                    for new, old in zip(candles, stored))))
+            del stored
+            for (name, dtype), column in zip(CANDLE_COLUMNS, candles):
+                path = directory / name
+                with open(path, 'r+b' if path.exists() else 'wb') as f:
+                    f.seek(position * np.dtype(dtype).itemsize)
+                    f.write(np.ascontiguousarray(column, dtype).tobytes())
+            rows = position + len(candles.time)
+            self._write_rows(directory, rows)
+        logger.debug(f'Stored {len(candles.time)} candles of {symbol} at '
+                     f'{interval} minutes from row {position}')
+        return rows
+
+    def clear(self, symbol: str, interval: int):
+        directory = self.directory(symbol, interval)
+        if directory.exists():
+            for path in directory.iterdir():
+                path.unlink()
+            directory.rmdir()
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({str(self._root)!r})'
+
+
+def get_candle_store():
+    """CandleStore on settings.CANDLE_STORE_DIR, None if not set"""
+    if not settings.CANDLE_STORE_DIR:
+        return None
+    return CandleStore(settings.CANDLE_STORE_DIR)
+
+
+def export_candles(store: CandleStore, symbol: str, interval: int,
+                   using: str = DEFAULT_DB_ALIAS):
+    """Copy the candles of a symbol and interval saved on the database into
+    the store, i.e to fill the store when it is set up after data was
+    loaded. Candles previously on the store are removed.
+    @returns:
+        - amount of candles stored.
+    """
+    store.clear(symbol, interval)
+    rows = (KrakenCandle.objects.using(using)
+            .filter(symbol_id=symbol_registry.id_of(symbol),
+                    interval=interval)
+            .order_by('ts')
+            .values_list('ts', *(n for n, _ in CANDLE_COLUMNS[1:]))
+            .iterator(chunk_size=EXPORT_CHUNK_SIZE))
+    stored = 0
+    chunk = []
+    for row in rows:
+        chunk.append((int(row[0].timestamp()), *row[1:]))
+        if len(chunk) == EXPORT_CHUNK_SIZE:
+            stored = store.append(symbol, interval, rows_to_candles(chunk))
+            chunk = []
+    if chunk:
+        stored = store.append(symbol, interval, rows_to_candles(chunk))
+    logger.info(f'Exported {stored} candles of {symbol} at {interval} '
+                f'minutes to {store}')
+    return stored
+
+
+def rows_to_candles(rows: list):
+    return StoredCandles(*(np.array(column, dtype=dtype)
+                           for column, (_, dtype) in zip(zip(*rows),
+                                                         CANDLE_COLUMNS)))
@@ -1,23 +1,91 @@
 """Define Filters to be used on generic views"""
+from django import forms
 from django_filters import rest_framework as filters
-from django_filters import NumberFilter
-from .models import KrakenOHLC
+from django_filters import NumberFilter, DateFilter, ModelChoiceFilter
+from rest_framework.filters import SearchFilter
+from .models import KrakenOHLC, KrakenOHLCRollup, KrakenSymbols
+from .symbol_registry import symbol_registry
+
+
+class RegisteredSymbolChoiceField(forms.ModelChoiceField):
+    """ModelChoiceField of a KrakenSymbols id resolved through
+    crypto_data.symbol_registry instead of querying it"""
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        try:
+            symbol = symbol_registry.instance(int(value))
+        except (TypeError, ValueError):
+            symbol = None
+        if symbol is None:
+            raise forms.ValidationError(self.error_messages['invalid_choice'],
+                                        code='invalid_choice')
+        return symbol
+
+
+class SymbolFilter(ModelChoiceFilter):
+    """Filter rows by the id of their KrakenSymbols"""
+    field_class = RegisteredSymbolChoiceField
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('queryset', KrakenSymbols.objects.all())
+        super().__init__(*args, **kwargs)
+
+
+class SymbolSearchFilter(SearchFilter):
+    """SearchFilter of the rows whose symbol starts with every search term,
+    as search_fields ('^symbol__symbol', ) would, the symbols are matched on
+    crypto_data.symbol_registry and the rows filtered by their ids instead
+    of joining KrakenSymbols"""
+
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        if not terms:
+            return queryset
+        return queryset.filter(
+            symbol_id__in=symbol_registry.ids_starting_with(terms))
 
 
 class KrakenOHLCFilter(filters.FilterSet):
     """Filter for model KrakenOHLC
+    - symbol: id of the symbol.
     - min_open: Minimum value for open, return any value above min_open
     - min_low: minimum value for low, return any value above min_low.
     - max_high: maximum value for high, return any value below.
     - max_close: maximum value for close, return any value below.
+    - start_date: first date returned, included.
+    - end_date: last date returned, included.
+    The table is partitioned by month of date, filtering by date only scans
+    the partitions of the requested months.
     """
     min_open = NumberFilter(field_name='open', lookup_expr='gte')
     min_low = NumberFilter(field_name='low', lookup_expr='gte')
     max_high = NumberFilter(field_name='high', lookup_expr='lte')
     max_close = NumberFilter(field_name='close', lookup_expr='lte')
+    symbol = SymbolFilter()
+    start_date = DateFilter(field_name='date', lookup_expr='gte')
+    end_date = DateFilter(field_name='date', lookup_expr='lte')
 
     class Meta:
         model = KrakenOHLC
         fields = (
             'symbol',
         )
+
+
+class KrakenOHLCRollupFilter(filters.FilterSet):
+    """Filter for model KrakenOHLCRollup
+    - symbol: id of the symbol.
+    - start_date: return periods starting on or after start_date.
+    - end_date: return periods starting on or before end_date.
+    """
+    symbol = SymbolFilter()
+    start_date = DateFilter(field_name='start', lookup_expr='gte')
+    end_date = DateFilter(field_name='start', lookup_expr='lte')
+
+    class Meta:
+        model = KrakenOHLCRollup
+        fields = (
+            'symbol',
+        )
@@ -1,8 +1,13 @@
 """Define pagination"""
-from rest_framework.pagination import PageNumberPagination
+from django.core.exceptions import ValidationError
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import (PageNumberPagination, CursorPagination,
+                                       Cursor)
 PAGE_SIZE_OHLC = 10
 PAGE_SIZE_SYMBOL = 6
 MAX_PAGE_SIZE = 20
+# staff users can request bigger pages, i.e to export data
+TRUSTED_MAX_PAGE_SIZE = 1000
 
 
 class KrakenSymbolsPagination(PageNumberPagination):
@@ -17,3 +22,115 @@ class KrakenOHLCPagination(PageNumberPagination):
     page_size = PAGE_SIZE_OHLC
     max_page_size = MAX_PAGE_SIZE
     page_size_query_param = 'page_size'
+
+
+class KeysetPagination(CursorPagination):
+    """Keyset pagination, pages are read from the position of the last
+    item of the previous page with a row comparison on the ordering, i.e
+    WHERE (symbol_id, date, id) > (1, '2021-10-01', 25), served by an index
+    on the ordering so every page costs the same no matter how deep it is.
+    No count query is run, responses link to the next and previous pages
+    with opaque cursors. Rows can come from an object with a keyset_page
+    method instead of a queryset, see crypto_data.ohlc_cache.
+    Properties:
+        - ordering: model fields the rows are ordered by, together unique.
+        - max_page_size: biggest page_size anyone can request.
+        - trusted_max_page_size: biggest page_size staff users can request.
+    """
+    ordering = ('id', )
+    page_size_query_param = 'page_size'
+    max_page_size = MAX_PAGE_SIZE
+    trusted_max_page_size = TRUSTED_MAX_PAGE_SIZE
+    position_separator = '|'
+
+    def get_ordering(self, request, queryset, view):
+        return self.ordering
+
+    def get_page_size(self, request):
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_staff:
+            self.max_page_size = self.trusted_max_page_size
+        return super().get_page_size(request)
+
+    def get_position(self, instance):
+        return self.position_separator.join(
+            str(getattr(instance, field)) for field in self.ordering)
+
+    def parse_position(self, model, position: str):
+        """values of the ordering fields on a cursor position"""
+        values = position.split(self.position_separator)
+        if len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        try:
+            return [model._meta.get_field(field).to_python(value)
+                    for field, value in zip(self.ordering, values)]
+        except ValidationError:
+            raise NotFound(self.invalid_cursor_message)
+
+    def keyset_filter(self, queryset, position: str, reverse: bool):
+        """rows after position, or before it on reverse"""
+        table = queryset.model._meta.db_table
+        columns = ', '.join(
+            f'"{table}"."{queryset.model._meta.get_field(field).column}"'
+            for field in self.ordering)
+        placeholders = ', '.join(['%s'] * len(self.ordering))
+        operator = '<' if reverse else '>'
+        return queryset.extra(
+            where=[f'({columns}) {operator} ({placeholders})'],
+            params=self.parse_position(queryset.model, position))
+
+    def read_page(self, queryset, position: str, reverse: bool):
+        """page_size + 1 rows after position, or before it in descending
+        order on reverse"""
+        if hasattr(queryset, 'keyset_page'):
+            values = (self.parse_position(queryset.model, position)
+                      if position is not None else None)
+            return queryset.keyset_page(values, reverse, self.page_size + 1)
+        ordering = [f'-{f}' if reverse else f for f in self.ordering]
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = self.keyset_filter(queryset, position, reverse)
+        return list(queryset[:self.page_size + 1])
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+        self.cursor = self.decode_cursor(request)
+        reverse = self.cursor is not None and self.cursor.reverse
+        position = self.cursor.position if self.cursor is not None else None
+        results = self.read_page(queryset, position, reverse)
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        if reverse:
+            self.page.reverse()
+        # going back there are always rows after the page, the ones of the
+        # page the cursor came from
+        self.has_next = reverse or has_more
+        self.has_previous = has_more if reverse else position is not None
+        if self.page:
+            self.previous_position = self.get_position(self.page[0])
+            self.next_position = self.get_position(self.page[-1])
+        else:
+            self.previous_position = self.next_position = position
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.encode_cursor(Cursor(offset=0, reverse=False,
+                                         position=self.next_position))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        return self.encode_cursor(Cursor(offset=0, reverse=True,
+                                         position=self.previous_position))
+
+
+class KrakenOHLCKeysetPagination(KeysetPagination):
+    """Keyset pagination for views returning KrakenOHLC, in the order of the
+    (symbol, date) index"""
+    page_size = PAGE_SIZE_OHLC
+    ordering = ('symbol_id', 'date', 'id')
@@ -0,0 +1,88 @@
+"""
+Export KrakenOHLC querysets of any size as CSV or NDJSON. Rows are read
+from a named, server side, cursor chunk_size rows at a time inside a
+transaction so PostgreSQL sends them as the query produces them, neither
+the database nor python ever hold the whole result. Outside a transaction
+Django declares the cursor WITH HOLD and PostgreSQL would materialize the
+result before the first row is read. Symbols are resolved through
+crypto_data.symbol_registry instead of joining KrakenSymbols.
+"""
+import csv
+import io
+import json
+import logging
+from django.db import transaction
+from crypto_data.custom_fields import (fixed_point_to_string,
+                                       raw_fixed_point)
+from crypto_data.symbol_registry import symbol_registry
+
+
+# columns of the exported rows, prices formatted as KrakenOHLCSerializer
+EXPORT_FIELDS = ('symbol', 'date', 'open', 'high', 'low', 'close')
+EXPORT_CHUNK_SIZE = 5000
+
+logger = logging.getLogger(__name__)
+
+
+def export_rows(queryset, chunk_size: int = EXPORT_CHUNK_SIZE):
+    """Yield tuples of strings with EXPORT_FIELDS of the KrakenOHLC of
+    queryset, in its order.
+    @args:
+        - queryset: KrakenOHLC queryset, read on the database it is bound
+        to.
+        - chunk_size: rows fetched from the cursor at a time.
+    """
+    rows = (queryset
+            .annotate(**{f'raw_{name}': raw_fixed_point(name)
+                         for name in EXPORT_FIELDS[2:]})
+            .values_list('symbol_id', 'date',
+                         *(f'raw_{name}' for name in EXPORT_FIELDS[2:])))
+    symbol_of = symbol_registry.symbol_of
+    exported = 0
+    with transaction.atomic(using=rows.db):
+        for symbol_id, date, *prices in rows.iterator(chunk_size=chunk_size):
+            exported += 1
+            yield (symbol_of(symbol_id), date.isoformat(),
+                   *(fixed_point_to_string(p) for p in prices))
+    logger.debug(f'Exported {exported} KrakenOHLC rows')
+
+
+def chunks(rows, chunk_size: int):
+    """lists of up to chunk_size consecutive rows"""
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def csv_lines(rows, chunk_size: int = EXPORT_CHUNK_SIZE):
+    """CSV with a header line, chunk_size rows per yielded string"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_FIELDS)
+    for chunk in chunks(rows, chunk_size):
+        writer.writerows(chunk)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        # header of an empty export
+        yield buffer.getvalue()
+
+
+def ndjson_lines(rows, chunk_size: int = EXPORT_CHUNK_SIZE):
+    """A JSON object per line, chunk_size rows per yielded string"""
+    for chunk in chunks(rows, chunk_size):
+        yield ''.join(f'{json.dumps(dict(zip(EXPORT_FIELDS, row)))}\n'
+                      for row in chunk)
+
+
+# content type and encoder of every export output
+EXPORT_OUTPUTS = {
+    'csv': ('text/csv', csv_lines),
+    'ndjson': ('application/x-ndjson', ndjson_lines),
+}
@@ -0,0 +1,34 @@
+"""
+Read your writes on top of the read replicas, see crypto_data.routers. After
+a client writes, a cookie keeps its reads on the primary until replicas have
+caught up, clients not keeping cookies send the X-Read-Primary header.
+"""
+from django.conf import settings
+
+
+READ_PRIMARY_COOKIE = 'read_primary'
+READ_PRIMARY_HEADER = 'HTTP_X_READ_PRIMARY'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def reads_primary(request):
+    """True when the request must read from the primary"""
+    return (READ_PRIMARY_COOKIE in request.COOKIES
+            or READ_PRIMARY_HEADER in request.META)
+
+
+class ReadYourWritesMiddleware:
+    """Set the read primary cookie on responses to successful writes"""
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            response.set_cookie(READ_PRIMARY_COOKIE, '1',
+                                max_age=settings.READ_PRIMARY_AFTER_WRITE,
+                                samesite='Lax')
+        return response
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}()'
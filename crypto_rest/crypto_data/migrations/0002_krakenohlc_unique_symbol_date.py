@@ -0,0 +1,29 @@
+# Generated by Django 3.2.8 on 2026-10-18 20:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crypto_data', '0001_initial'),
+    ]
+
+    operations = [
+        # earlier loads could save the same candle more than once, keep the
+        # latest saved row for every symbol and date.
+        migrations.RunSQL(
+            sql="""
+                DELETE FROM crypto_data_krakenohlc duplicated
+                USING crypto_data_krakenohlc kept
+                WHERE duplicated.symbol_id = kept.symbol_id
+                AND duplicated.date = kept.date
+                AND duplicated.id < kept.id
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.AddConstraint(
+            model_name='krakenohlc',
+            constraint=models.UniqueConstraint(fields=('symbol', 'date'), name='unique_krakenohlc_symbol_date'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 3.2.8 on 2026-10-18 20:02
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crypto_data', '0002_krakenohlc_unique_symbol_date'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='KrakenBackfillCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('interval', models.PositiveIntegerField()),
+                ('start', models.BigIntegerField()),
+                ('since', models.BigIntegerField()),
+                ('completed', models.BooleanField(default=False)),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('symbol', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='backfill_checkpoints', to='crypto_data.krakensymbols')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='krakenbackfillcheckpoint',
+            constraint=models.UniqueConstraint(fields=('symbol', 'interval'), name='unique_backfill_symbol_interval'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 3.2.8 on 2026-10-18 20:45
+
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crypto_data', '0003_krakenbackfillcheckpoint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='KrakenCandle',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('interval', models.PositiveSmallIntegerField(choices=[(1, '1 minute'), (5, '5 minutes'), (15, '15 minutes'), (30, '30 minutes'), (60, '1 hour'), (240, '4 hours'), (1440, '1 day'), (10080, '1 week'), (21600, '15 days')])),
+                ('ts', models.DateTimeField()),
+                ('open', models.DecimalField(decimal_places=8, max_digits=18)),
+                ('high', models.DecimalField(decimal_places=8, max_digits=18)),
+                ('low', models.DecimalField(decimal_places=8, max_digits=18)),
+                ('close', models.DecimalField(decimal_places=8, max_digits=18)),
+                ('vwap', models.DecimalField(decimal_places=8, max_digits=18)),
+                ('volume', models.DecimalField(decimal_places=8, max_digits=28)),
+                ('count', models.PositiveIntegerField()),
+                ('symbol', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='candles', to='crypto_data.krakensymbols')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='krakencandle',
+            index=django.contrib.postgres.indexes.BrinIndex(fields=['ts'], name='candle_ts_brin'),
+        ),
+        migrations.AddConstraint(
+            model_name='krakencandle',
+            constraint=models.UniqueConstraint(fields=('symbol', 'interval', 'ts'), name='unique_candle_symbol_interval_ts'),
+        ),
+    ]
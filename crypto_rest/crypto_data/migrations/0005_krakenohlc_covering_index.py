@@ -0,0 +1,32 @@
+# Generated by Django 3.2.8 on 2026-10-18 20:47
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crypto_data', '0004_krakencandle'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='krakenohlc',
+            options={'ordering': ['symbol', 'date']},
+        ),
+        migrations.RemoveConstraint(
+            model_name='krakenohlc',
+            name='unique_krakenohlc_symbol_date',
+        ),
+        migrations.AddConstraint(
+            model_name='krakenohlc',
+            constraint=models.UniqueConstraint(fields=('symbol', 'date'), include=('id', 'open', 'high', 'low', 'close'), name='unique_krakenohlc_symbol_date'),
+        ),
+        # drop the foreign key index once the covering index is in place
+        migrations.AlterField(
+            model_name='krakenohlc',
+            name='symbol',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='related_OHLC', to='crypto_data.krakensymbols'),
+        ),
+    ]
@@ -0,0 +1,143 @@
+"""Rebuild the OHLC and candle tables as tables partitioned by range of time,
+KrakenOHLC by month of date and KrakenCandle by day of ts. The model state
+is unchanged, the primary keys are widened with the partition column as
+Postgres requires every unique index of a partitioned table to include it.
+Saved rows are copied into the partitions covering them. The partitions
+are created with frozen SQL, names and bounds as crypto_data.partitions
+gave them when this migration was written, so later changes to that
+module do not change what this migration does."""
+from django.db import migrations
+
+
+OHLC_TABLE = 'crypto_data_krakenohlc'
+CANDLE_TABLE = 'crypto_data_krakencandle'
+FOREIGN_KEY = ('CONSTRAINT {table}_symbol_id_fk '
+               'REFERENCES crypto_data_krakensymbols (id) '
+               'DEFERRABLE INITIALLY DEFERRED')
+
+OHLC_COLUMNS = f'''
+    id bigint NOT NULL DEFAULT nextval('{OHLC_TABLE}_id_seq'),
+    open numeric(11, 2) NOT NULL,
+    high numeric(11, 2) NOT NULL,
+    low numeric(11, 2) NOT NULL,
+    close numeric(11, 2) NOT NULL,
+    date date NOT NULL,
+    symbol_id bigint NOT NULL {FOREIGN_KEY.format(table=OHLC_TABLE)}'''
+OHLC_INDEXES = [
+    f'CREATE UNIQUE INDEX unique_krakenohlc_symbol_date ON {OHLC_TABLE} '
+    f'(symbol_id, date) INCLUDE (id, open, high, low, close)',
+]
+
+CANDLE_COLUMNS = f'''
+    id bigint NOT NULL DEFAULT nextval('{CANDLE_TABLE}_id_seq'),
+    "interval" smallint NOT NULL
+        CONSTRAINT {CANDLE_TABLE}_interval_check CHECK ("interval" >= 0),
+    ts timestamp with time zone NOT NULL,
+    open numeric(18, 8) NOT NULL,
+    high numeric(18, 8) NOT NULL,
+    low numeric(18, 8) NOT NULL,
+    close numeric(18, 8) NOT NULL,
+    vwap numeric(18, 8) NOT NULL,
+    volume numeric(28, 8) NOT NULL,
+    count integer NOT NULL
+        CONSTRAINT {CANDLE_TABLE}_count_check CHECK (count >= 0),
+    symbol_id bigint NOT NULL {FOREIGN_KEY.format(table=CANDLE_TABLE)}'''
+CANDLE_INDEXES = [
+    f'ALTER TABLE {CANDLE_TABLE} ADD CONSTRAINT '
+    f'unique_candle_symbol_interval_ts UNIQUE (symbol_id, "interval", ts)',
+    f'CREATE INDEX candle_ts_brin ON {CANDLE_TABLE} USING brin (ts)',
+]
+
+# partition column, period and partition name suffix of every table, the
+# bounds of timestamps are at midnight UTC
+PARTITIONS = {
+    OHLC_TABLE: ('date', 'date', 'month', 'YYYY_MM'),
+    CANDLE_TABLE: ("ts AT TIME ZONE 'UTC'", "timestamp AT TIME ZONE 'UTC'",
+                   'day', 'YYYY_MM_DD'),
+}
+# a partition for every period holding rows of the old table
+CREATE_PARTITIONS = '''
+DO $$
+DECLARE
+    period_start timestamp;
+BEGIN
+    FOR period_start IN
+        SELECT DISTINCT date_trunc('{period}', {column}) FROM {old_table}
+    LOOP
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF {table} FOR VALUES FROM (%L) TO (%L)',
+            '{table}_p' || to_char(period_start, '{suffix}'),
+            period_start::{bound},
+            (period_start + interval '1 {period}')::{bound});
+    END LOOP;
+END $$'''
+
+
+def table_columns(cursor, table: str):
+    cursor.execute('SELECT attname FROM pg_attribute '
+                   'WHERE attrelid = %s::regclass AND attnum > 0 '
+                   'AND NOT attisdropped ORDER BY attnum', [table])
+    return ', '.join(f'"{row[0]}"' for row in cursor.fetchall())
+
+
+def rebuild_table(schema_editor, table: str, create_table: str,
+                  indexes: list, partitioned: bool):
+    """Replace table with the one created by create_table keeping its rows,
+    id sequence and index names"""
+    old_table = f'{table}_old'
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f'ALTER TABLE {table} RENAME TO {old_table}')
+        # index names are unique per schema, free them for the new table
+        cursor.execute('SELECT indexname FROM pg_indexes '
+                       'WHERE tablename = %s', [old_table])
+        for (index,) in cursor.fetchall():
+            cursor.execute(f'ALTER INDEX {index} RENAME TO '
+                           f'{index[:59]}_old')
+        cursor.execute(create_table)
+        for index in indexes:
+            cursor.execute(index)
+        cursor.execute(f'ALTER SEQUENCE {table}_id_seq OWNED BY {table}.id')
+        if partitioned:
+            cursor.execute(f'CREATE TABLE {table}_default '
+                           f'PARTITION OF {table} DEFAULT')
+            column, bound, period, suffix = PARTITIONS[table]
+            cursor.execute(CREATE_PARTITIONS.format(
+                table=table, old_table=old_table, column=column,
+                bound=bound, period=period, suffix=suffix))
+        columns = table_columns(cursor, table)
+        cursor.execute(f'INSERT INTO {table} ({columns}) '
+                       f'SELECT {columns} FROM {old_table}')
+        cursor.execute(f'DROP TABLE {old_table} CASCADE')
+
+
+def partition_tables(apps, schema_editor):
+    rebuild_table(schema_editor, OHLC_TABLE,
+                  f'CREATE TABLE {OHLC_TABLE} ({OHLC_COLUMNS}, '
+                  f'PRIMARY KEY (id, date)) PARTITION BY RANGE (date)',
+                  OHLC_INDEXES, partitioned=True)
+    rebuild_table(schema_editor, CANDLE_TABLE,
+                  f'CREATE TABLE {CANDLE_TABLE} ({CANDLE_COLUMNS}, '
+                  f'PRIMARY KEY (id, ts)) PARTITION BY RANGE (ts)',
+                  CANDLE_INDEXES, partitioned=True)
+
+
+def unpartition_tables(apps, schema_editor):
+    rebuild_table(schema_editor, OHLC_TABLE,
+                  f'CREATE TABLE {OHLC_TABLE} ({OHLC_COLUMNS}, '
+                  f'PRIMARY KEY (id))',
+                  OHLC_INDEXES, partitioned=False)
+    rebuild_table(schema_editor, CANDLE_TABLE,
+                  f'CREATE TABLE {CANDLE_TABLE} ({CANDLE_COLUMNS}, '
+                  f'PRIMARY KEY (id))',
+                  CANDLE_INDEXES, partitioned=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crypto_data', '0005_krakenohlc_covering_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_tables, unpartition_tables),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 3.2.8 on 2026-10-18 20:56
+
+import crypto_data.custom_fields
+from django.db import migrations
+from django.db.migrations.exceptions import IrreversibleError
+
+
+PRICE_COLUMNS = ('open', 'high', 'low', 'close')
+SCALE = 10 ** 8
+
+# one statement so the table and its covering index are rewritten once,
+# saved prices are scaled exactly as numeric keeps them
+TO_FIXED_POINT = 'ALTER TABLE crypto_data_krakenohlc ' + ', '.join(
+    f'ALTER COLUMN {c} TYPE bigint USING ({c} * {SCALE})::bigint'
+    for c in PRICE_COLUMNS)
+# numeric(11, 2) only keeps cents below 1e9, see refuse_lossy_reverse
+TO_DECIMAL = 'ALTER TABLE crypto_data_krakenohlc ' + ', '.join(
+    f'ALTER COLUMN {c} TYPE numeric(11, 2) USING round({c} / {SCALE}.0, 2)'
+    for c in PRICE_COLUMNS)
+# prices the reverse would round or could not keep
+LOSSY_PRICES = ('SELECT count(*) FROM crypto_data_krakenohlc WHERE ' +
+                ' OR '.join(f'{c} % {SCALE // 100} <> 0 OR abs({c}) >= '
+                            f'{10 ** 9 * SCALE}' for c in PRICE_COLUMNS))
+
+
+def refuse_lossy_reverse(apps, schema_editor):
+    """Stop the reverse before it rounds sub-cent prices, i.e of ADA or
+    XRP, to cents or fails on prices of 1e9 or more"""
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(LOSSY_PRICES)
+        lossy = cursor.fetchone()[0]
+    if lossy:
+        raise IrreversibleError(
+            f'{lossy} OHLC rows have prices numeric(11, 2) can not keep, '
+            f'delete or round them before reversing this migration')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crypto_data', '0006_partition_candle_tables'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(TO_FIXED_POINT, TO_DECIMAL),
+                migrations.RunPython(migrations.RunPython.noop,
+                                     refuse_lossy_reverse),
+            ],
+            state_operations=[
+                migrations.AlterField(
+                    model_name='krakenohlc',
+                    name=name,
+                    field=crypto_data.custom_fields.FixedPointField(),
+                )
+                for name in PRICE_COLUMNS
+            ],
+        ),
+    ]
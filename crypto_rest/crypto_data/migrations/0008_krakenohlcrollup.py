@@ -0,0 +1,54 @@
+# Generated by Django 3.2.8 on 2026-10-18 21:00
+
+import crypto_data.custom_fields
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# rollups of the rows already saved, frozen as the columns were when the
+# table was created so later changes to crypto_data.rollups do not change
+# what this migration does
+BUILD_ROLLUPS = (
+    'INSERT INTO crypto_data_krakenohlcrollup '
+    '(symbol_id, period, start, open, high, low, close, days) '
+    'SELECT ohlc.symbol_id, periods.period, '
+    'date_trunc(periods.period, ohlc.date::timestamp)::date AS start, '
+    '(array_agg(ohlc.open ORDER BY ohlc.date))[1], '
+    'max(ohlc.high), min(ohlc.low), '
+    '(array_agg(ohlc.close ORDER BY ohlc.date DESC))[1], count(*) '
+    "FROM (VALUES ('week'), ('month'), ('year')) AS periods (period) "
+    'CROSS JOIN crypto_data_krakenohlc ohlc '
+    'GROUP BY ohlc.symbol_id, periods.period, start'
+)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crypto_data', '0007_krakenohlc_fixed_point_prices'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='KrakenOHLCRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('week', 'weekly'), ('month', 'monthly'), ('year', 'yearly')], max_length=5)),
+                ('start', models.DateField()),
+                ('open', crypto_data.custom_fields.FixedPointField()),
+                ('high', crypto_data.custom_fields.FixedPointField()),
+                ('low', crypto_data.custom_fields.FixedPointField()),
+                ('close', crypto_data.custom_fields.FixedPointField()),
+                ('days', models.PositiveSmallIntegerField()),
+                ('symbol', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='crypto_data.krakensymbols')),
+            ],
+            options={
+                'ordering': ['symbol', 'period', 'start'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='krakenohlcrollup',
+            constraint=models.UniqueConstraint(fields=('symbol', 'period', 'start'), name='unique_rollup_symbol_period_start'),
+        ),
+        migrations.RunSQL(BUILD_ROLLUPS, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 3.2.8 on 2026-10-18 23:10
+
+from django.db import migrations, models
+
+
+# rollups are built again so saved ones get their dates, frozen as the
+# columns are at this point, see 0008_krakenohlcrollup. Foreign keys of the
+# inserted rollups are checked right away as the table can not be altered
+# with checks pending.
+REBUILD_ROLLUPS = [
+    'DELETE FROM crypto_data_krakenohlcrollup',
+    'INSERT INTO crypto_data_krakenohlcrollup '
+    '(symbol_id, period, start, open, high, low, close, days, first_date, '
+    'last_date) '
+    'SELECT ohlc.symbol_id, periods.period, '
+    'date_trunc(periods.period, ohlc.date::timestamp)::date AS start, '
+    '(array_agg(ohlc.open ORDER BY ohlc.date))[1], '
+    'max(ohlc.high), min(ohlc.low), '
+    '(array_agg(ohlc.close ORDER BY ohlc.date DESC))[1], count(*), '
+    'min(ohlc.date), max(ohlc.date) '
+    "FROM (VALUES ('week'), ('month'), ('year')) AS periods (period) "
+    'CROSS JOIN crypto_data_krakenohlc ohlc '
+    'GROUP BY ohlc.symbol_id, periods.period, start',
+    'SET CONSTRAINTS ALL IMMEDIATE',
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crypto_data', '0008_krakenohlcrollup'),
+    ]
+
+    # saved rollups get their dates from being built again, the fields are
+    # required once they are
+    operations = [
+        migrations.AddField(
+            model_name='krakenohlcrollup',
+            name='first_date',
+            field=models.DateField(null=True),
+        ),
+        migrations.AddField(
+            model_name='krakenohlcrollup',
+            name='last_date',
+            field=models.DateField(null=True),
+        ),
+        migrations.RunSQL(REBUILD_ROLLUPS, migrations.RunSQL.noop),
+        migrations.AlterField(
+            model_name='krakenohlcrollup',
+            name='first_date',
+            field=models.DateField(),
+        ),
+        migrations.AlterField(
+            model_name='krakenohlcrollup',
+            name='last_date',
+            field=models.DateField(),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 3.2.8 on 2026-10-18 22:19
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crypto_data', '0009_krakenohlcrollup_first_last_date'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='KrakenOHLCVersion',
+            fields=[
+                ('symbol', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='ohlc_version', serialize=False, to='crypto_data.krakensymbols')),
+                ('version', models.BigIntegerField()),
+                ('modified', models.DateTimeField()),
+            ],
+        ),
+    ]
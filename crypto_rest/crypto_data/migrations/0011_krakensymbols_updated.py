@@ -0,0 +1,20 @@
+# Generated by Django 3.2.8 on 2026-10-18 23:05
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crypto_data', '0010_krakenohlcversion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='krakensymbols',
+            name='updated',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+    ]
@@ -0,0 +1,135 @@
+"""Rebuild the candle table listed by interval, into a table for every group
+of intervals partitioned by a period of ts suited to it: daily for 1 and 5
+minutes, monthly for 15 minutes to 4 hours and yearly for 1 day to 15 days.
+Candles of any other interval go to the default partition of the table. The
+model state is unchanged, the primary key on the database becomes
+(id, interval, ts). Saved candles are copied into the partitions covering
+them. Names and bounds are frozen as crypto_data.partitions gave them when
+this migration was written."""
+from django.db import migrations
+
+
+CANDLE_TABLE = 'crypto_data_krakencandle'
+OLD_TABLE = f'{CANDLE_TABLE}_old'
+
+# columns, defaults and checks are copied from the old table, the keys and
+# indexes are created again as they name the partition columns
+CREATE_TABLE = (f'CREATE TABLE {CANDLE_TABLE} (LIKE {OLD_TABLE} '
+                f'INCLUDING DEFAULTS INCLUDING CONSTRAINTS, '
+                f'PRIMARY KEY ({{primary_key}})) PARTITION BY {{partition}}')
+CANDLE_INDEXES = [
+    f'ALTER TABLE {CANDLE_TABLE} ADD CONSTRAINT {CANDLE_TABLE}_symbol_id_fk '
+    f'FOREIGN KEY (symbol_id) REFERENCES crypto_data_krakensymbols (id) '
+    f'DEFERRABLE INITIALLY DEFERRED',
+    f'ALTER TABLE {CANDLE_TABLE} ADD CONSTRAINT '
+    f'unique_candle_symbol_interval_ts UNIQUE (symbol_id, "interval", ts)',
+    f'CREATE INDEX candle_ts_brin ON {CANDLE_TABLE} USING brin (ts)',
+]
+
+# intervals, period and partition name suffix of every group, the bounds
+# are at midnight UTC
+INTERVAL_GROUPS = {
+    'minutes': ((1, 5), 'day', 'YYYY_MM_DD'),
+    'hours': ((15, 30, 60, 240), 'month', 'YYYY_MM'),
+    'days': ((1440, 10080, 21600), 'year', 'YYYY'),
+}
+DAILY_GROUP = (None, 'day', 'YYYY_MM_DD')
+
+# a partition of table for every period holding rows of the old table
+CREATE_PARTITIONS = '''
+DO $$
+DECLARE
+    period_start timestamp;
+BEGIN
+    FOR period_start IN
+        SELECT DISTINCT date_trunc('{period}', ts AT TIME ZONE 'UTC')
+        FROM {old_table} WHERE {condition}
+    LOOP
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF {table} FOR VALUES FROM (%L) TO (%L)',
+            '{table}_p' || to_char(period_start, '{suffix}'),
+            period_start AT TIME ZONE 'UTC',
+            (period_start + interval '1 {period}') AT TIME ZONE 'UTC');
+    END LOOP;
+END $$'''
+
+
+def create_partitions(cursor, table: str, group: tuple):
+    intervals, period, suffix = group
+    condition = (f'"interval" IN ({", ".join(map(str, intervals))})'
+                 if intervals else 'true')
+    cursor.execute(f'CREATE TABLE {table}_default PARTITION OF {table} '
+                   f'DEFAULT')
+    cursor.execute(CREATE_PARTITIONS.format(
+        table=table, old_table=OLD_TABLE, condition=condition,
+        period=period, suffix=suffix))
+
+
+def rebuild_table(schema_editor, create_table: str, partition):
+    """Replace the candle table with the one created by create_table and
+    partitioned by partition keeping its rows, id sequence and
+    index names"""
+    with schema_editor.connection.cursor() as cursor:
+        # names of tables and indexes are unique per schema, free the ones
+        # of the table, its indexes and partitions for the new table, names
+        # of the indexes of partitions are chosen free by Postgres
+        cursor.execute('SELECT inhrelid::regclass::text FROM pg_inherits '
+                       'WHERE inhparent = %s::regclass', [CANDLE_TABLE])
+        partitions = [row[0] for row in cursor.fetchall()]
+        cursor.execute('SELECT indexname FROM pg_indexes '
+                       'WHERE tablename = %s', [CANDLE_TABLE])
+        indexes = [row[0] for row in cursor.fetchall()]
+        cursor.execute(f'ALTER TABLE {CANDLE_TABLE} RENAME TO {OLD_TABLE}')
+        for name in partitions:
+            cursor.execute(f'ALTER TABLE {name} RENAME TO {name[:59]}_old')
+        for name in indexes:
+            cursor.execute(f'ALTER INDEX {name} RENAME TO {name[:59]}_old')
+        cursor.execute(create_table)
+        for index in CANDLE_INDEXES:
+            cursor.execute(index)
+        cursor.execute(f'ALTER SEQUENCE {CANDLE_TABLE}_id_seq '
+                       f'OWNED BY {CANDLE_TABLE}.id')
+        partition(cursor)
+        cursor.execute(f'INSERT INTO {CANDLE_TABLE} '
+                       f'SELECT * FROM {OLD_TABLE}')
+        cursor.execute(f'DROP TABLE {OLD_TABLE} CASCADE')
+
+
+def list_by_interval(cursor):
+    cursor.execute(f'CREATE TABLE {CANDLE_TABLE}_default '
+                   f'PARTITION OF {CANDLE_TABLE} DEFAULT')
+    for group, (intervals, period, suffix) in INTERVAL_GROUPS.items():
+        table = f'{CANDLE_TABLE}_{group}'
+        cursor.execute(f'CREATE TABLE {table} PARTITION OF {CANDLE_TABLE} '
+                       f'FOR VALUES IN ({", ".join(map(str, intervals))}) '
+                       f'PARTITION BY RANGE (ts)')
+        create_partitions(cursor, table, (intervals, period, suffix))
+
+
+def range_by_day(cursor):
+    create_partitions(cursor, CANDLE_TABLE, DAILY_GROUP)
+
+
+def partition_by_interval(apps, schema_editor):
+    rebuild_table(schema_editor,
+                  CREATE_TABLE.format(primary_key='id, "interval", ts',
+                                      partition='LIST ("interval")'),
+                  list_by_interval)
+
+
+def partition_by_day(apps, schema_editor):
+    rebuild_table(schema_editor,
+                  CREATE_TABLE.format(primary_key='id, ts',
+                                      partition='RANGE (ts)'),
+                  range_by_day)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crypto_data', '0011_krakensymbols_updated'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_by_interval, partition_by_day),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 3.2.8 on 2026-10-18 23:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crypto_data', '0012_partition_candles_by_interval'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='KrakenDeletions',
+            fields=[
+                ('name', models.CharField(max_length=40, primary_key=True, serialize=False)),
+                ('count', models.BigIntegerField()),
+                ('modified', models.DateTimeField()),
+            ],
+        ),
+    ]
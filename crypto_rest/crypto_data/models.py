@@ -1,7 +1,40 @@
 """
 Define models to store crypto data
 """
+from django.contrib.postgres.indexes import BrinIndex
 from django.db import models
+from django.db.models import OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from crypto_data.custom_fields import FixedPointField
+
+
+class KrakenSymbolsQuerySet(models.QuerySet):
+    """QuerySet of KrakenSymbols
+    Methods:
+        - with_ohlc_summary: annotate a summary of the OHLC of every symbol.
+    """
+
+    def with_ohlc_summary(self):
+        """Annotate every symbol with ohlc_count, first_ohlc_date,
+        last_ohlc_date and latest_close of its KrakenOHLC, dates and close
+        are None for symbols without rows. They are read from the yearly
+        KrakenOHLCRollup of the symbol, a few rows kept up to date as OHLC
+        rows are written, the partitioned OHLC table is not read so the cost
+        does not grow with the history of the symbols."""
+        yearly = KrakenOHLCRollup.objects.filter(symbol=OuterRef('pk'),
+                                                 period=KrakenOHLCRollup.YEAR)
+        days = (yearly.order_by()
+                .values('symbol')
+                .annotate(days=Sum('days'))
+                .values('days'))
+        last_year = yearly.order_by('-start')
+        return self.annotate(
+            ohlc_count=Coalesce(Subquery(days), 0,
+                                output_field=models.IntegerField()),
+            first_ohlc_date=Subquery(yearly.order_by('start')
+                                     .values('first_date')[:1]),
+            last_ohlc_date=Subquery(last_year.values('last_date')[:1]),
+            latest_close=Subquery(last_year.values('close')[:1]))
 
 
 class KrakenSymbols(models.Model):
@@ -27,6 +60,9 @@ class KrakenSymbols(models.Model):
                                 choices=CURRENCY_TYPES)
     symbol = models.CharField(max_length=13,
                               unique=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    objects = KrakenSymbolsQuerySet.as_manager()
 
     def __repr__(self):
         # change this to represent all the fields with their parameters like
@@ -48,23 +84,264 @@ class KrakenOHLC(models.Model):
     - Low: lowest price during that date.
     - Close: the price at which it close, this is 1 minute before midnight as
     crypto Trade 24/7.
+    The table is partitioned by month of date, see crypto_data.partitions,
+    its primary key on the database is (id, date).
+    Prices are stored as integers scaled to 8 decimal places, i.e 149.92 is
+    14992000000, see crypto_data.custom_fields, so sub-cent prices are kept.
+    Prices are Decimal on the model as they were, only readers reading the
+    scaled integers with raw_fixed_point skip building a Decimal per value.
+    Rows are not narrower than with numeric(11, 2) columns.
     """
-    open = models.DecimalField(max_digits=11,
-                               decimal_places=2)
-    high = models.DecimalField(max_digits=11,
-                               decimal_places=2)
-    low = models.DecimalField(max_digits=11,
-                              decimal_places=2)
-    close = models.DecimalField(max_digits=11,
-                                decimal_places=2)
+    open = FixedPointField()
+    high = FixedPointField()
+    low = FixedPointField()
+    close = FixedPointField()
+    # the (symbol, date) index below starts with the symbol, an index of
+    # its own for the foreign key would only slow down writes.
     symbol = models.ForeignKey('crypto_data.KrakenSymbols',
                                related_name='related_OHLC',
-                               on_delete=models.CASCADE)
+                               on_delete=models.CASCADE,
+                               db_index=False)
     date = models.DateField()
 
+    class Meta:
+        # a symbol has a single candle per date, this lets the loader upsert
+        # candles instead of duplicating them when data is loaded again.
+        # The index carries every other column so reads by symbol and date,
+        # with or without price filters, are answered from the index alone
+        # and come out in the default ordering without sorting.
+        constraints = [
+            models.UniqueConstraint(fields=['symbol', 'date'],
+                                    include=['id', 'open', 'high', 'low',
+                                             'close'],
+                                    name='unique_krakenohlc_symbol_date'),
+        ]
+        ordering = ['symbol', 'date']
+
+    @property
+    def symbol_name(self):
+        """symbol of the row, resolved through crypto_data.symbol_registry
+        unless the KrakenSymbols is already read, i.e str of the rows of a
+        page does not read the symbol of every row"""
+        if KrakenOHLC.symbol.is_cached(self) or self.symbol_id is None:
+            return self.symbol.symbol
+        # imported here, the registry reads KrakenSymbols
+        from crypto_data.symbol_registry import symbol_registry
+        return symbol_registry.symbol_of(self.symbol_id)
+
+    def __repr__(self):
+        class_name = self.__class__.__name__
+        return f'<{class_name} {self.symbol_name} {self.date}>'
+
+    def __str__(self):
+        return f'OHLC for {self.symbol_name} on {self.date}'
+
+
+class KrakenOHLCVersion(models.Model):
+    """
+    Version of the KrakenOHLC of a symbol, bumped in the same transaction
+    as every write of its rows so every process, i.e the web processes
+    serving rows written by the data loader, can tell whether what it read
+    before is still current, see crypto_data.ohlc_versions.
+    - version: amount of writes of the OHLC of the symbol.
+    - modified: time of the last write.
+    Symbols whose OHLC was never written have no version.
+    """
+    symbol = models.OneToOneField('crypto_data.KrakenSymbols',
+                                  related_name='ohlc_version',
+                                  on_delete=models.CASCADE,
+                                  primary_key=True)
+    version = models.BigIntegerField()
+    modified = models.DateTimeField()
+
+    def __repr__(self):
+        class_name = self.__class__.__name__
+        return f'<{class_name} {self.symbol_id} {self.version}>'
+
+    def __str__(self):
+        return f'Version {self.version} of the OHLC of {self.symbol_id}'
+
+
+class KrakenDeletions(models.Model):
+    """
+    Deletions of the data of a generation of responses, i.e the symbols,
+    see crypto_data.response_cache. Deleting a symbol deletes its
+    KrakenOHLCVersion too, so the last write of what is left can be older
+    than what clients were given, the deletions keep the last modified time
+    of the data from going back.
+    - name: generation the deleted data belongs to.
+    - count: amount of deletions.
+    - modified: time of the last deletion.
+    """
+    name = models.CharField(max_length=40, primary_key=True)
+    count = models.BigIntegerField()
+    modified = models.DateTimeField()
+
+    def __repr__(self):
+        class_name = self.__class__.__name__
+        return f'<{class_name} {self.name} {self.count}>'
+
+    def __str__(self):
+        return f'{self.count} deletions of {self.name}'
+
+
+class KrakenOHLCRollup(models.Model):
+    """
+    Open-High-Low-Close data for a kraken symbol over a week, month or year
+    starting at date start, aggregated from its KrakenOHLC rows.
+    - Open: open of the first date of the period.
+    - High: highest high of the period.
+    - Low: lowest low of the period.
+    - Close: close of the last date of the period.
+    - days: amount of daily rows aggregated, the current period and the
+    first one of a symbol are partial.
+    - first_date, last_date: dates of the first and last rows aggregated.
+    Rollups are refreshed by crypto_data.rollups whenever OHLC rows are
+    written, only the periods touched by the write are computed again.
+    """
+    WEEK = 'week'
+    MONTH = 'month'
+    YEAR = 'year'
+    # values are the date_trunc fields of each period
+    PERIODS = [
+        (WEEK, 'weekly'),
+        (MONTH, 'monthly'),
+        (YEAR, 'yearly'),
+    ]
+    symbol = models.ForeignKey('crypto_data.KrakenSymbols',
+                               related_name='rollups',
+                               on_delete=models.CASCADE,
+                               db_index=False)
+    period = models.CharField(max_length=5,
+                              choices=PERIODS)
+    start = models.DateField()
+    open = FixedPointField()
+    high = FixedPointField()
+    low = FixedPointField()
+    close = FixedPointField()
+    days = models.PositiveSmallIntegerField()
+    first_date = models.DateField()
+    last_date = models.DateField()
+
+    class Meta:
+        # also serves lookups by symbol, see KrakenOHLC
+        constraints = [
+            models.UniqueConstraint(fields=['symbol', 'period', 'start'],
+                                    name='unique_rollup_symbol_period_start'),
+        ]
+        ordering = ['symbol', 'period', 'start']
+
+    def __repr__(self):
+        class_name = self.__class__.__name__
+        return f'<{class_name} {self.symbol} {self.period} {self.start}>'
+
+    def __str__(self):
+        return f'{self.get_period_display()} OHLC for {self.symbol} from ' \
+               f'{self.start}'
+
+
+class KrakenCandle(models.Model):
+    """
+    Open-High-Low-Close data for a kraken symbol at any of the intervals
+    Kraken provides, from 1 minute to 15 days, opening at time ts.
+    - vwap: volume weighted average price during the interval.
+    - volume: volume traded during the interval.
+    - count: amount of trades during the interval.
+    Intraday intervals produce up to 1440 candles per symbol and day, the
+    table is meant to hold hundreds of millions of rows:
+    - the unique (symbol, interval, ts) index serves lookups and ranges of
+    a symbol, so the foreign key does not get an index of its own.
+    - a BRIN index on ts serves time ranges across symbols, candles are
+    mostly loaded in time order so it stays a few pages big.
+    The table is listed by interval into groups partitioned by day, month
+    or year of ts, see crypto_data.partitions, its primary key on the
+    database is (id, interval, ts).
+    """
+    ONE_MINUTE = 1
+    FIVE_MINUTES = 5
+    FIFTEEN_MINUTES = 15
+    THIRTY_MINUTES = 30
+    ONE_HOUR = 60
+    FOUR_HOURS = 240
+    ONE_DAY = 1440
+    ONE_WEEK = 10080
+    FIFTEEN_DAYS = 21600
+    INTERVALS = [
+        (ONE_MINUTE, '1 minute'),
+        (FIVE_MINUTES, '5 minutes'),
+        (FIFTEEN_MINUTES, '15 minutes'),
+        (THIRTY_MINUTES, '30 minutes'),
+        (ONE_HOUR, '1 hour'),
+        (FOUR_HOURS, '4 hours'),
+        (ONE_DAY, '1 day'),
+        (ONE_WEEK, '1 week'),
+        (FIFTEEN_DAYS, '15 days'),
+    ]
+    symbol = models.ForeignKey('crypto_data.KrakenSymbols',
+                               related_name='candles',
+                               on_delete=models.CASCADE,
+                               db_index=False)
+    interval = models.PositiveSmallIntegerField(choices=INTERVALS)
+    ts = models.DateTimeField()
+    open = models.DecimalField(max_digits=18,
+                               decimal_places=8)
+    high = models.DecimalField(max_digits=18,
+                               decimal_places=8)
+    low = models.DecimalField(max_digits=18,
+                              decimal_places=8)
+    close = models.DecimalField(max_digits=18,
+                                decimal_places=8)
+    vwap = models.DecimalField(max_digits=18,
+                               decimal_places=8)
+    volume = models.DecimalField(max_digits=28,
+                                 decimal_places=8)
+    count = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['symbol', 'interval', 'ts'],
+                                    name='unique_candle_symbol_interval_ts'),
+        ]
+        indexes = [
+            BrinIndex(fields=['ts'], name='candle_ts_brin'),
+        ]
+
+    def __repr__(self):
+        class_name = self.__class__.__name__
+        return f'<{class_name} {self.symbol} {self.interval} {self.ts}>'
+
+    def __str__(self):
+        return f'{self.interval} minutes candle for {self.symbol} at ' \
+               f'{self.ts}'
+
+
+class KrakenBackfillCheckpoint(models.Model):
+    """
+    Progress of a backfill of Kraken data for a symbol at an interval, the
+    backfill requests data page by page and after saving every page stores
+    the cursor for the next one so an interrupted backfill can resume.
+    - start: unix time the backfill started from.
+    - since: unix time cursor to request the next page.
+    - completed: the backfill reached the latest available data.
+    """
+    symbol = models.ForeignKey('crypto_data.KrakenSymbols',
+                               related_name='backfill_checkpoints',
+                               on_delete=models.CASCADE)
+    interval = models.PositiveIntegerField()
+    start = models.BigIntegerField()
+    since = models.BigIntegerField()
+    completed = models.BooleanField(default=False)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['symbol', 'interval'],
+                                    name='unique_backfill_symbol_interval'),
+        ]
+
     def __repr__(self):
         class_name = self.__class__.__name__
-        return f'<{class_name} {self.symbol} {self.date}>'
+        return f'<{class_name} {self.symbol} {self.interval} {self.since}>'
 
     def __str__(self):
-        return f'OHLC for {self.symbol} on {self.date}'
+        return f'Backfill of {self.symbol} every {self.interval} minutes'
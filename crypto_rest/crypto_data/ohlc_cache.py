@@ -0,0 +1,347 @@
+"""
+In process cache of the recent OHLC rows of the most requested symbols.
+Every cached symbol keeps the rows of the last settings.OHLC_CACHE_DAYS days
+as arrays, a few dozen bytes per row, symbols are evicted least recently
+used first once the cache is over settings.OHLC_CACHE_MAX_SIZE bytes.
+
+KrakenOHLCList requests for a single symbol and a date range inside the
+cached days are paged from memory, see KeysetPagination.paginate_queryset.
+Batches written by the data loader are appended to the cached symbol once
+committed, dropping the days that fall out of the window, rows written or
+deleted through the API drop the cached symbol. Writes of other processes
+are found through the OHLC version of the symbol, see
+crypto_data.ohlc_versions, checked when a symbol is served at most once
+every settings.OHLC_CACHE_REVALIDATE seconds, a symbol written since it was
+read is read again. Hits in between do not query the database, writes of
+this process invalidate the symbol through the signals right away. Cached
+symbols are read again after settings.OHLC_CACHE_TTL seconds anyway.
+"""
+import datetime
+import logging
+import threading
+import time
+from collections import OrderedDict, namedtuple
+import numpy as np
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from crypto_data.custom_fields import fixed_point_to_decimal, raw_fixed_point
+from crypto_data.models import KrakenOHLC, KrakenSymbols
+from crypto_data.ohlc_versions import ohlc_version
+
+
+CacheStats = namedtuple('CacheStats',
+                        'hits misses evictions symbols size max_size')
+# query parameters of KrakenOHLCList requests the cache can answer
+CACHED_QUERY_PARAMS = {'symbol', 'start_date', 'end_date', 'cursor',
+                       'page_size'}
+PRICE_FIELDS = ('open', 'high', 'low', 'close')
+EPOCH = datetime.date(1970, 1, 1)
+
+logger = logging.getLogger(__name__)
+
+
+def to_days(dates):
+    """days since epoch of a sequence of dates"""
+    return (np.array(dates, dtype='datetime64[D]')
+            .astype(np.int32, copy=False))
+
+
+class SymbolSeries:
+    """OHLC rows of a symbol from covered_from onwards as columns sorted by
+    date, dates are days since epoch and prices fixed point integers.
+    version is the OHLC version of the symbol read before the rows and
+    checked_at the time it was last found up to date.
+    Methods:
+        - slice: positions of the rows between two dates.
+        - append: add rows dated after covered_from, replacing rows of the
+        same dates, and drop the ones before it.
+    """
+    COLUMNS = ('ids', 'days', *PRICE_FIELDS)
+
+    def __init__(self, symbol: KrakenSymbols, covered_from: datetime.date,
+                 rows: list, version: int = 0):
+        """
+        @params:
+            - symbol: KrakenSymbols the rows belong to.
+            - covered_from: every row of the symbol dated on or after it is
+            on the series.
+            - rows: tuples (id, date, open, high, low, close) sorted by date.
+            - version: OHLC version of the symbol the rows are as new as.
+        """
+        self.symbol = symbol
+        self.covered_from = covered_from
+        self.version = version
+        self.loaded_at = self.checked_at = time.monotonic()
+        self._set_rows(rows)
+
+    def _set_rows(self, rows: list):
+        for column, values in self.columns_of(rows).items():
+            setattr(self, column, values)
+
+    @classmethod
+    def columns_of(cls, rows: list):
+        ids, dates, *prices = zip(*rows) if rows else ([],) * 6
+        return {'ids': np.array(ids, dtype=np.int64), 'days': to_days(dates),
+                **{field: np.array(values, dtype=np.int64)
+                   for field, values in zip(PRICE_FIELDS, prices)}}
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, c).nbytes for c in self.COLUMNS)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def slice(self, first: datetime.date = None,
+              last: datetime.date = None):
+        """start and stop positions of the rows dated from first to last,
+        both included"""
+        start = (0 if first is None
+                 else int(np.searchsorted(self.days, to_days([first])[0])))
+        stop = (len(self) if last is None
+                else int(np.searchsorted(self.days, to_days([last])[0],
+                                         side='right')))
+        return start, stop
+
+    def append(self, rows: list, covered_from: datetime.date,
+               version: int):
+        """Replace the rows dated on or after the first of rows"""
+        start, _ = self.slice(first=covered_from)
+        stop = self.slice(first=rows[0][1])[0] if rows else len(self)
+        for column, values in self.columns_of(rows).items():
+            setattr(self, column,
+                    np.concatenate([getattr(self, column)[start:stop],
+                                    values]))
+        self.covered_from = covered_from
+        self.version = version
+        self.checked_at = time.monotonic()
+
+    def row(self, position: int):
+        return (int(self.ids[position]),
+                EPOCH + datetime.timedelta(days=int(self.days[position])),
+                *(int(getattr(self, f)[position]) for f in PRICE_FIELDS))
+
+    def instance(self, position: int):
+        """KrakenOHLC of the row at position, without querying"""
+        row_id, date, *prices = self.row(position)
+        instance = KrakenOHLC(id=row_id, symbol=self.symbol, date=date,
+                              **{field: fixed_point_to_decimal(price)
+                                 for field, price in zip(PRICE_FIELDS,
+                                                         prices)})
+        instance._state.adding = False
+        return instance
+
+    def __repr__(self):
+        return (f'<{self.__class__.__name__} {self.symbol.symbol} '
+                f'{len(self)} rows from {self.covered_from}>')
+
+
+class CachedOHLCRange:
+    """Rows of a SymbolSeries between two dates, paged by KeysetPagination
+    instead of a queryset"""
+    model = KrakenOHLC
+
+    def __init__(self, series: SymbolSeries, first: datetime.date,
+                 last: datetime.date = None):
+        self.series = series
+        self.start, self.stop = series.slice(first, last)
+
+    def keyset_page(self, position, reverse: bool, limit: int):
+        """Up to limit rows after position in the (symbol_id, date, id)
+        order, before it on reverse and then in descending order.
+        @args:
+            - position: (symbol_id, date, id) values or None to start from
+            the first row, or the last on reverse.
+        """
+        start, stop = self.start, self.stop
+        if position is not None:
+            symbol_id, date, row_id = position
+            if symbol_id != self.series.symbol.id:
+                before = symbol_id < self.series.symbol.id
+                # every row is after the position or every row is before
+                start, stop = ((start, stop) if before != reverse
+                               else (start, start))
+            else:
+                at, _ = self.series.slice(first=date)
+                at = max(start, min(at, stop))
+                if at < stop and self.series.days[at] == to_days([date])[0]:
+                    # the row of the position date is before the position
+                    row_at = int(self.series.ids[at])
+                    if row_at < row_id or (row_at == row_id and not reverse):
+                        at += 1
+                start, stop = (start, at) if reverse else (at, stop)
+        positions = (range(stop - 1, max(start, stop - limit) - 1, -1)
+                     if reverse else range(start, min(stop, start + limit)))
+        return [self.series.instance(p) for p in positions]
+
+    def __repr__(self):
+        return (f'<{self.__class__.__name__} {self.series!r} '
+                f'[{self.start}:{self.stop}]>')
+
+
+class HotRangeCache:
+    """Least recently used SymbolSeries of up to a total size in bytes.
+    Methods:
+        - get: series of a symbol, read from the database on a miss.
+        - range: rows of a symbol between two dates if they are cached.
+        - extend: append rows written for a cached symbol.
+        - invalidate: drop a symbol, or every symbol.
+        - stats: hits, misses and evictions so far.
+    """
+    def __init__(self, max_size: int, days: int, ttl: float,
+                 revalidate: float = 0):
+        self.max_size = max_size
+        self.days = days
+        self.ttl = ttl
+        self.revalidate = revalidate
+        self._series = OrderedDict()
+        self._size = 0
+        self._hits = self._misses = self._evictions = 0
+        self._lock = threading.Lock()
+
+    def covered_from(self):
+        return (datetime.datetime.now(datetime.timezone.utc).date()
+                - datetime.timedelta(days=self.days))
+
+    def _read_rows(self, symbol_id: int, first: datetime.date, using: str):
+        return list(KrakenOHLC.objects.using(using)
+                    .filter(symbol_id=symbol_id, date__gte=first)
+                    .order_by('date')
+                    .annotate(**{f'raw_{f}': raw_fixed_point(f)
+                                 for f in PRICE_FIELDS})
+                    .values_list('id', 'date',
+                                 *(f'raw_{f}' for f in PRICE_FIELDS)))
+
+    def _store(self, symbol_id: int, series: SymbolSeries):
+        """Keep series as the most recent symbol, evicting the least recent
+        ones while over max_size, called holding the lock"""
+        self._drop(symbol_id)
+        self._series[symbol_id] = series
+        self._size += series.nbytes
+        while self._size > self.max_size and len(self._series) > 1:
+            evicted, evicted_series = self._series.popitem(last=False)
+            self._size -= evicted_series.nbytes
+            self._evictions += 1
+            logger.debug(f'Evicted OHLC of symbol {evicted} from the cache')
+
+    def _drop(self, symbol_id: int):
+        series = self._series.pop(symbol_id, None)
+        if series is not None:
+            self._size -= series.nbytes
+
+    def _hit(self, symbol_id: int, series: SymbolSeries):
+        """Whether series is still the cached one of the symbol, counting
+        the hit, called holding the lock"""
+        if self._series.get(symbol_id) is not series:
+            return False
+        self._series.move_to_end(symbol_id)
+        self._hits += 1
+        return True
+
+    def get(self, symbol_id: int, using: str = DEFAULT_DB_ALIAS):
+        """SymbolSeries of the symbol, None if there is no such symbol. A
+        cached symbol is read again once expired or if its OHLC version on
+        the database using is newer than the cached rows, a lagging replica
+        having an older version does not drop newer rows. The version is
+        not queried again within revalidate seconds of the last check."""
+        with self._lock:
+            series = self._series.get(symbol_id)
+            now = time.monotonic()
+            if series is not None and now - series.loaded_at >= self.ttl:
+                series = None
+            if (series is not None
+                    and now - series.checked_at < self.revalidate
+                    and self._hit(symbol_id, series)):
+                return series
+        version = ohlc_version(symbol_id, using)
+        with self._lock:
+            if (series is not None and version <= series.version
+                    and self._hit(symbol_id, series)):
+                series.checked_at = time.monotonic()
+                return series
+            self._misses += 1
+        symbol = KrakenSymbols.objects.using(using).filter(
+            id=symbol_id).first()
+        if symbol is None:
+            return None
+        covered_from = self.covered_from()
+        series = SymbolSeries(symbol, covered_from,
+                              self._read_rows(symbol_id, covered_from, using),
+                              version)
+        with self._lock:
+            self._store(symbol_id, series)
+        return series
+
+    def range(self, symbol_id: int, first: datetime.date,
+              last: datetime.date = None, using: str = DEFAULT_DB_ALIAS):
+        """CachedOHLCRange of the symbol from first to last, None if first
+        is before the cached days"""
+        if first < self.covered_from():
+            return None
+        series = self.get(symbol_id, using)
+        if series is None or first < series.covered_from:
+            return None
+        return CachedOHLCRange(series, first, last)
+
+    def extend(self, symbol_id: int, first: datetime.date,
+               using: str = DEFAULT_DB_ALIAS):
+        """Append the rows of a cached symbol dated on or after first, a
+        symbol is dropped instead if rows before its last cached day were
+        written as they might not be in order"""
+        with self._lock:
+            series = self._series.get(symbol_id)
+        if series is None:
+            return
+        if len(series) and series.days[-1] > to_days([first])[0]:
+            self.invalidate(symbol_id)
+            return
+        covered_from = self.covered_from()
+        version = ohlc_version(symbol_id, using)
+        rows = self._read_rows(symbol_id, max(first, covered_from), using)
+        with self._lock:
+            if self._series.get(symbol_id) is series:
+                self._drop(symbol_id)
+                series.append(rows, covered_from, version)
+                self._store(symbol_id, series)
+
+    def invalidate(self, symbol_id: int = None):
+        with self._lock:
+            if symbol_id is None:
+                self._series.clear()
+                self._size = 0
+            else:
+                self._drop(symbol_id)
+
+    def stats(self):
+        with self._lock:
+            return CacheStats(self._hits, self._misses, self._evictions,
+                              len(self._series), self._size, self.max_size)
+
+    def __repr__(self):
+        return (f'{self.__class__.__name__}(max_size={self.max_size}, '
+                f'days={self.days}, ttl={self.ttl}, '
+                f'revalidate={self.revalidate})')
+
+
+ohlc_cache = HotRangeCache(settings.OHLC_CACHE_MAX_SIZE,
+                           settings.OHLC_CACHE_DAYS,
+                           settings.OHLC_CACHE_TTL,
+                           settings.OHLC_CACHE_REVALIDATE)
+
+
+def cached_ohlc_range(query_params, using: str = DEFAULT_DB_ALIAS):
+    """CachedOHLCRange answering a KrakenOHLCList request, None if the
+    request has to go to the database: the cache is disabled, the request
+    has other parameters than a symbol, a date range and the page or the
+    range starts before the cached days. Values the filters would reject
+    are left to the database too so errors are the same."""
+    if not ohlc_cache.max_size or not set(query_params) <= CACHED_QUERY_PARAMS:
+        return None
+    try:
+        symbol_id = int(query_params['symbol'])
+        first = datetime.date.fromisoformat(query_params['start_date'])
+        last = (datetime.date.fromisoformat(query_params['end_date'])
+                if 'end_date' in query_params else None)
+    except (KeyError, ValueError):
+        return None
+    return ohlc_cache.range(symbol_id, first, last, using)
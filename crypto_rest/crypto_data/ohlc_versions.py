@@ -0,0 +1,46 @@
+"""
+Versions of the KrakenOHLC of every symbol kept on the database, see
+KrakenOHLCVersion. Writes bump the version of the symbols written in their
+own transaction, so the version read on any database together with rows
+is never older than the rows, and readers in other processes know when
+rows they keep in memory were written again, i.e responses given to
+clients were, see crypto_data.response_cache.
+"""
+import logging
+from django.db import connections, DEFAULT_DB_ALIAS
+from django.utils import timezone
+from crypto_data.models import KrakenOHLCVersion, KrakenSymbols
+
+
+logger = logging.getLogger(__name__)
+
+
+def bump_ohlc_versions(symbol_ids, using: str = DEFAULT_DB_ALIAS):
+    """Bump the version of the OHLC of every symbol, deleted symbols are
+    skipped. Concurrent writes of a symbol wait on its version until the
+    first one commits."""
+    symbol_ids = sorted(set(symbol_ids))
+    if not symbol_ids:
+        return
+    versions = KrakenOHLCVersion._meta.db_table
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {versions} (symbol_id, version, modified) '
+            f'SELECT id, 1, %s '
+            f'FROM {KrakenSymbols._meta.db_table} WHERE id = ANY(%s) '
+            f'ORDER BY id '
+            f'ON CONFLICT (symbol_id) DO UPDATE '
+            f'SET version = {versions}.version + 1, '
+            f'modified = EXCLUDED.modified',
+            [timezone.now(), symbol_ids])
+    logger.debug(f'Bumped OHLC versions of symbols {symbol_ids}')
+
+
+def ohlc_version(symbol_id: int, using: str = DEFAULT_DB_ALIAS):
+    """Version of the OHLC of a symbol on the database using, 0 when it was
+    never written"""
+    version = (KrakenOHLCVersion.objects.using(using)
+               .filter(symbol_id=symbol_id)
+               .values_list('version', flat=True)
+               .first())
+    return version or 0
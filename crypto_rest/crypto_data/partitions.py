@@ -0,0 +1,174 @@
+"""
+Range partitioning by time of the candle tables, KrakenOHLC is partitioned
+by month of its date. KrakenCandle is listed by interval first, into a
+table for every group of intervals, see CANDLE_INTERVAL_GROUPS, each of
+them partitioned by a period of ts suited to the amount of candles of its
+intervals, so intraday candles get daily partitions and a backfill of
+years of daily or weekly candles a few yearly ones. Every partitioned
+table has a default partition catching rows with no partition of their own,
+partitions are created ahead of ingestion with ensure_partitions which also
+moves any row already caught by the default partition.
+"""
+import datetime
+from collections import namedtuple
+from django.db import connections, transaction, DEFAULT_DB_ALIAS
+
+
+YEARLY = 'yearly'
+MONTHLY = 'monthly'
+DAILY = 'daily'
+
+PartitionScheme = namedtuple('PartitionScheme', 'table column period')
+
+OHLC_TABLE = 'crypto_data_krakenohlc'
+CANDLE_TABLE = 'crypto_data_krakencandle'
+# group of intervals in minutes, as KrakenCandle.INTERVALS, and period of
+# its partitions, candles of other intervals go to the default partition
+CANDLE_INTERVAL_GROUPS = {
+    'minutes': ((1, 5), DAILY),
+    'hours': ((15, 30, 60, 240), MONTHLY),
+    'days': ((1440, 10080, 21600), YEARLY),
+}
+
+PARTITION_SCHEMES = {
+    OHLC_TABLE: PartitionScheme(OHLC_TABLE, 'date', MONTHLY),
+    **{f'{CANDLE_TABLE}_{group}': PartitionScheme(f'{CANDLE_TABLE}_{group}',
+                                                  'ts', period)
+       for group, (_, period) in CANDLE_INTERVAL_GROUPS.items()},
+}
+
+
+def interval_group(interval: int):
+    """Group of CANDLE_INTERVAL_GROUPS of a candle interval, None if it
+    has none"""
+    for group, (intervals, _) in CANDLE_INTERVAL_GROUPS.items():
+        if interval in intervals:
+            return group
+    return None
+
+
+def get_partition_scheme(model, interval: int = None):
+    """Partition scheme of a model or table name, the scheme of candles is
+    the one of the group of their interval, None if it has none"""
+    table = model if isinstance(model, str) else model._meta.db_table
+    if table == CANDLE_TABLE:
+        group = interval_group(interval)
+        if group is None:
+            return None
+        table = f'{table}_{group}'
+    return PARTITION_SCHEMES[table]
+
+
+def period_start(day: datetime.date, period: str):
+    """First day of the period day belongs to"""
+    if period == YEARLY:
+        return day.replace(month=1, day=1)
+    if period == MONTHLY:
+        return day.replace(day=1)
+    return day
+
+
+def next_period_start(start: datetime.date, period: str):
+    """First day of the period following the one starting at start"""
+    if period == YEARLY:
+        return start.replace(year=start.year + 1)
+    if period == MONTHLY:
+        return (start.replace(day=28) + datetime.timedelta(days=4)).replace(
+            day=1)
+    return start + datetime.timedelta(days=1)
+
+
+def period_starts(first: datetime.date, last: datetime.date, period: str):
+    """Start of every period from the one of first to the one of last"""
+    start = period_start(first, period)
+    while start <= last:
+        yield start
+        start = next_period_start(start, period)
+
+
+def partition_name(scheme: PartitionScheme, start: datetime.date):
+    if scheme.period == YEARLY:
+        return f'{scheme.table}_p{start:%Y}'
+    if scheme.period == MONTHLY:
+        return f'{scheme.table}_p{start:%Y_%m}'
+    return f'{scheme.table}_p{start:%Y_%m_%d}'
+
+
+def default_partition_name(scheme: PartitionScheme):
+    return f'{scheme.table}_default'
+
+
+def partition_bound(scheme: PartitionScheme, day: datetime.date):
+    """Value of the partition column where day starts, timestamps are
+    bounded at midnight UTC"""
+    if scheme.column == 'ts':
+        return f'{day.isoformat()} 00:00:00+00'
+    return day.isoformat()
+
+
+def existing_partitions(cursor, table: str):
+    """Names of the partitions attached to table"""
+    cursor.execute('SELECT child.relname FROM pg_inherits '
+                   'JOIN pg_class child ON child.oid = pg_inherits.inhrelid '
+                   'WHERE pg_inherits.inhparent = %s::regclass', [table])
+    return {row[0] for row in cursor.fetchall()}
+
+
+def create_default_partition(cursor, scheme: PartitionScheme):
+    cursor.execute(f'CREATE TABLE {default_partition_name(scheme)} '
+                   f'PARTITION OF {scheme.table} DEFAULT')
+
+
+def create_partition(cursor, scheme: PartitionScheme, start: datetime.date):
+    """Create the partition of the period starting at start. Rows of the
+    period caught by the default partition are moved into the new one
+    before attaching it, otherwise the partition could not be created."""
+    name = partition_name(scheme, start)
+    bounds = [partition_bound(scheme, start),
+              partition_bound(scheme, next_period_start(start,
+                                                        scheme.period))]
+    default = default_partition_name(scheme)
+    column = scheme.column
+    cursor.execute(f'SELECT EXISTS (SELECT 1 FROM {default} '
+                   f'WHERE {column} >= %s AND {column} < %s)', bounds)
+    if not cursor.fetchone()[0]:
+        cursor.execute(f'CREATE TABLE {name} PARTITION OF {scheme.table} '
+                       f'FOR VALUES FROM (%s) TO (%s)', bounds)
+        return
+    cursor.execute(f'CREATE TABLE {name} (LIKE {scheme.table} '
+                   f'INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+    cursor.execute(f'WITH moved AS (DELETE FROM {default} '
+                   f'WHERE {column} >= %s AND {column} < %s RETURNING *) '
+                   f'INSERT INTO {name} SELECT * FROM moved', bounds)
+    cursor.execute(f'ALTER TABLE {scheme.table} ATTACH PARTITION {name} '
+                   f'FOR VALUES FROM (%s) TO (%s)', bounds)
+
+
+def ensure_partitions(model, first: datetime.date, last: datetime.date,
+                      using: str = DEFAULT_DB_ALIAS, interval: int = None):
+    """Create the missing partitions of model for every period from first
+    to last, both included. Concurrent loads wait for each other on an
+    advisory lock instead of failing to create the same partition.
+    @args:
+        - model: partitioned model or its table name.
+        - first, last: dates of the first and last rows to be saved.
+        - using: database alias.
+        - interval: interval of the candles to be saved, KrakenCandle only.
+    @returns:
+        - list with the names of the created partitions.
+    """
+    scheme = get_partition_scheme(model, interval)
+    if scheme is None:
+        return []
+    created = []
+    with transaction.atomic(using=using):
+        with connections[using].cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_xact_lock(hashtext(%s))',
+                           [scheme.table])
+            existing = existing_partitions(cursor, scheme.table)
+            for start in period_starts(first, last, scheme.period):
+                name = partition_name(scheme, start)
+                if name not in existing:
+                    create_partition(cursor, scheme, start)
+                    created.append(name)
+    return created
@@ -0,0 +1,279 @@
+"""
+Cache of the responses of the read endpoints shared by every process
+through the settings.RESPONSE_CACHE cache. Responses are keyed on the url,
+path and sorted query parameters, plus the generations of the data they
+depend on. A generation is a counter bumped whenever its data is written,
+i.e the data loader bumps the generation of the OHLC of a symbol, so
+responses depending on it are not found anymore and are recomputed on the
+next request while responses of other symbols are still served.
+
+Generations are bumped as soon as data is written and again once it is
+committed, a response computed in between is cached under a generation
+nobody asks for anymore. Responses computed while a replica might not see
+the last write of their data yet, for up to settings.REPLICA_MAX_LAG
+seconds plus the time between lag measures, are served but not cached,
+otherwise a response read from a lagging replica would be served under
+the new generation until it expires.
+
+Conditional GET requests are answered from versions of the data kept on the
+database, the count and last update of the symbols and the
+KrakenOHLCVersion of the symbols, see crypto_data.ohlc_versions, together
+with the KrakenDeletions of the symbols, so every process agrees on them
+whatever the cache backend and a deletion never takes them back. They are
+read from the primary before the data and cached together with the
+response. The ETag of a response is derived from its url, the versions and
+the media type it is rendered as, Last-Modified is the last write of its
+data. Validators are only given once the data was written long enough ago
+for every read to see it, a response read from a lagging replica must not
+be revalidated after the replica catches up.
+"""
+from collections import namedtuple
+import hashlib
+import logging
+import time
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections, transaction, DEFAULT_DB_ALIAS
+from django.utils import timezone
+from django.utils.cache import (get_conditional_response,
+                                patch_cache_control, patch_vary_headers)
+from django.utils.http import http_date, quote_etag
+from rest_framework.response import Response
+from crypto_data.middleware import reads_primary
+from crypto_data.models import (KrakenDeletions, KrakenOHLCVersion,
+                                KrakenSymbols)
+from crypto_data.routers import LAG_CHECK_INTERVAL
+
+
+# generations of the symbols and of the OHLC of any symbol
+SYMBOLS_GENERATION = 'symbols'
+OHLC_GENERATION = 'ohlc'
+GENERATION_PREFIX = 'generation'
+RESPONSE_PREFIX = 'response'
+
+# versions of the data of some generations on the database and the time
+# it was last written, None if never
+DataVersion = namedtuple('DataVersion', ['versions', 'modified'])
+
+logger = logging.getLogger(__name__)
+
+
+def ohlc_generation(symbol_id: int):
+    """generation of the OHLC of a symbol"""
+    return f'{OHLC_GENERATION}:{symbol_id}'
+
+
+def response_cache():
+    return caches[settings.RESPONSE_CACHE]
+
+
+def generation_key(name: str):
+    return f'{GENERATION_PREFIX}:{name}'
+
+
+def get_or_start(keys: list, start):
+    """Value of every key on the response cache, keys missing are added
+    with start unless another process adds them first"""
+    cache = response_cache()
+    values = cache.get_many(keys)
+    for key in keys:
+        if key not in values:
+            cache.add(key, start, timeout=None)
+            values[key] = cache.get(key)
+    return [values[key] for key in keys]
+
+
+def get_generations(names: list):
+    """Current value of every generation, generations missing on the cache,
+    never bumped or evicted, start from the current time so they never go
+    back to a value responses were cached under"""
+    return get_or_start([generation_key(name) for name in names],
+                        time.time_ns())
+
+
+def bump_generations(names: list):
+    cache = response_cache()
+    for name in names:
+        key = generation_key(name)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # not on the cache, start it over from a value never used
+            cache.set(key, time.time_ns(), timeout=None)
+    logger.debug(f'Bumped generations {", ".join(names)}')
+
+
+def data_written(names: list, using: str):
+    """Bump generations now and once the writing transaction commits"""
+    bump_generations(names)
+    transaction.on_commit(lambda: bump_generations(names), using=using)
+
+
+def record_deletion(name: str, using: str):
+    """Count a deletion of the data of a generation on the database using,
+    in the deleting transaction"""
+    deletions = KrakenDeletions._meta.db_table
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'INSERT INTO {deletions} (name, count, modified) '
+                       f'VALUES (%s, 1, %s) '
+                       f'ON CONFLICT (name) DO UPDATE '
+                       f'SET count = {deletions}.count + 1, '
+                       f'modified = EXCLUDED.modified',
+                       [name, timezone.now()])
+
+
+def request_digest(request):
+    """Digest of the url of request, query parameters sorted so the same
+    request written differently shares the response"""
+    query = sorted((name, value) for name in request.query_params
+                   for value in request.query_params.getlist(name))
+    url = f'{request.build_absolute_uri(request.path)}?{query}'
+    return hashlib.sha256(url.encode()).hexdigest()
+
+
+def response_key(request, generations: list):
+    """Key of a response, the url and the generations of its data"""
+    versions = '.'.join(str(g) for g in get_generations(generations))
+    return f'{RESPONSE_PREFIX}:{request_digest(request)}:{versions}'
+
+
+def generation_version_query(name: str):
+    """Query of the version of the data of a generation, the amount and
+    sum of its versions and the time it was last written. Deleted symbols
+    take their KrakenOHLCVersion with them, the symbols and the OHLC of
+    every symbol count the deletions of symbols in and take the time of
+    the last one if later."""
+    deletions = (f'FROM {KrakenDeletions._meta.db_table} '
+                 f'WHERE name = %s')
+    deleted = (f'coalesce((SELECT count {deletions}), 0)',
+               f'(SELECT modified {deletions})')
+    if name == SYMBOLS_GENERATION:
+        return (f'SELECT count(*), {deleted[0]}, '
+                f'greatest(max(updated), {deleted[1]}) '
+                f'FROM {KrakenSymbols._meta.db_table}',
+                [SYMBOLS_GENERATION] * 2)
+    versions = KrakenOHLCVersion._meta.db_table
+    if name == OHLC_GENERATION:
+        return (f'SELECT count(*), coalesce(sum(version), 0) + {deleted[0]}, '
+                f'greatest(max(modified), {deleted[1]}) FROM {versions}',
+                [SYMBOLS_GENERATION] * 2)
+    return (f'SELECT count(*), sum(version), max(modified) FROM {versions} '
+            f'WHERE symbol_id = %s', [int(name.split(':')[1])])
+
+
+def data_version(generations: list, using: str = DEFAULT_DB_ALIAS):
+    """DataVersion of the data of every generation, read from the
+    database using in a single query"""
+    if not generations:
+        return DataVersion((), None)
+    queries, params = [], []
+    for i, name in enumerate(generations):
+        query, query_params = generation_version_query(name)
+        queries.append(f'SELECT {i} AS generation, * FROM ({query}) AS v')
+        params.extend(query_params)
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'{" UNION ALL ".join(queries)} ORDER BY generation',
+                       params)
+        rows = cursor.fetchall()
+    modified = max((row[3] for row in rows if row[3] is not None),
+                   default=None)
+    return DataVersion(tuple((count, total) for _, count, total, _ in rows),
+                       modified)
+
+
+def written_within(version: DataVersion, seconds: float):
+    """whether the data of version was written less than seconds ago"""
+    if version.modified is None:
+        return False
+    return (timezone.now() - version.modified).total_seconds() < seconds
+
+
+def response_validators(request, version: DataVersion):
+    """ETag and Last-Modified of the response of request showing the data
+    of version. The ETag tells apart the media types the response is
+    rendered as and the responses of authenticated users, they might
+    differ from the responses of others.
+    @returns:
+        - tuple (etag, last modified timestamp or None if the data was
+        never written).
+    """
+    user = request.user.pk if request.user.is_authenticated else ''
+    media_type = getattr(request, 'accepted_media_type', '')
+    digest = hashlib.sha256(f'{request_digest(request)}:{version.versions}:'
+                            f'{media_type}:{user}'.encode()).hexdigest()
+    modified = version.modified
+    return (quote_etag(digest[:32]),
+            int(modified.timestamp()) if modified is not None else None)
+
+
+def set_validators(response, etag: str, last_modified):
+    """Give the validators to response, clients revalidate before using
+    it again"""
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    patch_cache_control(response, no_cache=True)
+    patch_vary_headers(response, ('Accept', ))
+    return response
+
+
+class ResponseCacheMixin:
+    """Serve GET requests from the response cache. Requests of
+    authenticated users, which might get different responses, and requests
+    reading from the primary skip the cache. Responses have an ETag and
+    Last-Modified once their data was written validators_delay seconds ago,
+    If-None-Match and If-Modified-Since are answered with a 304 without
+    reading it. Responses are only cached once their data was written
+    replica_lag_bound seconds ago, together with the DataVersion of their
+    data so cached responses are revalidated without a query.
+    Properties:
+        - cache_generations: generations every response depends on,
+        override data_generations to depend on the request.
+    """
+    cache_generations = ()
+
+    def data_generations(self, request):
+        return list(self.cache_generations)
+
+    def replica_lag_bound(self):
+        """seconds a read might not see written data, how long a replica
+        can lag and go on being read before its lag is measured again"""
+        if not settings.REPLICA_DATABASES:
+            return 0
+        return settings.REPLICA_MAX_LAG + LAG_CHECK_INTERVAL
+
+    def validators_delay(self):
+        """seconds before written data is given validators, at least a
+        second as Last-Modified is given in seconds"""
+        return max(self.replica_lag_bound(), 1)
+
+    def get(self, request, *args, **kwargs):
+        generations = self.data_generations(request)
+        key = response_key(request, generations)
+        shared = not (request.user.is_authenticated
+                      or reads_primary(request))
+        cached = response_cache().get(key) if shared else None
+        if cached is not None:
+            data, version = cached
+        else:
+            # read before the data, the data is never older than it
+            version = data_version(generations)
+        validators = None
+        if not written_within(version, self.validators_delay()):
+            validators = response_validators(request, version)
+            not_modified = get_conditional_response(request._request,
+                                                    *validators)
+            if not_modified is not None:
+                return set_validators(not_modified, *validators)
+        if cached is not None:
+            response = Response(data)
+        else:
+            response = super().get(request, *args, **kwargs)
+            if (shared and response.status_code == 200
+                    and not written_within(version,
+                                           self.replica_lag_bound())):
+                response_cache().set(key, (response.data, version),
+                                     settings.RESPONSE_CACHE_TIMEOUT)
+        if validators is not None and response.status_code == 200:
+            set_validators(response, *validators)
+        return response
@@ -0,0 +1,77 @@
+"""
+Weekly, monthly and yearly rollups of KrakenOHLC. Rollups are kept up to
+date incrementally, after OHLC rows of a symbol are written only the periods
+containing the written dates are aggregated again, in a single query for the
+three periods.
+"""
+import datetime
+import logging
+from django.db import connections, transaction, DEFAULT_DB_ALIAS
+from crypto_data.models import KrakenOHLC, KrakenOHLCRollup
+
+
+ROLLUP_PERIODS = [period for period, _ in KrakenOHLCRollup.PERIODS]
+
+logger = logging.getLogger(__name__)
+
+
+def rollup_sql(symbol_condition: str, date_condition: str):
+    """Aggregate the OHLC rows matching the conditions into every period,
+    open is the open of the first date and close the close of the last"""
+    ohlc_table = KrakenOHLC._meta.db_table
+    rollup_table = KrakenOHLCRollup._meta.db_table
+    periods = ', '.join(f"('{period}')" for period in ROLLUP_PERIODS)
+    return (f'INSERT INTO {rollup_table} '
+            f'(symbol_id, period, start, open, high, low, close, days, '
+            f'first_date, last_date) '
+            f'SELECT ohlc.symbol_id, periods.period, '
+            f'date_trunc(periods.period, ohlc.date::timestamp)::date '
+            f'AS start, '
+            f'(array_agg(ohlc.open ORDER BY ohlc.date))[1], '
+            f'max(ohlc.high), min(ohlc.low), '
+            f'(array_agg(ohlc.close ORDER BY ohlc.date DESC))[1], count(*), '
+            f'min(ohlc.date), max(ohlc.date) '
+            f'FROM (VALUES {periods}) AS periods (period) '
+            f'JOIN {ohlc_table} ohlc ON {symbol_condition} '
+            f'AND {date_condition} '
+            f'GROUP BY ohlc.symbol_id, periods.period, start')
+
+
+def refresh_rollups(symbol_id: int, first: datetime.date,
+                    last: datetime.date, using: str = DEFAULT_DB_ALIAS):
+    """Aggregate again the rollups of every period touched by OHLC rows of
+    a symbol dated from first to last, both included. Touched rollups are
+    replaced so periods left without rows, i.e after a delete, disappear.
+    @args:
+        - symbol_id: id of the KrakenSymbols the rows belong to.
+        - first, last: dates of the first and last written rows.
+        - using: database alias.
+    """
+    params = {'symbol_id': symbol_id, 'first': first, 'last': last}
+    # plain timestamps so periods do not depend on the session time zone
+    period_range = ('>= date_trunc({period}, %(first)s::timestamp) '
+                    'AND {column} < date_trunc({period}, %(last)s::timestamp) '
+                    "+ ('1 ' || {period})::interval")
+    with transaction.atomic(using=using):
+        with connections[using].cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {KrakenOHLCRollup._meta.db_table} '
+                f'WHERE symbol_id = %(symbol_id)s AND start ' +
+                period_range.format(period='period', column='start'),
+                params)
+            cursor.execute(rollup_sql(
+                'ohlc.symbol_id = %(symbol_id)s',
+                'ohlc.date ' + period_range.format(period='periods.period',
+                                                   column='ohlc.date')),
+                params)
+    logger.debug(f'Refreshed rollups of symbol {symbol_id} from {first} to '
+                 f'{last}')
+
+
+def rebuild_rollups(using: str = DEFAULT_DB_ALIAS):
+    """Aggregate every rollup from scratch, i.e after rows were written
+    without sending ohlc_batch_written"""
+    with transaction.atomic(using=using):
+        with connections[using].cursor() as cursor:
+            cursor.execute(f'DELETE FROM {KrakenOHLCRollup._meta.db_table}')
+            cursor.execute(rollup_sql('TRUE', 'TRUE'))
@@ -0,0 +1,179 @@
+"""
+Route reads to the read replicas of the default database. Reads go to the
+primary unless they run inside replica_reads, which the read only views and
+data_display enable, so the loader and every write stay on the primary.
+Replicas lagging behind the primary more than settings.REPLICA_MAX_LAG
+seconds, or not answering, are left out until they catch up and when none
+is left reads fall back to the primary. Every read inside replica_reads,
+i.e of a request, goes to the same replica, picked on the first read, so
+rows do not come and go between queries of replicas lagging differently.
+"""
+import contextlib
+import contextvars
+import logging
+import random
+import threading
+import time
+from django.conf import settings
+from django.db import connections, router, DEFAULT_DB_ALIAS, DatabaseError
+
+
+PRIMARY = 'primary'
+REPLICA = 'replica'
+# seconds a replica lag measure is trusted before measuring it again
+LAG_CHECK_INTERVAL = 1
+# WAL the primary has written, a replica that replayed up to it is caught
+# up no matter how long ago it last replayed a transaction
+PRIMARY_LSN_QUERY = 'SELECT pg_current_wal_lsn()'
+# 0 when the replica replayed the WAL of the primary, otherwise seconds
+# since the last transaction it replayed was committed on the primary. What
+# the replica received is not trusted, a disconnected or idle WAL receiver
+# receives nothing more, so such a replica lags more and more once the
+# primary writes. NULL when nothing was replayed yet.
+LAG_QUERY = ('SELECT CASE WHEN NOT pg_is_in_recovery() '
+             'OR pg_last_wal_replay_lsn() >= %s::pg_lsn '
+             'THEN 0 ELSE extract(epoch FROM now() - '
+             'pg_last_xact_replay_timestamp()) END')
+
+_reads_from = contextvars.ContextVar('reads_from', default=PRIMARY)
+# alias picked by the first read of the outermost replica_reads block, as
+# {'alias': alias}, an empty dict until then
+_pinned_replica = contextvars.ContextVar('pinned_replica', default=None)
+
+logger = logging.getLogger(__name__)
+
+
+@contextlib.contextmanager
+def replica_reads():
+    """Read from the replicas inside the block, every read from the same
+    one, nested blocks read from the replica of the outermost"""
+    token = _reads_from.set(REPLICA)
+    pin_token = (_pinned_replica.set({}) if _pinned_replica.get() is None
+                 else None)
+    try:
+        yield
+    finally:
+        _reads_from.reset(token)
+        if pin_token is not None:
+            _pinned_replica.reset(pin_token)
+
+
+@contextlib.contextmanager
+def primary_reads():
+    """Read from the primary inside the block even within replica_reads,
+    i.e to read rows just written"""
+    token = _reads_from.set(PRIMARY)
+    try:
+        yield
+    finally:
+        _reads_from.reset(token)
+
+
+def primary_lsn():
+    """WAL position written by the primary, None if it can not be
+    queried"""
+    try:
+        with connections[DEFAULT_DB_ALIAS].cursor() as cursor:
+            cursor.execute(PRIMARY_LSN_QUERY)
+            return cursor.fetchone()[0]
+    except DatabaseError as e:
+        logger.warning(f'WAL position of the primary is not available, {e}')
+        return None
+
+
+def replica_lag(alias: str):
+    """Seconds the replica is behind the primary, None if it can not be
+    queried or never replayed a transaction"""
+    lsn = primary_lsn()
+    try:
+        with connections[alias].cursor() as cursor:
+            cursor.execute(LAG_QUERY, [lsn])
+            lag = cursor.fetchone()[0]
+    except DatabaseError as e:
+        logger.warning(f'Replica {alias} is not available, {e}')
+        connections[alias].close()
+        return None
+    return float(lag) if lag is not None else None
+
+
+class ReplicaRouter:
+    """Database router balancing reads across settings.REPLICA_DATABASES.
+    Methods:
+        - read_replica: alias to read from, a healthy replica picked at
+        random or the primary.
+        - pinned_replica: alias read from by the replica_reads block.
+        - healthy_replicas: replicas within settings.REPLICA_MAX_LAG.
+    """
+    def __init__(self):
+        self._lags = {}  # alias: (time measured, lag or None)
+        self._lock = threading.Lock()
+
+    def measured_lag(self, alias: str):
+        now = time.monotonic()
+        with self._lock:
+            measured = self._lags.get(alias)
+        if measured is not None and now - measured[0] < LAG_CHECK_INTERVAL:
+            return measured[1]
+        lag = replica_lag(alias)
+        with self._lock:
+            self._lags[alias] = (now, lag)
+        return lag
+
+    def healthy_replicas(self):
+        healthy = []
+        for alias in settings.REPLICA_DATABASES:
+            lag = self.measured_lag(alias)
+            if lag is not None and lag <= settings.REPLICA_MAX_LAG:
+                healthy.append(alias)
+        return healthy
+
+    def read_replica(self):
+        replicas = self.healthy_replicas()
+        if not replicas:
+            if settings.REPLICA_DATABASES:
+                logger.warning('No replica within the lag limit, reading '
+                               'from the primary')
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def pinned_replica(self):
+        """Replica picked by the first read of the replica_reads block,
+        kept even if it lags afterwards so reads stay consistent"""
+        pinned = _pinned_replica.get()
+        if pinned is None:
+            return self.read_replica()
+        if 'alias' not in pinned:
+            pinned['alias'] = self.read_replica()
+        return pinned['alias']
+
+    def db_for_read(self, model, **hints):
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            # related rows are read from the database of the instance
+            return instance._state.db
+        if _reads_from.get() == REPLICA and settings.REPLICA_DATABASES:
+            return self.pinned_replica()
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.REPLICA_DATABASES:
+            return False
+        return None
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}()'
+
+
+def read_replica(model):
+    """Alias to read the model from, i.e to pass to QuerySet.using so every
+    query of a queryset reads the same replica, the replica of the
+    replica_reads block it runs in"""
+    with replica_reads():
+        return router.db_for_read(model)
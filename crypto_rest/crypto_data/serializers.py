@@ -1,12 +1,94 @@
+from django.utils.encoding import smart_str
 from rest_framework import serializers
-from crypto_data.models import KrakenSymbols, KrakenOHLC
+from rest_framework.reverse import reverse
+from rest_framework.validators import UniqueTogetherValidator
+from crypto_data.models import KrakenSymbols, KrakenOHLC, KrakenOHLCRollup
+from crypto_data.custom_fields import (FIXED_POINT_MAX_DIGITS,
+                                       PRICE_DECIMAL_PLACES, to_fixed_point,
+                                       fixed_point_to_string,
+                                       raw_fixed_point)
+from crypto_data.symbol_registry import symbol_registry
+
+
+class FixedPointPriceField(serializers.DecimalField):
+    """Price on a FixedPointField, validated as a decimal number with up to
+    PRICE_DECIMAL_PLACES decimal places. Represented as a string with the
+    decimal places it needs, so a price round trips exactly, i.e
+    '0.58412345' is read back as '0.58412345'.
+    Properties:
+        - scaled: values are the scaled integers stored instead of Decimal,
+        for rows written with COPY or read with raw_fixed_point.
+    """
+
+    def __init__(self, scaled: bool = False, **kwargs):
+        self.scaled = scaled
+        kwargs.setdefault('max_digits', FIXED_POINT_MAX_DIGITS)
+        kwargs.setdefault('decimal_places', PRICE_DECIMAL_PLACES)
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        value = super().to_internal_value(data)
+        if self.scaled:
+            return to_fixed_point(value, self.decimal_places)
+        return value
+
+    def to_representation(self, value):
+        if not self.scaled:
+            value = to_fixed_point(value, self.decimal_places)
+        return fixed_point_to_string(value, self.decimal_places)
+
+
+class RegisteredSymbolField(serializers.SlugRelatedField):
+    """KrakenSymbols represented by its symbol, resolved through
+    crypto_data.symbol_registry instead of querying the symbol of every row
+    or the symbol of every validated value. Validated values are
+    KrakenSymbols with only id and symbol, enough to relate rows to them."""
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault('slug_field', 'symbol')
+        if not kwargs.get('read_only'):
+            kwargs.setdefault('queryset', KrakenSymbols.objects.all())
+        super().__init__(**kwargs)
+
+    def use_pk_only_optimization(self):
+        return True
+
+    def to_internal_value(self, data):
+        if not isinstance(data, (str, int)):
+            self.fail('invalid')
+        symbol_id = symbol_registry.id_of(str(data))
+        if symbol_id is None:
+            self.fail('does_not_exist', slug_name=self.slug_field,
+                      value=smart_str(data))
+        return symbol_registry.instance(symbol_id)
+
+    def to_representation(self, value):
+        return symbol_registry.symbol_of(value.pk)
+
+
+class KrakenSymbolOHLCSummarySerializer(serializers.Serializer):
+    """Summary of the KrakenOHLC of a symbol annotated by
+    KrakenSymbols.objects.with_ohlc_summary, url lists them on
+    KrakenOHLCList"""
+    count = serializers.IntegerField(source='ohlc_count', read_only=True)
+    first_date = serializers.DateField(source='first_ohlc_date',
+                                       read_only=True)
+    last_date = serializers.DateField(source='last_ohlc_date',
+                                      read_only=True)
+    latest_close = FixedPointPriceField(read_only=True)
+    url = serializers.SerializerMethodField()
+
+    def get_url(self, symbol):
+        url = reverse('Krakenohlc-list', request=self.context.get('request'))
+        return f'{url}?symbol={symbol.pk}'
 
 
 class KrakenSymbolSerializer(serializers.HyperlinkedModelSerializer):
-    """Serializer for KrakenSymbols"""
-    related_OHLC = serializers.HyperlinkedRelatedField(many=True,
-                                                    read_only=True,
-                                                    view_name='krakensymbols-detail')
+    """Serializer for KrakenSymbols, symbols are expected to be read with
+    KrakenSymbols.objects.with_ohlc_summary, others are read again with
+    it"""
+    ohlc_summary = KrakenSymbolOHLCSummarySerializer(source='*',
+                                                     read_only=True)
 
     class Meta:
         model = KrakenSymbols
@@ -18,7 +100,16 @@ class KrakenSymbolSerializer(serializers.HyperlinkedModelSerializer):
                   'coin_symbol',
                   'currency',
                   'symbol',
-                  'related_OHLC')
+                  'ohlc_summary')
+
+    def to_representation(self, instance):
+        if not hasattr(instance, 'ohlc_count'):
+            # i.e a symbol just created or updated
+            instance = (KrakenSymbols.objects
+                        .using(instance._state.db)
+                        .with_ohlc_summary()
+                        .get(pk=instance.pk))
+        return super().to_representation(instance)
 
     def update(self, instance, validated_data):
         """instance symbol is a combination of coin_symbol and coin_currency
@@ -38,10 +129,11 @@ class KrakenSymbolSerializer(serializers.HyperlinkedModelSerializer):
 
 class KrakenOHLCSerializer(serializers.HyperlinkedModelSerializer):
     """serializer for KrakenOHLC"""
-    symbol = serializers.SlugRelatedField(
-        queryset=KrakenSymbols.objects.all(),
-        slug_field='symbol',
-    )
+    open = FixedPointPriceField()
+    high = FixedPointPriceField()
+    low = FixedPointPriceField()
+    close = FixedPointPriceField()
+    symbol = RegisteredSymbolField()
 
     class Meta:
         model = KrakenOHLC
@@ -52,4 +144,104 @@ class KrakenOHLCSerializer(serializers.HyperlinkedModelSerializer):
                   'close',
                   'symbol',
                   'date')
+        # DRF does not create validators for UniqueConstraint, without this
+        # a repeated candle would fail with an IntegrityError on save.
+        validators = [
+            UniqueTogetherValidator(queryset=KrakenOHLC.objects.all(),
+                                    fields=('symbol', 'date')),
+        ]
+
+
+class KrakenOHLCListEncoder:
+    """Represent KrakenOHLC the way KrakenOHLCSerializer does, from rows read
+    with values_list instead of model instances, symbols are resolved
+    through crypto_data.symbol_registry. Urls are built from the detail url
+    of a marker pk, reversed once, and every row is a dict literal of the
+    serializer fields in the same order so the rendered JSON is byte for
+    byte the same.
+    Methods:
+        - rows: values_list of a KrakenOHLC queryset with the read fields.
+        - encode: represent a list of rows.
+    """
+    view_name = 'krakenohlc-detail'
+    # the pagination reads the position of a row from id, date, symbol_id
+    row_fields = ('id', 'date', 'raw_open', 'raw_high', 'raw_low',
+                  'raw_close', 'symbol_id')
+    # pk reversed to find where the pk of every row goes on the url
+    url_marker = '9876543210'
+
+    def __init__(self, request):
+        url = reverse(self.view_name, kwargs={'pk': self.url_marker},
+                      request=request)
+        self.url_prefix, self.url_suffix = url.split(self.url_marker)
+
+    @classmethod
+    def rows(cls, queryset):
+        """prices are read as the scaled integers, see raw_fixed_point"""
+        return (queryset
+                .annotate(**{f'raw_{name}': raw_fixed_point(name)
+                             for name in ('open', 'high', 'low', 'close')})
+                .values_list(*cls.row_fields, named=True))
 
+    def encode(self, rows):
+        prefix, suffix = self.url_prefix, self.url_suffix
+        price = fixed_point_to_string
+        symbol_of = symbol_registry.symbol_of
+        return [{'url': f'{prefix}{row_id}{suffix}',
+                 'open': price(open_),
+                 'high': price(high),
+                 'low': price(low),
+                 'close': price(close),
+                 'symbol': symbol_of(symbol_id),
+                 'date': date.isoformat()}
+                for row_id, date, open_, high, low, close, symbol_id
+                in rows]
+
+    def __repr__(self):
+        return (f'{self.__class__.__name__}'
+                f'({self.url_prefix}<pk>{self.url_suffix})')
+
+
+class KrakenOHLCRowSerializer(serializers.ModelSerializer):
+    """Validate KrakenOHLC values without the related symbol, used to
+    validate batches of rows for the same symbol in memory, the symbol is
+    resolved once per batch by the caller instead of once per row. Prices
+    are validated to the scaled integers the batches are written with."""
+    open = FixedPointPriceField(scaled=True)
+    high = FixedPointPriceField(scaled=True)
+    low = FixedPointPriceField(scaled=True)
+    close = FixedPointPriceField(scaled=True)
+
+    class Meta:
+        model = KrakenOHLC
+        fields = ('open',
+                  'high',
+                  'low',
+                  'close',
+                  'date')
+
+
+class KrakenOHLCRollupSerializer(serializers.ModelSerializer):
+    """serializer for KrakenOHLCRollup, rollups are computed from KrakenOHLC
+    so every field is read only"""
+    open = FixedPointPriceField(read_only=True)
+    high = FixedPointPriceField(read_only=True)
+    low = FixedPointPriceField(read_only=True)
+    close = FixedPointPriceField(read_only=True)
+    symbol = RegisteredSymbolField(read_only=True)
+    period = serializers.CharField(source='get_period_display',
+                                   read_only=True)
+
+    class Meta:
+        model = KrakenOHLCRollup
+        fields = ('symbol',
+                  'period',
+                  'start',
+                  'open',
+                  'high',
+                  'low',
+                  'close',
+                  'days',
+                  'first_date',
+                  'last_date')
+        read_only_fields = fields
@@ -0,0 +1,117 @@
+"""
+Signals sent when Kraken data is written and the receivers keeping the
+OHLC rollups, the OHLC versions, the OHLC cache, the response cache, the
+deletions and the symbol registry up to date, receivers are connected on
+CryptoDataConfig.ready.
+There is no post_delete receiver for KrakenOHLC on purpose, it would stop
+django from deleting the OHLC rows of a symbol in a single query, views
+deleting rows refresh the rollups and the cache themselves.
+"""
+from functools import partial
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import Signal, receiver
+from crypto_data.models import KrakenOHLC, KrakenSymbols
+from crypto_data.ohlc_cache import ohlc_cache
+from crypto_data.ohlc_versions import bump_ohlc_versions
+from crypto_data.response_cache import (data_written, ohlc_generation,
+                                        record_deletion, OHLC_GENERATION,
+                                        SYMBOLS_GENERATION)
+from crypto_data.rollups import refresh_rollups
+from crypto_data.symbol_registry import symbol_registry
+
+
+# sent by the bulk loader once a batch of rows of a symbol is written, rows
+# written with COPY do not send post_save.
+# arguments: sender (model written), symbol_id, first, last (dates of the
+# first and last rows) and using (database alias).
+ohlc_batch_written = Signal()
+
+
+@receiver(ohlc_batch_written, dispatch_uid='rollups_batch_written')
+def refresh_rollups_of_batch(sender, symbol_id, first, last, using,
+                             **kwargs):
+    if sender is KrakenOHLC:
+        refresh_rollups(symbol_id, first, last, using)
+
+
+@receiver(pre_save, sender=KrakenOHLC, dispatch_uid='rollups_pre_save')
+def remember_saved_date(sender, instance, raw, using, **kwargs):
+    """Keep the symbol and date an updated row had, moving the row leaves
+    the rollups of its previous period to refresh"""
+    if raw or instance._state.adding:
+        return
+    instance._rollup_previous = (sender.objects.using(using)
+                                 .filter(pk=instance.pk)
+                                 .values_list('symbol_id', 'date')
+                                 .first())
+
+
+@receiver(post_save, sender=KrakenOHLC, dispatch_uid='rollups_post_save')
+def refresh_rollups_of_row(sender, instance, raw, using, **kwargs):
+    if raw:
+        return
+    refresh_rollups(instance.symbol_id, instance.date, instance.date, using)
+    previous = getattr(instance, '_rollup_previous', None)
+    if previous is not None and previous != (instance.symbol_id,
+                                             instance.date):
+        refresh_rollups(*previous, previous[1], using)
+
+
+@receiver(ohlc_batch_written, dispatch_uid='ohlc_cache_batch_written')
+def extend_cache_with_batch(sender, symbol_id, first, last, using, **kwargs):
+    if sender is KrakenOHLC:
+        bump_ohlc_versions([symbol_id], using)
+        transaction.on_commit(partial(ohlc_cache.extend, symbol_id, first,
+                                      using),
+                              using=using)
+        data_written([OHLC_GENERATION, ohlc_generation(symbol_id)], using)
+
+
+def ohlc_written(symbol_ids, using):
+    """Bump the OHLC versions of the symbols, drop them from the OHLC cache
+    and bump the generations of their responses, now and once committed, a
+    request might cache them again before the writing transaction
+    commits"""
+    bump_ohlc_versions(symbol_ids, using)
+    for symbol_id in symbol_ids:
+        ohlc_cache.invalidate(symbol_id)
+        transaction.on_commit(partial(ohlc_cache.invalidate, symbol_id),
+                              using=using)
+    data_written([OHLC_GENERATION, *(ohlc_generation(symbol_id)
+                                     for symbol_id in symbol_ids)], using)
+
+
+@receiver(post_save, sender=KrakenOHLC, dispatch_uid='ohlc_cache_post_save')
+def invalidate_cache_of_row(sender, instance, raw, using, **kwargs):
+    previous = getattr(instance, '_rollup_previous', None)
+    ohlc_written({instance.symbol_id,
+                  *([previous[0]] if previous is not None else [])}, using)
+
+
+@receiver(post_save, sender=KrakenSymbols,
+          dispatch_uid='ohlc_cache_symbol_post_save')
+@receiver(post_delete, sender=KrakenSymbols,
+          dispatch_uid='ohlc_cache_symbol_post_delete')
+def invalidate_cache_of_symbol(sender, instance, using, **kwargs):
+    ohlc_written([instance.id], using)
+    data_written([SYMBOLS_GENERATION], using)
+
+
+@receiver(post_delete, sender=KrakenSymbols,
+          dispatch_uid='deletions_symbol_post_delete')
+def record_symbol_deletion(sender, instance, using, **kwargs):
+    """Keep the last modified time of the symbols and of the OHLC of every
+    symbol from going back with the deleted symbol"""
+    record_deletion(SYMBOLS_GENERATION, using)
+
+
+@receiver(post_save, sender=KrakenSymbols,
+          dispatch_uid='symbol_registry_post_save')
+@receiver(post_delete, sender=KrakenSymbols,
+          dispatch_uid='symbol_registry_post_delete')
+def invalidate_symbol_registry(sender, instance, using, **kwargs):
+    """Read the symbols again now and once committed, a lookup might read
+    them before the writing transaction commits"""
+    symbol_registry.invalidate()
+    transaction.on_commit(symbol_registry.invalidate, using=using)
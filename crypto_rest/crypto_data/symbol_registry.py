@@ -0,0 +1,134 @@
+"""
+In process registry of the KrakenSymbols, symbol <-> id, so serializers,
+filters and loaders resolve symbols without querying or joining the symbols
+table. The whole table, a few dozen rows, is read with a single query the
+first time a symbol is resolved and again once the registry is invalidated,
+which crypto_data.signals does whenever a symbol is saved or deleted.
+
+Processes do not see each other's writes, symbols are read again after
+settings.SYMBOL_REGISTRY_TTL seconds, and on a miss so a symbol created by
+another process is found right away. Symbols read inside a transaction are
+only kept while it lasts, it might roll back symbols written in it.
+"""
+import logging
+import threading
+import time
+from django.conf import settings
+from django.db import connections, DEFAULT_DB_ALIAS
+from crypto_data.models import KrakenSymbols
+
+
+logger = logging.getLogger(__name__)
+
+
+class SymbolRegistry:
+    """Symbols and ids of every KrakenSymbols, read from the primary.
+    Methods:
+        - id_of: id of a symbol.
+        - symbol_of: symbol of an id.
+        - ids_starting_with: ids of the symbols starting with every prefix.
+        - instance: KrakenSymbols of an id, without querying.
+        - invalidate: read every symbol again on the next lookup.
+    Properties:
+        - ttl: seconds the symbols are kept before being read again.
+        - miss_interval: seconds since the last read for a miss to read the
+        symbols again, so unknown symbols do not query on every lookup.
+    """
+    miss_interval = 1
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._ids = None
+        self._symbols = None
+        self._loaded_at = None
+        self._loaded_in = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _transaction():
+        """thread and savepoints of the transaction the symbols would be
+        read in, None out of a transaction"""
+        connection = connections[DEFAULT_DB_ALIAS]
+        if not connection.in_atomic_block:
+            return None
+        return threading.get_ident(), tuple(connection.savepoint_ids)
+
+    def _load(self):
+        loaded_in = self._transaction()
+        rows = list(KrakenSymbols.objects
+                    .using(DEFAULT_DB_ALIAS)
+                    .values_list('symbol', 'id'))
+        with self._lock:
+            self._ids = dict(rows)
+            self._symbols = {symbol_id: symbol for symbol, symbol_id in rows}
+            self._loaded_at = time.monotonic()
+            self._loaded_in = loaded_in
+        logger.debug(f'Loaded {len(rows)} symbols on the registry')
+
+    def _visible(self, loaded_in):
+        """whether symbols read in the loaded_in transaction can be used
+        now, only inside that transaction or its savepoints"""
+        if loaded_in is None:
+            return True
+        current = self._transaction()
+        if current is None or current[0] != loaded_in[0]:
+            return False
+        savepoints = loaded_in[1]
+        return current[1][:len(savepoints)] == savepoints
+
+    def _maps(self, missing=False):
+        """ids by symbol and symbols by id, read again if they were
+        invalidated, expired or read in a transaction that ended, or on a
+        miss"""
+        with self._lock:
+            loaded_at, loaded_in = self._loaded_at, self._loaded_in
+        age = None if loaded_at is None else time.monotonic() - loaded_at
+        if (age is None or age >= self.ttl
+                or (missing and age >= self.miss_interval)
+                or not self._visible(loaded_in)):
+            self._load()
+        with self._lock:
+            return self._ids, self._symbols
+
+    def id_of(self, symbol: str):
+        """id of the symbol, None if there is no such symbol"""
+        ids, _ = self._maps()
+        if symbol not in ids:
+            ids, _ = self._maps(missing=True)
+        return ids.get(symbol)
+
+    def symbol_of(self, symbol_id: int):
+        """symbol of the id, None if there is no such symbol"""
+        _, symbols = self._maps()
+        if symbol_id not in symbols:
+            _, symbols = self._maps(missing=True)
+        return symbols.get(symbol_id)
+
+    def ids_starting_with(self, prefixes: list):
+        """ids of the symbols starting with every prefix, case
+        insensitive"""
+        ids, _ = self._maps()
+        prefixes = [prefix.upper() for prefix in prefixes]
+        return [symbol_id for symbol, symbol_id in ids.items()
+                if all(symbol.upper().startswith(p) for p in prefixes)]
+
+    def instance(self, symbol_id: int):
+        """KrakenSymbols with only id and symbol, enough to relate rows to
+        it, None if there is no such symbol"""
+        symbol = self.symbol_of(symbol_id)
+        if symbol is None:
+            return None
+        instance = KrakenSymbols(id=symbol_id, symbol=symbol)
+        instance._state.adding = False
+        instance._state.db = DEFAULT_DB_ALIAS
+        return instance
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}(ttl={self.ttl})'
+
+
+symbol_registry = SymbolRegistry(settings.SYMBOL_REGISTRY_TTL)
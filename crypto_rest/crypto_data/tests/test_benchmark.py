@@ -0,0 +1,23 @@
+import json
+from django.test import TestCase
+from crypto_data.benchmark import run_benchmarks, speedups, PATHS
+
+
+class TestListBenchmark(TestCase):
+    """Test module benchmark on small sizes"""
+
+    def test_every_path_lists_every_row(self):
+        lines = []
+        report = run_benchmarks(sizes=[30], symbols=3, page_size=7,
+                                report=lines.append)
+        results = report['results']
+        self.assertEqual([r['path'] for r in results], list(PATHS))
+        for result in results:
+            self.assertEqual(result['rows'], 30)
+            self.assertGreater(result['rows_per_second'], 0)
+        # both paths give the same responses
+        self.assertEqual(len({r['bytes'] for r in results}), 1)
+        self.assertEqual(len(lines), len(PATHS))
+        self.assertEqual([(path, rows) for path, rows, _ in
+                          speedups(report)], [('fast', 30)])
+        json.dumps(report)
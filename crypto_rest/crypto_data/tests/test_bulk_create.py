@@ -0,0 +1,116 @@
+from decimal import Decimal
+import datetime
+import json
+import time
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+from rest_framework.test import APIRequestFactory
+from data_loader.save_crypto_names import create_kraken_symbols
+from crypto_data import views
+from crypto_data.models import KrakenOHLC
+
+
+def create_items(symbol: str, days: int, start=datetime.date(2021, 1, 1)):
+    return [{'symbol': symbol, 'date': str(start + datetime.timedelta(d)),
+             'open': '10.5', 'high': '11', 'low': '10', 'close': '10.75'}
+            for d in range(days)]
+
+
+class TestKrakenOHLCBulkCreate(TestCase):
+    """Test KrakenOHLCBulkCreate"""
+
+    def setUp(self):
+        create_kraken_symbols('USD')
+        self.factory = APIRequestFactory()
+
+    def post(self, data, content_type='application/json'):
+        if not isinstance(data, (str, bytes)):
+            data = json.dumps(data)
+        request = self.factory.post('crypto-data/kraken-ohlc/bulk/', data,
+                                    content_type=content_type)
+        return views.KrakenOHLCBulkCreate.as_view()(request)
+
+    def test_items_of_several_symbols_are_saved(self):
+        items = create_items('BTCUSD', 40) + create_items('ETHUSD', 3)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.post(items)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data, {'saved': 43, 'duplicates': 0,
+                                         'rejected': 0, 'errors': []})
+        symbol_queries = [q for q in queries
+                          if 'FROM "crypto_data_krakensymbols"' in q['sql']]
+        self.assertEqual(len(symbol_queries), 1)
+        row = KrakenOHLC.objects.get(symbol__symbol='ETHUSD',
+                                     date='2021-01-02')
+        self.assertEqual(row.close, Decimal('10.75'))
+
+    def test_saved_items_are_updated(self):
+        self.post(create_items('BTCUSD', 2))
+        items = create_items('BTCUSD', 1)
+        items[0]['close'] = '12'
+        response = self.post(items)
+        self.assertEqual(response.data['saved'], 1)
+        self.assertEqual(KrakenOHLC.objects.get(date='2021-01-01').close, 12)
+        self.assertEqual(KrakenOHLC.objects.count(), 2)
+
+    def test_duplicate_items_are_reported(self):
+        """Test items of the same symbol and date are counted as
+        duplicates, the last one is saved"""
+        items = create_items('BTCUSD', 2) * 2 + create_items('ETHUSD', 1)
+        items[2]['close'] = '12'
+        items.append({'symbol': 'BTCUSD'})
+        with self.assertLogs('data_loader.bulk_loader', 'WARNING'):
+            response = self.post(items)
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual((response.data['saved'], response.data['duplicates'],
+                          response.data['rejected']), (3, 2, 1))
+        self.assertEqual(KrakenOHLC.objects.get(symbol__symbol='BTCUSD',
+                                                date='2021-01-01').close, 12)
+
+    def test_invalid_items_are_reported(self):
+        items = create_items('BTCUSD', 3)
+        items[1]['low'] = 'x'
+        del items[2]['date']
+        items += [{**create_items('BTCUSD', 1)[0], 'symbol': 'NOPEUSD'}, 7]
+        response = self.post(items)
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual(response.data['saved'], 1)
+        self.assertEqual(response.data['rejected'], 4)
+        errors = {e['index']: e['errors'] for e in response.data['errors']}
+        self.assertEqual(set(errors), {1, 2, 3, 4})
+        self.assertEqual(errors[1]['low'][0].code, 'invalid')
+        self.assertEqual(errors[2]['date'][0].code, 'required')
+        self.assertEqual(errors[3]['symbol'],
+                         ['Object with symbol=NOPEUSD does not exist.'])
+        self.assertIn('non_field_errors', errors[4])
+        self.assertEqual(KrakenOHLC.objects.count(), 1)
+
+    def test_nothing_valid(self):
+        response = self.post([{'symbol': 'BTCUSD'}])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['rejected'], 1)
+        for body in ({'symbol': 'BTCUSD'}, [{}] * 50001):
+            response = self.post(body)
+            self.assertEqual(response.status_code,
+                             status.HTTP_400_BAD_REQUEST)
+            self.assertIn('non_field_errors', response.data)
+
+    def test_ndjson(self):
+        items = create_items('BTCUSD', 3)
+        body = '\n'.join(json.dumps(item) for item in items) + '\n\n'
+        response = self.post(body, 'application/x-ndjson')
+        self.assertEqual(response.data['saved'], 3)
+        response = self.post('{"symbol": "BTCUSD"}\n{',
+                             'application/x-ndjson')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('line 2', response.data['detail'])
+
+    def test_ten_thousand_items(self):
+        items = create_items('BTCUSD', 10000, datetime.date(1990, 1, 1))
+        start = time.perf_counter()
+        response = self.post(items)
+        elapsed = time.perf_counter() - start
+        self.assertEqual(response.data['saved'], 10000)
+        self.assertLess(elapsed, 5)
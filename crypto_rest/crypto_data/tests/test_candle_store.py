@@ -0,0 +1,116 @@
+import tempfile
+import numpy as np
+from django.test import SimpleTestCase, TestCase, override_settings
+from data_loader.bulk_loader import bulk_save_candle_columns
+from data_loader.kraken_data_loader import create_OHLC_columns
+from data_loader.save_crypto_names import create_kraken_symbols
+from crypto_data.candle_store import (CandleStore, StoredCandles,
+                                      export_candles)
+from crypto_data.models import KrakenCandle
+
+
+def create_candles(times, price=1.0):
+    times = np.asarray(times, dtype=np.int64)
+    prices = np.full(len(times), price)
+    return StoredCandles(time=times, open=prices, high=prices, low=prices,
+                         close=prices, vwap=prices, volume=prices * 10,
+                         count=np.ones(len(times), dtype=np.int64))
+
+
+class TestCandleStore(SimpleTestCase):
+    """Test CandleStore"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.store = CandleStore(directory.name)
+
+    def test_read_range_without_copies(self):
+        self.store.append('BTCUSD', 1, create_candles(range(0, 6000, 60)))
+        candles = self.store.read('BTCUSD', 1, start=600, end=1200)
+        self.assertEqual(candles.time.tolist(), list(range(600, 1200, 60)))
+        for column in candles:
+            self.assertIsInstance(column.base, np.memmap)
+            self.assertFalse(column.flags.writeable)
+
+    def test_empty_reads(self):
+        self.assertEqual(len(self.store.read('BTCUSD', 1).time), 0)
+        self.store.append('BTCUSD', 1, create_candles([60]))
+        self.assertEqual(len(self.store.read('BTCUSD', 5).time), 0)
+        self.assertEqual(len(self.store.read('BTCUSD', 1, start=120).time), 0)
+
+    def test_appends_follow_each_other(self):
+        self.store.append('BTCUSD', 1, create_candles([0, 60, 120]))
+        rows = self.store.append('BTCUSD', 1, create_candles([180, 240]))
+        self.assertEqual(rows, 5)
+        self.assertEqual(self.store.read('BTCUSD', 1).time.tolist(),
+                         [0, 60, 120, 180, 240])
+
+    def test_overlapping_candles_replaced(self):
+        """Test the open last candle of a load is updated by the next one and
+        an older batch is merged in time order"""
+        self.store.append('BTCUSD', 1, create_candles([120, 180, 240]))
+        self.store.append('BTCUSD', 1, create_candles([240, 300], price=2.0))
+        self.store.append('BTCUSD', 1, create_candles([0, 60, 180], 3.0))
+        candles = self.store.read('BTCUSD', 1)
+        self.assertEqual(candles.time.tolist(), [0, 60, 120, 180, 240, 300])
+        self.assertEqual(candles.close.tolist(), [3, 3, 1, 3, 2, 2])
+
+    def test_last_duplicate_of_a_batch_wins(self):
+        candles = create_candles([60, 0, 60])
+        candles.close[:] = [1, 2, 3]
+        self.store.append('BTCUSD', 1, candles)
+        self.assertEqual(self.store.read('BTCUSD', 1).close.tolist(), [2, 3])
+
+    def test_clear(self):
+        self.store.append('BTCUSD', 1, create_candles([0]))
+        self.store.clear('BTCUSD', 1)
+        self.assertEqual(self.store.rows('BTCUSD', 1), 0)
+
+
+class TestCandleStoreSync(TestCase):
+    """Test the data loader keeps the candle store in sync"""
+    CANDLES = [
+        [1632441600, "0.58412", "0.58500", "0.58300", "0.58450", "0.58401",
+         "12500.123456789", 42],
+        [1632441900, "0.58450", "0.58600", "0.58400", "0.58550", "0.58500",
+         "8000.5", 17],
+        [1632442200, "nan", "1", "1", "1", "1", "1", 1],
+    ]
+
+    def setUp(self):
+        create_kraken_symbols('USD')
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.store = CandleStore(directory.name)
+
+    def test_loaded_candles_are_stored(self):
+        with override_settings(CANDLE_STORE_DIR=str(self.store.root)), \
+                self.assertLogs('data_loader.bulk_loader'):
+            with self.captureOnCommitCallbacks(execute=True):
+                bulk_save_candle_columns(create_OHLC_columns(self.CANDLES),
+                                         'XRPUSD', 5)
+        candles = self.store.read('XRPUSD', 5)
+        self.assertEqual(candles.time.tolist(), [1632441600, 1632441900])
+        self.assertEqual(candles.volume.tolist(), [12500.12345679, 8000.5])
+        self.assertEqual(candles.count.tolist(), [42, 17])
+
+    def test_nothing_stored_before_commit(self):
+        with override_settings(CANDLE_STORE_DIR=str(self.store.root)), \
+                self.assertLogs('data_loader.bulk_loader'):
+            with self.captureOnCommitCallbacks() as callbacks:
+                bulk_save_candle_columns(create_OHLC_columns(self.CANDLES),
+                                         'XRPUSD', 5)
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(self.store.rows('XRPUSD', 5), 0)
+
+    def test_export_candles(self):
+        with self.assertLogs('data_loader.bulk_loader'):
+            bulk_save_candle_columns(create_OHLC_columns(self.CANDLES),
+                                     'XRPUSD', 5)
+        self.assertEqual(export_candles(self.store, 'XRPUSD', 5), 2)
+        candles = self.store.read('XRPUSD', 5)
+        saved = KrakenCandle.objects.order_by('ts')
+        self.assertEqual(candles.time.tolist(),
+                         [int(c.ts.timestamp()) for c in saved])
+        self.assertEqual(candles.open.tolist(), [float(c.open) for c in saved])
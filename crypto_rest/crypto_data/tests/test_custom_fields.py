@@ -0,0 +1,88 @@
+from decimal import Decimal
+from django.db import connection
+from django.test import TestCase
+from data_loader.save_crypto_names import create_kraken_symbols
+from crypto_data.custom_fields import (to_fixed_point, fixed_point_to_decimal,
+                                       fixed_point_to_string, raw_fixed_point)
+from crypto_data.custom_filters import KrakenOHLCFilter
+from crypto_data.models import KrakenOHLC, KrakenSymbols
+from crypto_data.serializers import KrakenOHLCSerializer
+
+
+class TestFixedPoint(TestCase):
+    """Test fixed point conversions of prices"""
+
+    def test_to_fixed_point_is_exact(self):
+        for price in ('149.92', 149.92, Decimal('149.92')):
+            self.assertEqual(to_fixed_point(price), 14992000000)
+        self.assertEqual(to_fixed_point(0.1), 10000000)
+        self.assertEqual(to_fixed_point('0.000000015'), 2)
+
+    def test_conversions_round_trip(self):
+        for price in ('0.58412345', '149.92', '-3.10', '46000.00'):
+            value = to_fixed_point(price)
+            self.assertEqual(fixed_point_to_string(value), price)
+            self.assertEqual(fixed_point_to_decimal(value), Decimal(price))
+
+    def test_prices_are_scaled_on_save(self):
+        """Test ints, floats, strings and Decimals are prices in currency
+        units, read back as Decimal or as the scaled integer stored"""
+        create_kraken_symbols('USD')
+        row = KrakenOHLC.objects.create(
+            symbol=KrakenSymbols.objects.first(), date='2021-10-01', open=1,
+            high=1.5, low='0.5', close=Decimal('0.00000001'))
+        row.refresh_from_db()
+        self.assertEqual((row.open, row.high, row.low, row.close),
+                         (Decimal('1'), Decimal('1.5'), Decimal('0.5'),
+                          Decimal('0.00000001')))
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT open, high, low, close FROM '
+                           'crypto_data_krakenohlc')
+            self.assertEqual(cursor.fetchone(),
+                             (100000000, 150000000, 50000000, 1))
+        self.assertTrue(KrakenOHLC.objects.filter(high=Decimal('1.5'),
+                                                  open__gte=1).exists())
+        raw = (KrakenOHLC.objects
+               .annotate(raw_open=raw_fixed_point('open'))
+               .values_list('raw_open', flat=True))
+        self.assertEqual(list(raw), [100000000])
+
+
+class TestFixedPointSerializer(TestCase):
+    """Test KrakenOHLCSerializer prices round trip exactly"""
+
+    def setUp(self):
+        create_kraken_symbols('USD')
+
+    def test_sub_cent_prices_round_trip(self):
+        data = {'open': '0.58412345', 'high': '0.586', 'low': '0.5831',
+                'close': '0.5845', 'symbol': 'ADAUSD',
+                'date': '2021-10-01'}
+        serializer = KrakenOHLCSerializer(data=data, context={'request': None})
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        instance = serializer.save()
+        instance.refresh_from_db()
+        self.assertEqual(instance.open, Decimal('0.58412345'))
+        represented = KrakenOHLCSerializer(instance,
+                                           context={'request': None}).data
+        for field in ('open', 'high', 'low', 'close'):
+            self.assertEqual(represented[field], data[field])
+
+    def test_prices_past_decimal_places_are_rejected(self):
+        data = {'open': '0.123456789', 'high': '1', 'low': '1', 'close': '1',
+                'symbol': 'ADAUSD', 'date': '2021-10-01'}
+        serializer = KrakenOHLCSerializer(data=data, context={'request': None})
+        self.assertFalse(serializer.is_valid())
+        self.assertIn('open', serializer.errors)
+
+    def test_price_filters_are_scaled(self):
+        data = {'open': '0.5', 'high': '0.6', 'low': '0.4', 'close': '0.55',
+                'symbol': 'ADAUSD', 'date': '2021-10-01'}
+        serializer = KrakenOHLCSerializer(data=data, context={'request': None})
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        queryset = KrakenOHLC.objects.all()
+        self.assertEqual(KrakenOHLCFilter({'min_open': '0.5'},
+                                          queryset=queryset).qs.count(), 1)
+        self.assertEqual(KrakenOHLCFilter({'min_open': '0.50000001'},
+                                          queryset=queryset).qs.count(), 0)
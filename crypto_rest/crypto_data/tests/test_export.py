@@ -0,0 +1,85 @@
+from decimal import Decimal
+import csv
+import datetime
+import io
+import json
+from django.db import connection
+from django.test import TestCase
+from rest_framework import status
+from rest_framework.test import APIRequestFactory
+from data_loader.save_crypto_names import create_kraken_symbols
+from crypto_data import views
+from crypto_data.export import EXPORT_FIELDS
+from crypto_data.models import KrakenOHLC, KrakenSymbols
+from crypto_data.partitions import ensure_partitions
+
+
+class TestKrakenOHLCExport(TestCase):
+    """Test KrakenOHLCExport"""
+    START = datetime.date(2021, 8, 1)
+
+    @classmethod
+    def setUpTestData(cls):
+        create_kraken_symbols('USD')
+        ensure_partitions(KrakenOHLC, cls.START, cls.START)
+        cls.btc, cls.eth = KrakenSymbols.objects.filter(
+            symbol__in=['BTCUSD', 'ETHUSD']).order_by('symbol')
+        KrakenOHLC.objects.bulk_create(
+            KrakenOHLC(symbol=symbol, date=cls.START + datetime.timedelta(d),
+                       open=d, high=d + 1,
+                       low=Decimal('0.5'), close=d)
+            for symbol in (cls.btc, cls.eth) for d in range(10))
+
+    def setUp(self):
+        self.factory = APIRequestFactory()
+
+    def get(self, params, chunk_size=4):
+        request = self.factory.get('/kraken-ohlc/export/', params)
+        return views.KrakenOHLCExport.as_view(chunk_size=chunk_size)(request)
+
+    def test_csv(self):
+        response = self.get({'symbol': self.btc.id, 'min_open': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        chunks = list(response.streaming_content)
+        # header and 8 rows in chunks of 4 rows
+        self.assertEqual(len(chunks), 2)
+        rows = list(csv.reader(io.StringIO(b''.join(chunks).decode())))
+        self.assertEqual(rows[0], list(EXPORT_FIELDS))
+        self.assertEqual(rows[1], ['BTCUSD', '2021-08-03', '2.00', '3.00',
+                                   '0.50', '2.00'])
+        self.assertEqual(len(rows), 9)
+
+    def test_ndjson(self):
+        response = self.get({'output': 'ndjson',
+                             'start_date': '2021-08-09'})
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        items = [json.loads(line) for line in lines]
+        self.assertEqual([(i['symbol'], i['date']) for i in items],
+                         [('BTCUSD', '2021-08-09'), ('BTCUSD', '2021-08-10'),
+                          ('ETHUSD', '2021-08-09'), ('ETHUSD', '2021-08-10')])
+        self.assertEqual(items[0]['high'], '9.00')
+
+    def test_rows_are_read_from_server_side_cursor(self):
+        content = iter(self.get({}).streaming_content)
+        # the header and the first chunk are sent before the rest is read
+        self.assertEqual(next(content).decode().count('\n'), 5)
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT count(*) FROM pg_cursors "
+                           "WHERE name LIKE '_django_curs_%%'")
+            self.assertEqual(cursor.fetchone(), (1, ))
+        self.assertEqual(sum(chunk.decode().count('\n')
+                             for chunk in content), 16)
+
+    def test_empty_export(self):
+        response = self.get({'end_date': '2020-01-01'})
+        self.assertEqual(b''.join(response.streaming_content).decode(),
+                         ','.join(EXPORT_FIELDS) + '\r\n')
+
+    def test_invalid_parameters(self):
+        for params in ({'output': 'xml'}, {'start_date': 'x'}):
+            response = self.get(params)
+            self.assertEqual(response.status_code,
+                             status.HTTP_400_BAD_REQUEST)
+            self.assertIn(next(iter(params)), response.data)
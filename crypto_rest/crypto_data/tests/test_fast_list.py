@@ -0,0 +1,67 @@
+from decimal import Decimal
+import datetime
+from urllib.parse import urlsplit, parse_qsl
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory
+from data_loader.save_crypto_names import create_kraken_symbols
+from crypto_data import views
+from crypto_data.models import KrakenOHLC, KrakenSymbols
+from crypto_data.partitions import ensure_partitions
+from crypto_data.symbol_registry import symbol_registry
+
+
+@override_settings(RESPONSE_CACHE_TIMEOUT=0)
+class TestFastOHLCList(TestCase):
+    """Test KrakenOHLCList responses are the same with OHLC_FAST_LIST"""
+    START = datetime.date(2021, 8, 1)
+
+    @classmethod
+    def setUpTestData(cls):
+        create_kraken_symbols('USD')
+        ensure_partitions(KrakenOHLC, cls.START, cls.START)
+        KrakenOHLC.objects.bulk_create(
+            KrakenOHLC(symbol=symbol, date=cls.START + datetime.timedelta(d),
+                       open=Decimal(f'{d}.125'),
+                       high=Decimal('0.00000001'),
+                       low=-d, close=d * 100)
+            for symbol in KrakenSymbols.objects.all() for d in range(12))
+        cls.symbol = KrakenSymbols.objects.get(symbol='ETHUSD')
+
+    def setUp(self):
+        self.factory = APIRequestFactory()
+
+    def get(self, url, fast):
+        split = urlsplit(url)
+        request = self.factory.get(split.path, dict(parse_qsl(split.query)),
+                                   HTTP_HOST='example.com')
+        with override_settings(OHLC_FAST_LIST=fast):
+            with CaptureQueriesContext(connection) as queries:
+                response = views.KrakenOHLCList.as_view()(request)
+                response.render()
+        return response, len(queries)
+
+    def test_same_content(self):
+        for url in ('/crypto-data/kraken-ohlc/?page_size=7',
+                    f'/crypto-data/kraken-ohlc/?symbol={self.symbol.id}'
+                    f'&min_open=3&end_date=2021-08-10',
+                    '/crypto-data/kraken-ohlc/?search=ETH&page_size=20',
+                    '/crypto-data/kraken-ohlc/?start_date=x'):
+            # every page forward
+            while url is not None:
+                response, _ = self.get(url, fast=False)
+                fast, _ = self.get(url, fast=True)
+                self.assertEqual(fast.status_code, response.status_code)
+                self.assertEqual(fast.content, response.content)
+                url = response.data.get('next')
+
+    def test_page_read_in_a_query(self):
+        # symbols are read once by the registry, not per page or row, the
+        # other query reads the versions of the data for the validators
+        symbol_registry.id_of('ETHUSD')
+        for fast in (True, False):
+            with self.subTest(fast=fast):
+                _, queries = self.get(
+                    '/crypto-data/kraken-ohlc/?page_size=20', fast=fast)
+                self.assertEqual(queries, 2)
@@ -0,0 +1,174 @@
+from decimal import Decimal
+import datetime
+from unittest.mock import patch
+from urllib.parse import urlsplit, parse_qsl
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+from rest_framework.test import APIRequestFactory, force_authenticate
+from data_loader.bulk_loader import bulk_save_OHLC_columns
+from data_loader.kraken_data_loader import create_OHLC_columns
+from data_loader.save_crypto_names import create_kraken_symbols
+from crypto_data import views
+from crypto_data.models import KrakenOHLC, KrakenOHLCVersion, KrakenSymbols
+from crypto_data.ohlc_cache import HotRangeCache, ohlc_cache
+from crypto_data.ohlc_versions import bump_ohlc_versions, ohlc_version
+from crypto_data.partitions import ensure_partitions
+
+
+TODAY = datetime.datetime.now(datetime.timezone.utc).date()
+DAY = datetime.timedelta(days=1)
+
+
+def link_params(link: str):
+    return dict(parse_qsl(urlsplit(link).query))
+
+
+@override_settings(RESPONSE_CACHE_TIMEOUT=0)
+class TestHotRangeCache(TestCase):
+    """Test KrakenOHLCList served from the OHLC cache, responses are not
+    cached"""
+
+    @classmethod
+    def setUpTestData(cls):
+        create_kraken_symbols('USD')
+        ensure_partitions(KrakenOHLC, TODAY - 60 * DAY, TODAY + 2 * DAY)
+        cls.symbols = list(KrakenSymbols.objects.filter(
+            symbol__in=['BTCUSD', 'ETHUSD']).order_by('id'))
+        KrakenOHLC.objects.bulk_create(
+            KrakenOHLC(symbol=symbol, date=TODAY - d * DAY,
+                       open=d, high=d + 1,
+                       low=d - 1, close=d)
+            for symbol in cls.symbols for d in range(1, 61))
+
+    def setUp(self):
+        ohlc_cache.invalidate()
+        self.factory = APIRequestFactory()
+        self.btc = self.symbols[0]
+        self.params = {'symbol': self.btc.id,
+                       'start_date': str(TODAY - 30 * DAY)}
+
+    def get(self, params, primary=False, view=views.KrakenOHLCList):
+        headers = {'HTTP_X_READ_PRIMARY': '1'} if primary else {}
+        return view.as_view()(self.factory.get('/', params, **headers))
+
+    def walk(self, params, primary=False):
+        """every page forward and the one before the last going back"""
+        pages = [self.get(params, primary)]
+        while pages[-1].data['next'] is not None:
+            pages.append(self.get(link_params(pages[-1].data['next']),
+                                  primary))
+        pages.append(self.get(link_params(pages[-1].data['previous']),
+                              primary))
+        return [page.data for page in pages]
+
+    def test_cached_pages_match_database(self):
+        misses = ohlc_cache.stats().misses
+        for params in ({**self.params, 'page_size': 7},
+                       {**self.params, 'end_date': str(TODAY - 10 * DAY),
+                        'page_size': 4}):
+            cached = self.walk(params)
+            self.assertEqual(cached, self.walk(params, primary=True))
+        # the symbol is read once for every range
+        self.assertEqual(ohlc_cache.stats().misses, misses + 1)
+        self.assertEqual(cached[0]['results'][0]['date'],
+                         str(TODAY - 30 * DAY))
+
+    def test_hits_only_query_versions(self):
+        self.get(self.params)
+        hits = ohlc_cache.stats().hits
+        with patch.object(ohlc_cache, 'revalidate', 60):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.get(self.params)
+        # the versions of the response validators, the one of the symbol
+        # was checked by the previous request
+        self.assertEqual(len(queries), 1)
+        self.assertIn(KrakenOHLCVersion._meta.db_table, queries[0]['sql'])
+        self.assertEqual(len(response.data['results']), 10)
+        self.assertEqual(ohlc_cache.stats().hits, hits + 1)
+        with patch.object(ohlc_cache, 'revalidate', 0):
+            with CaptureQueriesContext(connection) as queries:
+                self.get(self.params)
+        # the version of the symbol is checked again
+        self.assertEqual(len(queries), 2)
+        for query in queries:
+            self.assertIn(KrakenOHLCVersion._meta.db_table, query['sql'])
+        self.assertEqual(ohlc_cache.stats().hits, hits + 2)
+
+    def test_other_requests_go_to_database(self):
+        for params in ({**self.params, 'min_open': 3},
+                       {'symbol': self.btc.id},
+                       {**self.params, 'start_date': '2021-01-01'},
+                       {**self.params, 'symbol': 'x'}):
+            self.get(params)
+        self.assertEqual(ohlc_cache.stats().symbols, 0)
+
+    def test_loaded_batches_extend_cached_symbol(self):
+        self.get(self.params)
+        misses = ohlc_cache.stats().misses
+        times = [int(datetime.datetime.combine(
+            date, datetime.time(), datetime.timezone.utc).timestamp())
+            for date in (TODAY - DAY, TODAY)]
+        columns = create_OHLC_columns([[t, '7', '8', '6', '7.5', '7', '1', 1]
+                                       for t in times])
+        version = ohlc_version(self.btc.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            bulk_save_OHLC_columns(columns, 'BTCUSD')
+        self.assertEqual(ohlc_version(self.btc.id), version + 1)
+        response = self.get({**self.params, 'start_date': str(TODAY - DAY)})
+        self.assertEqual([(r['date'], r['close'])
+                          for r in response.data['results']],
+                         [(str(TODAY - DAY), '7.50'), (str(TODAY), '7.50')])
+        self.assertEqual(ohlc_cache.stats().misses, misses)
+
+    def test_saved_rows_invalidate_cached_symbol(self):
+        self.get(self.params)
+        row = KrakenOHLC.objects.get(symbol=self.btc, date=TODAY - 30 * DAY)
+        row.close = Decimal('99.5')
+        row.save()
+        self.assertEqual(self.get(self.params).data['results'][0]['close'],
+                         '99.50')
+
+    def test_writes_of_other_processes_reload_cached_symbol(self):
+        """Test rows written without this process signals, i.e by the data
+        loader on another process, are served once their version is
+        bumped"""
+        self.get(self.params)
+        misses = ohlc_cache.stats().misses
+        KrakenOHLC.objects.filter(symbol=self.btc,
+                                  date=TODAY - 30 * DAY).update(close=99)
+        self.assertEqual(self.get(self.params).data['results'][0]['close'],
+                         '30.00')
+        bump_ohlc_versions([self.btc.id])
+        # until the version is checked again
+        with patch.object(ohlc_cache, 'revalidate', 60):
+            self.assertEqual(
+                self.get(self.params).data['results'][0]['close'], '30.00')
+        with patch.object(ohlc_cache, 'revalidate', 0):
+            self.assertEqual(
+                self.get(self.params).data['results'][0]['close'], '99.00')
+        self.assertEqual(ohlc_cache.stats().misses, misses + 1)
+
+    def test_least_recently_used_evicted(self):
+        cache = HotRangeCache(max_size=1, days=400, ttl=60)
+        btc, eth = (s.id for s in self.symbols)
+        cache.get(btc)
+        cache.get(eth)
+        stats = cache.stats()
+        self.assertEqual((stats.misses, stats.evictions, stats.symbols),
+                         (2, 1, 1))
+        cache.get(eth)
+        self.assertEqual(cache.stats().hits, 1)
+        self.assertEqual(stats.size, 60 * 44)
+
+    def test_stats_view(self):
+        request = self.factory.get('/')
+        response = views.KrakenOHLCCacheStats.as_view()(request)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        force_authenticate(request, User.objects.create(username='staff',
+                                                        is_staff=True))
+        response = views.KrakenOHLCCacheStats.as_view()(request)
+        self.assertEqual(set(response.data), {'hits', 'misses', 'evictions',
+                                              'symbols', 'size', 'max_size'})
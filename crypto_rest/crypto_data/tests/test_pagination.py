@@ -0,0 +1,106 @@
+import datetime
+from urllib.parse import urlsplit, parse_qsl
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+from rest_framework.test import APIRequestFactory, force_authenticate
+from data_loader.save_crypto_names import create_kraken_symbols
+from crypto_data import views
+from crypto_data.custom_pagination import MAX_PAGE_SIZE
+from crypto_data.models import KrakenOHLC, KrakenSymbols
+from crypto_data.partitions import ensure_partitions
+
+
+class TestKrakenOHLCKeysetPagination(TestCase):
+    """Test KrakenOHLCList pages with keyset cursors"""
+
+    @classmethod
+    def setUpTestData(cls):
+        create_kraken_symbols('USD')
+        start = datetime.date(2021, 9, 20)
+        ensure_partitions(KrakenOHLC, start, datetime.date(2021, 10, 31))
+        price = 10
+        KrakenOHLC.objects.bulk_create(
+            KrakenOHLC(symbol=symbol, date=start + datetime.timedelta(days=d),
+                       open=price, high=price, low=price, close=price)
+            for symbol in KrakenSymbols.objects.filter(
+                symbol__in=['BTCUSD', 'ETHUSD'])
+            for d in range(20))
+        cls.expected = list(KrakenOHLC.objects
+                            .filter(symbol__symbol__in=['BTCUSD', 'ETHUSD'])
+                            .order_by('symbol_id', 'date', 'id')
+                            .values_list('symbol__symbol', 'date'))
+
+    def setUp(self):
+        self.factory = APIRequestFactory()
+
+    def get(self, url='crypto-data/kraken-ohlc/', user=None, **params):
+        split = urlsplit(url)
+        request = self.factory.get(split.path,
+                                   {**dict(parse_qsl(split.query)), **params})
+        if user is not None:
+            force_authenticate(request, user)
+        return views.KrakenOHLCList.as_view()(request)
+
+    def rows(self, response):
+        return [(r['symbol'], datetime.date.fromisoformat(r['date']))
+                for r in response.data['results']]
+
+    def test_pages_follow_each_other_both_ways(self):
+        pages = [self.get(page_size=7)]
+        while pages[-1].data['next'] is not None:
+            pages.append(self.get(pages[-1].data['next']))
+        self.assertEqual(len(pages), 6)
+        self.assertEqual([row for page in pages for row in self.rows(page)],
+                         self.expected)
+        self.assertIsNone(pages[0].data['previous'])
+        # walking back gives the same pages
+        previous = self.get(pages[-1].data['previous'])
+        self.assertEqual(self.rows(previous), self.rows(pages[-2]))
+        self.assertEqual(self.rows(self.get(previous.data['next'])),
+                         self.rows(pages[-1]))
+
+    def test_no_count_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.get(page_size=5)
+        self.assertNotIn('count', response.data)
+        self.assertFalse(any('COUNT(' in q['sql'] for q in queries))
+
+    def test_filters_apply_to_every_page(self):
+        eth = KrakenSymbols.objects.get(symbol='ETHUSD')
+        first = self.get(page_size=15, symbol=eth.id)
+        second = self.get(first.data['next'])
+        self.assertEqual(self.rows(first) + self.rows(second),
+                         self.expected[20:])
+        self.assertIsNone(second.data['next'])
+
+    def test_page_size_ceiling(self):
+        response = self.get(page_size=100)
+        self.assertEqual(len(response.data['results']), MAX_PAGE_SIZE)
+        staff = User.objects.create(username='staff', is_staff=True)
+        response = self.get(page_size=100, user=staff)
+        self.assertEqual(len(response.data['results']), 40)
+
+    def test_invalid_cursor(self):
+        for cursor in ('not base64', 'cD0x', 'cD0xfDJ8eA=='):
+            response = self.get(cursor=cursor)
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_deep_pages_start_on_the_index(self):
+        """Test a page is read from its position on the index instead of
+        skipping the rows before it"""
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        last = self.get(page_size=20).data['next']
+        with CaptureQueriesContext(connection) as queries:
+            self.get(last, page_size=20)
+        select = next(q['sql'] for q in queries
+                      if '"crypto_data_krakenohlc"' in q['sql'])
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN {select}')
+            plan = '\n'.join(row[0] for row in cursor.fetchall())
+        self.assertIn('Index Cond: (ROW(', plan)
+        self.assertNotIn('OFFSET', select)
@@ -0,0 +1,103 @@
+import datetime
+from django.db import connection
+from django.test import TestCase
+from data_loader.save_crypto_names import create_kraken_symbols
+from data_loader.bulk_loader import (bulk_save_OHLC_data_on_database,
+                                     bulk_save_candle_columns)
+from data_loader.kraken_data_loader import create_OHLC_columns
+from crypto_data.custom_filters import KrakenOHLCFilter
+from crypto_data.models import KrakenOHLC, KrakenCandle, KrakenSymbols
+from crypto_data.partitions import ensure_partitions
+
+
+OHLC_TABLE = KrakenOHLC._meta.db_table
+CANDLE_TABLE = KrakenCandle._meta.db_table
+
+
+def saved_partitions(model):
+    """partition of every saved row"""
+    return list(model.objects.extra(select={'partition': 'tableoid::regclass'})
+                .order_by('id').values_list('partition', flat=True))
+
+
+class TestEnsurePartitions(TestCase):
+    """Test method ensure_partitions"""
+
+    def setUp(self):
+        create_kraken_symbols('USD')
+
+    def test_monthly_partitions_are_created_once(self):
+        created = ensure_partitions(KrakenOHLC, datetime.date(2021, 1, 15),
+                                    datetime.date(2021, 3, 2))
+        self.assertEqual(created, [f'{OHLC_TABLE}_p2021_01',
+                                   f'{OHLC_TABLE}_p2021_02',
+                                   f'{OHLC_TABLE}_p2021_03'])
+        self.assertEqual(ensure_partitions(KrakenOHLC,
+                                           datetime.date(2021, 2, 1),
+                                           datetime.date(2021, 2, 28)), [])
+
+    def test_daily_partitions(self):
+        created = ensure_partitions(KrakenCandle,
+                                    datetime.date(2021, 12, 31),
+                                    datetime.date(2022, 1, 1), interval=5)
+        self.assertEqual(created, [f'{CANDLE_TABLE}_minutes_p2021_12_31',
+                                   f'{CANDLE_TABLE}_minutes_p2022_01_01'])
+
+    def test_candle_partitions_by_interval(self):
+        """Test candles get partitions of the period of their interval,
+        none for intervals Kraken does not provide"""
+        first, last = datetime.date(2021, 12, 31), datetime.date(2022, 1, 1)
+        self.assertEqual(ensure_partitions(KrakenCandle, first, last,
+                                           interval=60),
+                         [f'{CANDLE_TABLE}_hours_p2021_12',
+                          f'{CANDLE_TABLE}_hours_p2022_01'])
+        self.assertEqual(ensure_partitions(KrakenCandle, first, last,
+                                           interval=1440),
+                         [f'{CANDLE_TABLE}_days_p2021',
+                          f'{CANDLE_TABLE}_days_p2022'])
+        self.assertEqual(ensure_partitions(KrakenCandle, first, last,
+                                           interval=7), [])
+
+    def test_rows_on_default_partition_are_moved(self):
+        """Test rows saved before their partition existed are moved out of
+        the default partition when it is created"""
+        KrakenOHLC.objects.create(symbol=KrakenSymbols.objects.first(),
+                                  date='2015-05-10', open=1, high=2, low=1,
+                                  close=1)
+        self.assertEqual(saved_partitions(KrakenOHLC),
+                         [f'{OHLC_TABLE}_default'])
+        ensure_partitions(KrakenOHLC, datetime.date(2015, 5, 1),
+                          datetime.date(2015, 5, 1))
+        self.assertEqual(saved_partitions(KrakenOHLC),
+                         [f'{OHLC_TABLE}_p2015_05'])
+
+    def test_bulk_loads_create_partitions(self):
+        rows = [{'open': 1.5, 'high': 2, 'low': 1, 'close': 1.7,
+                 'date': '2021-10-31'},
+                {'open': 1.5, 'high': 2, 'low': 1, 'close': 1.7,
+                 'date': '2021-11-01'}]
+        bulk_save_OHLC_data_on_database(rows, 'BTCUSD')
+        self.assertEqual(saved_partitions(KrakenOHLC),
+                         [f'{OHLC_TABLE}_p2021_10', f'{OHLC_TABLE}_p2021_11'])
+        columns = create_OHLC_columns([
+            [1632441600, "1", "1", "1", "1", "1", "1", 1]])
+        bulk_save_candle_columns(columns, 'BTCUSD', 5)
+        bulk_save_candle_columns(columns, 'BTCUSD', 1440)
+        self.assertEqual(saved_partitions(KrakenCandle),
+                         [f'{CANDLE_TABLE}_minutes_p2021_09_24',
+                          f'{CANDLE_TABLE}_days_p2021'])
+
+    def test_date_filters_scan_requested_months(self):
+        """Test filtering the list by dates prunes the other partitions"""
+        ensure_partitions(KrakenOHLC, datetime.date(2021, 1, 1),
+                          datetime.date(2021, 3, 1))
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        filterset = KrakenOHLCFilter({'start_date': '2021-02-01',
+                                      'end_date': '2021-02-28'},
+                                     queryset=KrakenOHLC.objects.all())
+        plan = filterset.qs.explain()
+        self.assertIn(f'{OHLC_TABLE}_p2021_02', plan)
+        self.assertNotIn(f'{OHLC_TABLE}_p2021_01', plan)
+        self.assertNotIn(f'{OHLC_TABLE}_p2021_03', plan)
+        self.assertNotIn(f'{OHLC_TABLE}_default', plan)
@@ -0,0 +1,62 @@
+"""Test the queries on KrakenOHLC are planned on its covering index, the
+index is created on every partition of the table"""
+import datetime
+from django.db import connection
+from django.test import TestCase
+from data_display.load_data import LoadDataFromPostSQl
+from data_loader.save_crypto_names import create_kraken_symbols
+from crypto_data.custom_filters import KrakenOHLCFilter
+from crypto_data.models import KrakenOHLC, KrakenSymbols
+from crypto_data.partitions import ensure_partitions
+
+
+OHLC_TABLE = KrakenOHLC._meta.db_table
+
+
+class TestKrakenOHLCQueryPlans(TestCase):
+    """The test table is tiny, sequential and bitmap scans are disabled so
+    the plan shows how the queries would run on a big table"""
+
+    @classmethod
+    def setUpTestData(cls):
+        create_kraken_symbols('USD')
+        start = datetime.date(2021, 8, 1)
+        ensure_partitions(KrakenOHLC, start, datetime.date(2021, 9, 30))
+        KrakenOHLC.objects.bulk_create(
+            KrakenOHLC(symbol=symbol, date=start + datetime.timedelta(days=d),
+                       open=10, high=12,
+                       low=9, close=11)
+            for symbol in KrakenSymbols.objects.all()
+            for d in range(45))
+
+    def setUp(self):
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute('SET LOCAL enable_bitmapscan = off')
+
+    def assertIndexOnly(self, plan):
+        # partitions name their copy of the index after themselves
+        self.assertRegex(plan, rf'Index Only Scan using \S+ on '
+                               rf'{OHLC_TABLE}_p2021_08 ')
+        self.assertNotIn('Seq Scan', plan)
+
+    def test_load_data_query(self):
+        """Test the query of LoadDataFromPostSQl, symbol and date__gte"""
+        load_data = LoadDataFromPostSQl('BTCUSD', '2021-08-15')
+        load_data.load_data()
+        plan = load_data.get_response().explain()
+        self.assertIndexOnly(plan)
+
+    def test_list_filters_query(self):
+        """Test the KrakenOHLCList query filtering by symbol and prices is
+        answered in the default ordering without sorting, partitions are
+        merged in order"""
+        symbol = KrakenSymbols.objects.get(symbol='ETHUSD')
+        filterset = KrakenOHLCFilter({'symbol': symbol.id,
+                                      'min_open': 5,
+                                      'max_close': 20},
+                                     queryset=KrakenOHLC.objects.all())
+        plan = filterset.qs.explain()
+        self.assertIndexOnly(plan)
+        self.assertNotRegex(plan, r'(^|->  )Sort ')
@@ -0,0 +1,264 @@
+import datetime
+from unittest.mock import patch
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db import connection
+from django.test import TestCase
+from django.utils import timezone
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory, force_authenticate
+from data_loader.bulk_loader import bulk_save_OHLC_columns
+from data_loader.kraken_data_loader import create_OHLC_columns
+from data_loader.save_crypto_names import create_kraken_symbols
+from crypto_data import views
+from crypto_data.models import (KrakenDeletions, KrakenOHLC,
+                                KrakenOHLCVersion, KrakenSymbols)
+from crypto_data.ohlc_versions import bump_ohlc_versions
+from crypto_data.partitions import ensure_partitions
+from crypto_data.response_cache import (response_cache, generation_key,
+                                        get_generations, bump_generations)
+
+
+class ResponseCacheTestCase(TestCase):
+    """OHLC of two symbols and requests to the read endpoints"""
+    START = datetime.date(2021, 9, 1)
+
+    @classmethod
+    def setUpTestData(cls):
+        create_kraken_symbols('USD')
+        ensure_partitions(KrakenOHLC, cls.START, cls.START)
+        cls.btc, cls.eth = KrakenSymbols.objects.filter(
+            symbol__in=['BTCUSD', 'ETHUSD']).order_by('symbol')
+        price = 10
+        KrakenOHLC.objects.bulk_create(
+            KrakenOHLC(symbol=symbol, date=cls.START + datetime.timedelta(d),
+                       open=price, high=price, low=price, close=price)
+            for symbol in (cls.btc, cls.eth) for d in range(5))
+
+    def setUp(self):
+        response_cache().clear()
+        self.factory = APIRequestFactory()
+
+    def written_ago(self, seconds):
+        """take every symbol and OHLC as written seconds ago"""
+        written = timezone.now() - datetime.timedelta(seconds=seconds)
+        KrakenSymbols.objects.update(updated=written)
+        KrakenOHLCVersion.objects.update(modified=written)
+
+    def get(self, view, url, user=None, **headers):
+        request = self.factory.get(url, **headers)
+        if user is not None:
+            force_authenticate(request, user)
+        with CaptureQueriesContext(connection) as queries:
+            response = view.as_view()(request)
+        return response, len(queries)
+
+
+class TestResponseCache(ResponseCacheTestCase):
+    """Test read endpoints served from the response cache"""
+
+    def ohlc(self, symbol):
+        return self.get(views.KrakenOHLCList,
+                        f'/kraken-ohlc/?symbol={symbol.id}&page_size=3')
+
+    def test_responses_are_cached(self):
+        for view, url in ((views.KrakenOHLCList, '/kraken-ohlc/?page_size=3'),
+                          (views.KrakenSymbolsList, '/kraken-symbols/'),
+                          (views.APIRoot, '/')):
+            first, _ = self.get(view, url)
+            cached, queries = self.get(view, url)
+            self.assertEqual(queries, 0)
+            self.assertEqual(cached.data, first.data)
+
+    def test_query_parameters_order_does_not_matter(self):
+        url = f'/kraken-ohlc/?symbol={self.btc.id}&page_size=2'
+        self.get(views.KrakenOHLCList, url)
+        response, queries = self.get(
+            views.KrakenOHLCList,
+            f'/kraken-ohlc/?page_size=2&symbol={self.btc.id}')
+        self.assertEqual(queries, 0)
+        response, queries = self.get(views.KrakenOHLCList,
+                                     f'{url}&start_date=2021-09-02')
+        self.assertNotEqual(queries, 0)
+        self.assertEqual(response.data['results'][0]['date'], '2021-09-02')
+
+    def test_loaded_symbol_invalidates_its_responses(self):
+        self.ohlc(self.btc)
+        self.ohlc(self.eth)
+        self.get(views.KrakenOHLCList, '/kraken-ohlc/')
+        columns = create_OHLC_columns([[1630454400, '11', '12', '10', '11.5',
+                                        '11', '1', 1]])
+        with self.captureOnCommitCallbacks(execute=True):
+            bulk_save_OHLC_columns(columns, 'BTCUSD')
+        response, queries = self.ohlc(self.btc)
+        self.assertNotEqual(queries, 0)
+        self.assertEqual(response.data['results'][0]['close'], '11.50')
+        # responses of other symbols are still valid
+        _, queries = self.ohlc(self.eth)
+        self.assertEqual(queries, 0)
+        _, queries = self.get(views.KrakenOHLCList, '/kraken-ohlc/')
+        self.assertNotEqual(queries, 0)
+
+    def test_saved_symbol_invalidates_symbol_list(self):
+        self.get(views.KrakenSymbolsList, '/kraken-symbols/')
+        self.ohlc(self.eth)
+        self.btc.coin_name = 'Bitcoin Core'
+        self.btc.save()
+        _, queries = self.get(views.KrakenSymbolsList, '/kraken-symbols/')
+        self.assertNotEqual(queries, 0)
+        _, queries = self.ohlc(self.eth)
+        self.assertNotEqual(queries, 0)
+
+    def test_authenticated_and_primary_reads_skip_cache(self):
+        self.get(views.KrakenSymbolsList, '/kraken-symbols/')
+        user = User.objects.create(username='user')
+        _, queries = self.get(views.KrakenSymbolsList, '/kraken-symbols/',
+                              user=user)
+        self.assertNotEqual(queries, 0)
+        _, queries = self.get(views.KrakenSymbolsList, '/kraken-symbols/',
+                              HTTP_X_READ_PRIMARY='1')
+        self.assertNotEqual(queries, 0)
+
+    def test_responses_are_not_cached_within_replica_lag(self):
+        """Test responses computed while a replica might not see the last
+        write of their data are not cached until it was written long
+        enough ago"""
+        with patch.object(views.KrakenOHLCList, 'replica_lag_bound',
+                          return_value=5):
+            bump_ohlc_versions([self.btc.id])
+            self.ohlc(self.btc)
+            _, queries = self.ohlc(self.btc)
+            self.assertNotEqual(queries, 0)
+            self.written_ago(5)
+            self.ohlc(self.btc)
+            _, queries = self.ohlc(self.btc)
+            self.assertEqual(queries, 0)
+
+    def test_cache_is_shared_by_processes(self):
+        """Test generations bumped through the cache of a process are seen
+        through a cache of its own, as the one of another process"""
+        other = caches.create_connection(settings.RESPONSE_CACHE)
+        generation, = get_generations(['test'])
+        bump_generations(['test'])
+        self.assertEqual(other.get(generation_key('test')), generation + 1)
+
+    def test_generations_never_go_back(self):
+        generation, = get_generations(['test'])
+        bump_generations(['test'])
+        response_cache().delete(generation_key('test'))
+        bump_generations(['test'])
+        self.assertNotIn(get_generations(['test'])[0],
+                         (generation, generation + 1))
+
+
+class TestConditionalGet(ResponseCacheTestCase):
+    """Test ETag and Last-Modified of the read endpoints"""
+
+    def btc_ohlc(self, **headers):
+        return self.get(views.KrakenOHLCList,
+                        f'/kraken-ohlc/?symbol={self.btc.id}', **headers)
+
+    def test_not_modified(self):
+        self.written_ago(3600)
+        for view, url in ((views.KrakenOHLCList, '/kraken-ohlc/?page_size=3'),
+                          (views.KrakenSymbolsList, '/kraken-symbols/')):
+            response, _ = self.get(view, url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['Cache-Control'], 'no-cache')
+            for headers in ({'HTTP_IF_NONE_MATCH': response['ETag']},
+                            {'HTTP_IF_MODIFIED_SINCE':
+                             response['Last-Modified']}):
+                not_modified, queries = self.get(view, url, **headers)
+                self.assertEqual(not_modified.status_code, 304)
+                self.assertEqual(not_modified['ETag'], response['ETag'])
+                self.assertEqual(queries, 0)
+
+    def test_no_validators_right_after_writes(self):
+        response, _ = self.btc_ohlc()
+        self.assertFalse(response.has_header('ETag'))
+        self.assertFalse(response.has_header('Last-Modified'))
+
+    def test_loaded_symbol_changes_its_validators(self):
+        self.written_ago(3600)
+        btc, _ = self.btc_ohlc()
+        eth, _ = self.get(views.KrakenOHLCList,
+                          f'/kraken-ohlc/?symbol={self.eth.id}')
+        columns = create_OHLC_columns([[1630454400, '11', '12', '10', '11.5',
+                                        '11', '1', 1]])
+        with self.captureOnCommitCallbacks(execute=True):
+            bulk_save_OHLC_columns(columns, 'BTCUSD')
+        response, _ = self.btc_ohlc(HTTP_IF_NONE_MATCH=btc['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('ETag'))
+        self.written_ago(3600)
+        # the cached response keeps the version read right after the load
+        response_cache().clear()
+        response, _ = self.btc_ohlc(HTTP_IF_NONE_MATCH=btc['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0]['close'], '11.50')
+        self.assertNotEqual(response['ETag'], btc['ETag'])
+        response, _ = self.get(views.KrakenOHLCList,
+                               f'/kraken-ohlc/?symbol={self.eth.id}',
+                               HTTP_IF_NONE_MATCH=eth['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_validators_follow_database_versions(self):
+        """Test validators come from the versions on the database, a
+        process whose cache missed the bump of another process does not
+        answer with a 304"""
+        self.written_ago(3600)
+        btc, _ = self.btc_ohlc()
+        bump_ohlc_versions([self.btc.id])
+        self.written_ago(3600)
+        response_cache().clear()
+        response, _ = self.btc_ohlc(HTTP_IF_NONE_MATCH=btc['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], btc['ETag'])
+        not_modified, queries = self.btc_ohlc(
+            HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(queries, 0)
+
+    def test_deleted_symbol_is_modified_since(self):
+        """Test deleting a symbol, whose OHLC version is deleted with it,
+        does not take Last-Modified back so clients asking whether the
+        data changed since then get it again"""
+        self.written_ago(3600)
+        KrakenOHLCVersion.objects.filter(symbol=self.btc).update(
+            modified=timezone.now() - datetime.timedelta(seconds=60))
+        KrakenSymbols.objects.filter(pk=self.btc.pk).update(
+            updated=timezone.now() - datetime.timedelta(seconds=60))
+        requests = ((views.KrakenOHLCList, '/kraken-ohlc/?page_size=3'),
+                    (views.KrakenSymbolsList, '/kraken-symbols/'))
+        responses = [self.get(view, url)[0] for view, url in requests]
+        self.btc.delete()
+        KrakenDeletions.objects.update(
+            modified=timezone.now() - datetime.timedelta(seconds=30))
+        response_cache().clear()
+        for (view, url), response in zip(requests, responses):
+            modified, _ = self.get(
+                view, url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+            self.assertEqual(modified.status_code, 200)
+            self.assertNotEqual(modified['Last-Modified'],
+                                response['Last-Modified'])
+            self.assertNotEqual(modified['ETag'], response['ETag'])
+
+    def test_media_types_have_their_own_etag(self):
+        self.written_ago(3600)
+        json, _ = self.btc_ohlc(HTTP_ACCEPT='application/json')
+        indented, _ = self.btc_ohlc(HTTP_ACCEPT='application/json; indent=4',
+                                    HTTP_IF_NONE_MATCH=json['ETag'])
+        self.assertEqual(indented.status_code, 200)
+        self.assertNotEqual(indented['ETag'], json['ETag'])
+        self.assertIn('Accept', json['Vary'])
+
+    def test_users_have_their_own_etag(self):
+        self.written_ago(3600)
+        anonymous, _ = self.btc_ohlc()
+        user = User.objects.create(username='user')
+        response, _ = self.get(views.KrakenOHLCList,
+                               f'/kraken-ohlc/?symbol={self.btc.id}',
+                               user=user, HTTP_IF_NONE_MATCH=anonymous['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], anonymous['ETag'])
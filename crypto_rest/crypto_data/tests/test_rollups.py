@@ -0,0 +1,109 @@
+import datetime
+from django.test import TestCase
+from rest_framework.test import APIRequestFactory
+from data_loader.save_crypto_names import create_kraken_symbols
+from data_loader.bulk_loader import bulk_save_OHLC_data_on_database
+from crypto_data import views
+from crypto_data.models import KrakenOHLC, KrakenOHLCRollup, KrakenSymbols
+
+
+def daily_rows(start: str, days: int, base: float = 100):
+    """rows with increasing prices, one per day"""
+    start = datetime.date.fromisoformat(start)
+    return [{'open': base + d, 'high': base + d + 5, 'low': base + d - 5,
+             'close': base + d + 1,
+             'date': (start + datetime.timedelta(days=d)).isoformat()}
+            for d in range(days)]
+
+
+class TestRollups(TestCase):
+    """Test KrakenOHLCRollup are kept up to date when OHLC rows are saved"""
+
+    def setUp(self):
+        create_kraken_symbols('USD')
+        self.btc = KrakenSymbols.objects.get(symbol='BTCUSD')
+
+    def rollup(self, period, start):
+        return KrakenOHLCRollup.objects.get(symbol=self.btc, period=period,
+                                            start=start)
+
+    def test_batch_is_rolled_up(self):
+        """Test first/max/min/last semantics on every period"""
+        # Monday 2021-09-27 to Sunday 2021-10-10
+        bulk_save_OHLC_data_on_database(daily_rows('2021-09-27', 14),
+                                        'BTCUSD')
+        week = self.rollup(KrakenOHLCRollup.WEEK, '2021-10-04')
+        self.assertEqual(week.days, 7)
+        self.assertEqual(week.open, 107)
+        self.assertEqual(week.high, 118)
+        self.assertEqual(week.low, 102)
+        self.assertEqual(week.close, 114)
+        september = self.rollup(KrakenOHLCRollup.MONTH, '2021-09-01')
+        self.assertEqual(september.days, 4)
+        self.assertEqual(september.close, 104)
+        year = self.rollup(KrakenOHLCRollup.YEAR, '2021-01-01')
+        self.assertEqual((year.days, year.open, year.close),
+                         (14, 100, 114))
+
+    def test_only_touched_periods_are_refreshed(self):
+        bulk_save_OHLC_data_on_database(daily_rows('2021-09-27', 14),
+                                        'BTCUSD')
+        # tamper an untouched and a touched week to see which is recomputed
+        KrakenOHLCRollup.objects.filter(period=KrakenOHLCRollup.WEEK).update(
+            days=0)
+        bulk_save_OHLC_data_on_database(daily_rows('2021-10-11', 1, 200),
+                                        'BTCUSD')
+        self.assertEqual(self.rollup(KrakenOHLCRollup.WEEK, '2021-09-27').days,
+                         0)
+        new_week = self.rollup(KrakenOHLCRollup.WEEK, '2021-10-11')
+        self.assertEqual((new_week.days, new_week.open),
+                         (1, 200))
+        october = self.rollup(KrakenOHLCRollup.MONTH, '2021-10-01')
+        self.assertEqual((october.days, october.high, october.close),
+                         (11, 205, 201))
+
+    def test_rows_saved_one_by_one_and_moved(self):
+        """Test rows saved through the ORM refresh the periods they leave
+        and the ones they join"""
+        ohlc = KrakenOHLC.objects.create(symbol=self.btc, date='2021-10-29',
+                                         open=1,
+                                         high=2,
+                                         low=1,
+                                         close=2)
+        self.assertEqual(self.rollup(KrakenOHLCRollup.MONTH,
+                                     '2021-10-01').days, 1)
+        ohlc.date = datetime.date(2021, 11, 2)
+        ohlc.save()
+        self.assertFalse(KrakenOHLCRollup.objects.filter(
+            period=KrakenOHLCRollup.MONTH, start='2021-10-01').exists())
+        self.assertEqual(self.rollup(KrakenOHLCRollup.MONTH,
+                                     '2021-11-01').days, 1)
+
+    def test_delete_through_the_api(self):
+        bulk_save_OHLC_data_on_database(daily_rows('2021-10-01', 2), 'BTCUSD')
+        ohlc = KrakenOHLC.objects.get(date='2021-10-02')
+        request = APIRequestFactory().delete(f'crypto-data/kraken-ohlc/'
+                                             f'{ohlc.pk}')
+        views.KrakenOHLCDetail.as_view()(request, pk=ohlc.pk)
+        october = self.rollup(KrakenOHLCRollup.MONTH, '2021-10-01')
+        self.assertEqual((october.days, october.close),
+                         (1, 101))
+
+    def test_list_view(self):
+        """Test rollups are listed by period and filtered by symbol"""
+        bulk_save_OHLC_data_on_database(daily_rows('2021-01-01', 90),
+                                        'BTCUSD')
+        bulk_save_OHLC_data_on_database(daily_rows('2021-01-01', 90),
+                                        'ETHUSD')
+        request = APIRequestFactory().get('crypto-data/kraken-ohlc/monthly/',
+                                          {'symbol': self.btc.id})
+        response = views.KrakenOHLCRollupList.as_view()(request,
+                                                        period='monthly')
+        results = response.data['results']
+        self.assertEqual([r['start'] for r in results],
+                         ['2021-01-01', '2021-02-01', '2021-03-01'])
+        self.assertEqual(results[0]['symbol'], 'BTCUSD')
+        self.assertEqual(results[0]['period'], 'monthly')
+        self.assertEqual(results[0]['open'], '100.00')
+        self.assertEqual(results[0]['close'], '131.00')
+        self.assertEqual(results[0]['days'], 31)
@@ -0,0 +1,210 @@
+import time
+import unittest
+from unittest import mock
+from django.conf import settings
+from django.db import connections, DEFAULT_DB_ALIAS
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory
+from crypto_data import views
+from crypto_data.middleware import (ReadYourWritesMiddleware,
+                                    READ_PRIMARY_COOKIE, reads_primary)
+from crypto_data.models import KrakenSymbols
+from crypto_data.routers import (ReplicaRouter, replica_reads, primary_reads,
+                                 read_replica, LAG_CHECK_INTERVAL)
+
+
+REPLICAS = ['replica_1', 'replica_2']
+
+
+@override_settings(REPLICA_DATABASES=REPLICAS, REPLICA_MAX_LAG=5)
+class TestReplicaRouter(SimpleTestCase):
+    """Test ReplicaRouter with the replica lag given by a mock"""
+
+    def setUp(self):
+        self.lags = {'replica_1': 0.0, 'replica_2': 0.0}
+        patcher = mock.patch('crypto_data.routers.replica_lag',
+                             side_effect=lambda alias: self.lags[alias])
+        self.replica_lag = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.router = ReplicaRouter()
+
+    def test_reads_from_primary_by_default(self):
+        self.assertEqual(self.router.db_for_read(KrakenSymbols),
+                         DEFAULT_DB_ALIAS)
+        with replica_reads(), primary_reads():
+            self.assertEqual(self.router.db_for_read(KrakenSymbols),
+                             DEFAULT_DB_ALIAS)
+
+    def test_reads_balanced_across_replicas(self):
+        used = set()
+        for _ in range(50):
+            with replica_reads():
+                used.add(self.router.db_for_read(KrakenSymbols))
+        self.assertEqual(used, set(REPLICAS))
+
+    def test_one_replica_per_block(self):
+        """Test every read of a block, nested blocks and read_replica
+        included, goes to the replica of its first read"""
+        for _ in range(10):
+            with replica_reads():
+                used = {self.router.db_for_read(KrakenSymbols)
+                        for _ in range(10)}
+                with replica_reads():
+                    used.add(self.router.db_for_read(KrakenSymbols))
+                used.add(read_replica(KrakenSymbols))
+            self.assertEqual(len(used), 1)
+
+    def test_lagging_replicas_skipped(self):
+        self.lags['replica_2'] = 6.0
+        with replica_reads():
+            used = {self.router.db_for_read(KrakenSymbols) for _ in range(20)}
+        self.assertEqual(used, {'replica_1'})
+
+    def test_falls_back_to_primary(self):
+        self.lags.update(replica_1=None, replica_2=60.0)
+        with replica_reads():
+            self.assertEqual(self.router.db_for_read(KrakenSymbols),
+                             DEFAULT_DB_ALIAS)
+
+    def test_lag_measured_once_per_interval(self):
+        with replica_reads():
+            for _ in range(10):
+                self.router.db_for_read(KrakenSymbols)
+        self.assertEqual(self.replica_lag.call_count, len(REPLICAS))
+        with mock.patch('crypto_data.routers.time.monotonic',
+                        return_value=time.monotonic() + LAG_CHECK_INTERVAL):
+            self.router.healthy_replicas()
+        self.assertEqual(self.replica_lag.call_count, 2 * len(REPLICAS))
+
+    def test_related_rows_read_from_instance_database(self):
+        symbol = KrakenSymbols(symbol='BTCUSD')
+        symbol._state.db = 'replica_2'
+        self.assertEqual(self.router.db_for_read(KrakenSymbols,
+                                                 instance=symbol),
+                         'replica_2')
+
+    def test_writes_and_migrations_on_primary(self):
+        with replica_reads():
+            self.assertEqual(self.router.db_for_write(KrakenSymbols),
+                             DEFAULT_DB_ALIAS)
+        self.assertFalse(self.router.allow_migrate('replica_1',
+                                                   'crypto_data'))
+        self.assertIsNone(self.router.allow_migrate(DEFAULT_DB_ALIAS,
+                                                    'crypto_data'))
+
+
+@override_settings(REPLICA_DATABASES=REPLICAS, RESPONSE_CACHE_TIMEOUT=0)
+class TestReadYourWrites(TestCase):
+    """Test list views read from the replicas unless the client wrote,
+    responses are not cached"""
+
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        # replicas are not available in tests, count reads routed to them
+        patcher = mock.patch.object(ReplicaRouter, 'read_replica',
+                                    return_value=DEFAULT_DB_ALIAS)
+        self.read_replica = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_list_reads_from_replicas(self):
+        for view in (views.KrakenSymbolsList, views.KrakenOHLCList):
+            self.read_replica.reset_mock()
+            view.as_view()(self.factory.get('/'))
+            self.assertTrue(self.read_replica.called)
+
+    def test_read_primary_after_write(self):
+        middleware = ReadYourWritesMiddleware(
+            views.KrakenSymbolsList.as_view())
+        response = middleware(self.factory.post(
+            '/', {'coin_name': 'Xcoin', 'coin_symbol': 'XXX',
+                  'currency': 'USD', 'symbol': 'XXXUSD'}))
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse(self.read_replica.called)
+        cookie = response.cookies[READ_PRIMARY_COOKIE]
+        self.assertEqual(cookie['max-age'], settings.READ_PRIMARY_AFTER_WRITE)
+        request = self.factory.get('/')
+        request.COOKIES[READ_PRIMARY_COOKIE] = cookie.value
+        self.assertTrue(reads_primary(request))
+        response = middleware(request)
+        self.assertNotIn(READ_PRIMARY_COOKIE, response.cookies)
+        self.assertEqual(response.data['results'][0]['symbol'], 'XXXUSD')
+        self.assertFalse(self.read_replica.called)
+
+    def test_read_primary_header(self):
+        request = self.factory.get('/', HTTP_X_READ_PRIMARY='1')
+        views.KrakenOHLCList.as_view()(request)
+        self.assertFalse(self.read_replica.called)
+
+
+@unittest.skipUnless(settings.REPLICA_DATABASES,
+                     'set DATABASE_REPLICAS to streaming replicas of the '
+                     'primary to run')
+@override_settings(REPLICA_MAX_LAG=0.5)
+class TestStreamingReplica(TransactionTestCase):
+    """Test reads against a real streaming replica, run alone with i.e
+    DATABASE_REPLICAS=127.0.0.1:5434 python manage.py test
+    crypto_data.tests.test_routers"""
+    databases = '__all__'
+
+    def setUp(self):
+        self.replica = settings.REPLICA_DATABASES[0]
+        self.factory = APIRequestFactory()
+
+    def wait_replayed(self, symbol):
+        for _ in range(50):
+            if (KrakenSymbols.objects.using(self.replica)
+                    .filter(symbol=symbol).exists()):
+                return
+            time.sleep(0.1)
+        self.fail(f'{symbol} was not replayed on {self.replica}')
+
+    def list_symbols(self, alias):
+        with CaptureQueriesContext(connections[alias]) as queries:
+            response = views.KrakenSymbolsList.as_view()(
+                self.factory.get('/'))
+        self.assertTrue(any('crypto_data_krakensymbols' in q['sql']
+                            for q in queries))
+        return [row['symbol'] for row in response.data['results']]
+
+    def test_list_read_from_replica(self):
+        KrakenSymbols.objects.create(symbol='BTCUSD')
+        self.wait_replayed('BTCUSD')
+        time.sleep(LAG_CHECK_INTERVAL)
+        self.assertEqual(self.list_symbols(self.replica), ['BTCUSD'])
+
+    def test_lagging_replica_falls_back_to_primary(self):
+        with connections[self.replica].cursor() as cursor:
+            cursor.execute('SELECT pg_wal_replay_pause()')
+        try:
+            KrakenSymbols.objects.create(symbol='ETHUSD')
+            time.sleep(LAG_CHECK_INTERVAL + 1)
+            self.assertEqual(self.list_symbols(DEFAULT_DB_ALIAS), ['ETHUSD'])
+        finally:
+            with connections[self.replica].cursor() as cursor:
+                cursor.execute('SELECT pg_wal_replay_resume()')
+        self.wait_replayed('ETHUSD')
+
+    def test_disconnected_replica_falls_back_to_primary(self):
+        """Test a replica whose WAL receiver stopped is left out once the
+        primary writes, it has nothing left to replay so it is not taken
+        as caught up"""
+        def set_primary_conninfo(conninfo):
+            with connections[self.replica].cursor() as cursor:
+                cursor.execute(f"ALTER SYSTEM SET primary_conninfo = "
+                               f"'{conninfo}'")
+                cursor.execute('SELECT pg_reload_conf()')
+
+        with connections[self.replica].cursor() as cursor:
+            cursor.execute('SHOW primary_conninfo')
+            conninfo = cursor.fetchone()[0].replace("'", "''")
+        set_primary_conninfo('')
+        try:
+            time.sleep(1)
+            KrakenSymbols.objects.create(symbol='ADAUSD')
+            time.sleep(LAG_CHECK_INTERVAL + 1)
+            self.assertEqual(self.list_symbols(DEFAULT_DB_ALIAS), ['ADAUSD'])
+        finally:
+            set_primary_conninfo(conninfo)
+        self.wait_replayed('ADAUSD')
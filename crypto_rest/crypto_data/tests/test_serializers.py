@@ -27,7 +27,7 @@ KRAKEN_SYMBOL_SERIALIZER_FIELDS = ['url',
                                    'coin_symbol',
                                    'currency',
                                    'symbol',
-                                   'related_OHLC']
+                                   'ohlc_summary']
 
 def get_result_list(result_data):
     """Get result from Rest api call, in case is paginated the result is under
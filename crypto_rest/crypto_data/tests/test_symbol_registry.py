@@ -0,0 +1,102 @@
+from django.db import connection, transaction
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+from rest_framework.test import APIRequestFactory
+from data_loader.save_crypto_names import create_kraken_symbols
+from crypto_data import views
+from crypto_data.models import KrakenSymbols
+from crypto_data.response_cache import response_cache
+from crypto_data.symbol_registry import SymbolRegistry, symbol_registry
+
+
+class TestSymbolRegistry(TestCase):
+    """Test SymbolRegistry lookups and when symbols are read again"""
+
+    @classmethod
+    def setUpTestData(cls):
+        create_kraken_symbols('USD')
+        cls.btc = KrakenSymbols.objects.get(symbol='BTCUSD')
+
+    def setUp(self):
+        self.registry = SymbolRegistry(ttl=60)
+
+    def test_lookups_read_symbols_once(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.registry.id_of('BTCUSD'), self.btc.id)
+            self.assertEqual(self.registry.symbol_of(self.btc.id), 'BTCUSD')
+            self.assertIn(self.btc.id,
+                          self.registry.ids_starting_with(['bt']))
+            self.assertEqual(self.registry.ids_starting_with(['BT', 'E']),
+                             [])
+            symbol = self.registry.instance(self.btc.id)
+        self.assertEqual(len(queries), 1)
+        self.assertEqual((symbol.pk, symbol.symbol), (self.btc.id, 'BTCUSD'))
+        self.assertFalse(symbol._state.adding)
+
+    def test_miss_reads_symbols_again_once(self):
+        self.registry.id_of('BTCUSD')
+        # bulk_create does not send post_save
+        xtz, = KrakenSymbols.objects.bulk_create([KrakenSymbols(
+            coin_name='Tezos', coin_symbol='XTZ', currency='USD',
+            symbol='XTZUSD')])
+        self.assertIsNone(self.registry.id_of('XTZUSD'))
+        self.registry.miss_interval = 0
+        self.assertEqual(self.registry.id_of('XTZUSD'), xtz.id)
+        self.registry.miss_interval = 60
+        with CaptureQueriesContext(connection) as queries:
+            self.assertIsNone(self.registry.id_of('NOPE'))
+            self.assertIsNone(self.registry.symbol_of(-1))
+        self.assertEqual(len(queries), 0)
+
+    def test_symbols_of_rolled_back_transaction_are_not_kept(self):
+        self.registry.miss_interval = 60
+        try:
+            with transaction.atomic():
+                KrakenSymbols.objects.filter(pk=self.btc.pk).update(
+                    symbol='BTCEUR')
+                self.assertEqual(self.registry.id_of('BTCEUR'), self.btc.id)
+                raise ValueError
+        except ValueError:
+            pass
+        self.assertIsNone(self.registry.id_of('BTCEUR'))
+        self.assertEqual(self.registry.id_of('BTCUSD'), self.btc.id)
+
+    def test_saved_and_deleted_symbols_invalidate_registry(self):
+        self.assertEqual(symbol_registry.id_of('BTCUSD'), self.btc.id)
+        self.btc.symbol = 'XBTUSD'
+        self.btc.save()
+        self.assertIsNone(symbol_registry.id_of('BTCUSD'))
+        self.assertEqual(symbol_registry.symbol_of(self.btc.id), 'XBTUSD')
+        self.btc.delete()
+        self.assertIsNone(symbol_registry.symbol_of(self.btc.id))
+
+
+class TestRegisteredSymbolLookups(TestCase):
+    """Test symbols given to the KrakenOHLC endpoints resolved through the
+    registry are validated as before"""
+
+    @classmethod
+    def setUpTestData(cls):
+        create_kraken_symbols('USD')
+
+    def setUp(self):
+        response_cache().clear()
+        self.factory = APIRequestFactory()
+
+    def test_unknown_symbols(self):
+        request = self.factory.post('/', {'symbol': 'NOPE', 'open': 1,
+                                          'high': 1, 'low': 1, 'close': 1,
+                                          'date': '2021-08-01'},
+                                    format='json')
+        response = views.KrakenOHLCList.as_view()(request)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['symbol'],
+                         ['Object with symbol=NOPE does not exist.'])
+        request = self.factory.get('/', {'symbol': 999999})
+        response = views.KrakenOHLCList.as_view()(request)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('symbol', response.data)
+        request = self.factory.get('/', {'search': 'NOPE'})
+        response = views.KrakenOHLCList.as_view()(request)
+        self.assertEqual(response.data['results'], [])
@@ -0,0 +1,86 @@
+import datetime
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+from rest_framework.test import APIRequestFactory
+from data_loader.bulk_loader import bulk_save_OHLC_columns
+from data_loader.kraken_data_loader import create_OHLC_columns
+from data_loader.save_crypto_names import create_kraken_symbols
+from crypto_data import views
+from crypto_data.models import KrakenOHLC, KrakenSymbols
+from crypto_data.partitions import ensure_partitions
+from crypto_data.response_cache import response_cache
+
+
+def day_time(date: datetime.date):
+    return int(datetime.datetime.combine(
+        date, datetime.time(), datetime.timezone.utc).timestamp())
+
+
+class TestKrakenSymbolOHLCSummary(TestCase):
+    """Test the OHLC summary of KrakenSymbolSerializer"""
+    START = datetime.date(2020, 12, 30)
+
+    @classmethod
+    def setUpTestData(cls):
+        create_kraken_symbols('USD')
+        ensure_partitions(KrakenOHLC, cls.START, datetime.date(2021, 1, 31))
+        # rows across two years go through the yearly rollups
+        columns = create_OHLC_columns(
+            [[day_time(cls.START + datetime.timedelta(d)), '10', '12', '9',
+              f'{d}.5', '11', '1', 1] for d in range(5)])
+        bulk_save_OHLC_columns(columns, 'BTCUSD')
+        cls.btc = KrakenSymbols.objects.get(symbol='BTCUSD')
+
+    def setUp(self):
+        response_cache().clear()
+        self.factory = APIRequestFactory()
+
+    def get_list(self):
+        request = self.factory.get('/crypto-data/kraken-symbols/',
+                                   {'page_size': 20})
+        with CaptureQueriesContext(connection) as queries:
+            response = views.KrakenSymbolsList.as_view()(request)
+        summaries = {s['symbol']: s['ohlc_summary']
+                     for s in response.data['results']}
+        return summaries, len(queries)
+
+    def test_summary(self):
+        summaries, queries = self.get_list()
+        # versions of the data, page count and page
+        self.assertEqual(queries, 3)
+        self.assertEqual(summaries['BTCUSD'], {
+            'count': 5,
+            'first_date': '2020-12-30',
+            'last_date': '2021-01-03',
+            'latest_close': '4.50',
+            'url': f'http://testserver/crypto-data/kraken-ohlc/'
+                   f'?symbol={self.btc.id}'})
+        self.assertEqual(summaries['ETHUSD']['count'], 0)
+        self.assertIsNone(summaries['ETHUSD']['latest_close'])
+
+    def test_loaded_rows_update_summary(self):
+        self.get_list()
+        columns = create_OHLC_columns(
+            [[day_time(datetime.date(2021, 1, 4)), '10', '12', '9', '20',
+              '11', '1', 1]])
+        with self.captureOnCommitCallbacks(execute=True):
+            bulk_save_OHLC_columns(columns, 'BTCUSD')
+        summaries, _ = self.get_list()
+        self.assertEqual(summaries['BTCUSD']['count'], 6)
+        self.assertEqual(summaries['BTCUSD']['last_date'], '2021-01-04')
+        self.assertEqual(summaries['BTCUSD']['latest_close'], '20.00')
+
+    def test_detail_and_created_symbol(self):
+        request = self.factory.get('/')
+        response = views.KrakenSymbolsDetail.as_view()(request,
+                                                       pk=self.btc.id)
+        self.assertEqual(response.data['ohlc_summary']['count'], 5)
+        request = self.factory.post('/', {'coin_name': 'Tezos',
+                                          'coin_symbol': 'XTZ',
+                                          'currency': 'USD',
+                                          'symbol': 'XTZUSD'}, format='json')
+        response = views.KrakenSymbolsList.as_view()(request)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['ohlc_summary']['count'], 0)
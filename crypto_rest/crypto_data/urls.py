@@ -18,6 +18,22 @@ urlpatterns = [
             views.KrakenOHLCDetail.as_view(),
             name=views.KrakenOHLCDetail.name,
             ),
+    re_path(r'^kraken-ohlc/bulk/$',
+            views.KrakenOHLCBulkCreate.as_view(),
+            name=views.KrakenOHLCBulkCreate.name,
+            ),
+    re_path(r'^kraken-ohlc/export/$',
+            views.KrakenOHLCExport.as_view(),
+            name=views.KrakenOHLCExport.name,
+            ),
+    re_path(r'^kraken-ohlc/cache-stats/$',
+            views.KrakenOHLCCacheStats.as_view(),
+            name=views.KrakenOHLCCacheStats.name,
+            ),
+    re_path(r'^kraken-ohlc/(?P<period>weekly|monthly|yearly)/$',
+            views.KrakenOHLCRollupList.as_view(),
+            name=views.KrakenOHLCRollupList.name,
+            ),
     re_path(r'^$',
             views.APIRoot.as_view(),
             name=views.APIRoot.name
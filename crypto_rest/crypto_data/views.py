@@ -1,13 +1,31 @@
-from rest_framework import generics
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.http import StreamingHttpResponse
+from rest_framework import generics, permissions, status
 from django_filters import rest_framework as d_filter
-from rest_framework import filters
+from rest_framework.exceptions import ValidationError
+from rest_framework.parsers import JSONParser
 from rest_framework.response import Response
 from rest_framework.reverse import reverse
-from .custom_filters import KrakenOHLCFilter
-from crypto_data.models import KrakenOHLC, KrakenSymbols
+from .custom_filters import (KrakenOHLCFilter, KrakenOHLCRollupFilter,
+                             SymbolSearchFilter)
+from crypto_data.models import KrakenOHLC, KrakenSymbols, KrakenOHLCRollup
+from data_loader.bulk_loader import validate_OHLC_items, save_symbol_rows
+from crypto_data.export import EXPORT_OUTPUTS, export_rows
+from crypto_data.middleware import reads_primary
+from crypto_data.parsers import NDJSONParser
+from crypto_data.ohlc_cache import ohlc_cache, cached_ohlc_range
+from crypto_data.response_cache import (ResponseCacheMixin, ohlc_generation,
+                                        OHLC_GENERATION, SYMBOLS_GENERATION)
+from crypto_data.rollups import refresh_rollups
+from crypto_data.routers import replica_reads, read_replica
+from crypto_data.signals import ohlc_written
 from crypto_data.serializers import (KrakenSymbolSerializer,
-                                     KrakenOHLCSerializer)
-from .custom_pagination import KrakenSymbolsPagination, KrakenOHLCPagination
+                                     KrakenOHLCSerializer,
+                                     KrakenOHLCListEncoder,
+                                     KrakenOHLCRollupSerializer)
+from .custom_pagination import (KrakenSymbolsPagination, KrakenOHLCPagination,
+                                KrakenOHLCKeysetPagination)
 
 """
 All the above could be also implemented using APIView as method/class
@@ -18,9 +36,51 @@ connecting to storage, creating csv files...
 """
 
 
-class KrakenSymbolsList(generics.ListCreateAPIView):
+class ReplicaListMixin:
+    """List from the read replicas unless the request reads from the
+    primary, see crypto_data.middleware"""
+    def list(self, request, *args, **kwargs):
+        if reads_primary(request):
+            return super().list(request, *args, **kwargs)
+        with replica_reads():
+            return super().list(request, *args, **kwargs)
+
+
+class HotRangeCacheMixin:
+    """List the recent OHLC of a symbol from crypto_data.ohlc_cache when
+    it holds the requested range, the response is the same the database
+    would give. Requests reading from the primary skip the cache."""
+    def list(self, request, *args, **kwargs):
+        cached = None
+        if not reads_primary(request):
+            cached = cached_ohlc_range(request.query_params,
+                                       read_replica(KrakenOHLC))
+        if cached is None:
+            return super().list(request, *args, **kwargs)
+        page = self.paginate_queryset(cached)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+
+class FastOHLCListMixin:
+    """List KrakenOHLC read as values_list rows and represented by
+    KrakenOHLCListEncoder when settings.OHLC_FAST_LIST is set, the
+    serializer is not used and the responses are the same"""
+    def list(self, request, *args, **kwargs):
+        if not settings.OHLC_FAST_LIST:
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(KrakenOHLCListEncoder.rows(queryset))
+        encoder = KrakenOHLCListEncoder(request)
+        return self.get_paginated_response(encoder.encode(page))
+
+
+class KrakenSymbolsList(ResponseCacheMixin, ReplicaListMixin,
+                        generics.ListCreateAPIView):
     """List and Create KrakenSymbols"""
-    queryset = KrakenSymbols.objects.all()
+    # the symbols show a summary of their OHLC
+    cache_generations = (SYMBOLS_GENERATION, OHLC_GENERATION)
+    queryset = KrakenSymbols.objects.with_ohlc_summary()
     serializer_class = KrakenSymbolSerializer
     name = 'krakensymbol-list' # need to describe name to find hyperlink
     pagination_class = KrakenSymbolsPagination
@@ -28,21 +88,101 @@ class KrakenSymbolsList(generics.ListCreateAPIView):
 
 class KrakenSymbolsDetail(generics.RetrieveUpdateDestroyAPIView):
     """get single, put, patch, delete KrakenSymbols"""
-    queryset = KrakenSymbols.objects.all()
+    queryset = KrakenSymbols.objects.with_ohlc_summary()
     serializer_class = KrakenSymbolSerializer
     name = 'krakensymbols-detail'
 
 
-class KrakenOHLCList(generics.ListCreateAPIView):
+class KrakenOHLCList(ResponseCacheMixin, ReplicaListMixin, HotRangeCacheMixin,
+                     FastOHLCListMixin, generics.ListCreateAPIView):
     """List and created KrakenOHLC"""
     queryset = KrakenOHLC.objects.all()
     serializer_class = KrakenOHLCSerializer
     name = 'Krakenohlc-list'
-    pagination_class = KrakenOHLCPagination
+    pagination_class = KrakenOHLCKeysetPagination
+    filter_backends = (d_filter.DjangoFilterBackend,
+                       SymbolSearchFilter)
+    filterset_class = KrakenOHLCFilter
+    search_fields = ('^symbol__symbol', )
+
+    def data_generations(self, request):
+        """responses of a symbol only depend on the OHLC of that symbol"""
+        symbol = request.query_params.get('symbol', '')
+        return [SYMBOLS_GENERATION, (ohlc_generation(int(symbol))
+                                     if symbol.isdigit() else OHLC_GENERATION)]
+
+
+class KrakenOHLCBulkCreate(generics.GenericAPIView):
+    """Create or update many KrakenOHLC in one request, the body is a JSON
+    array or NDJSON of KrakenOHLC without url. Symbols are resolved through
+    crypto_data.symbol_registry and rows are written with COPY, a row
+    already saved for the same symbol and date is updated. Valid items are
+    saved even if others are rejected, the response gives the amount of
+    saved items, of duplicates, items dropped for a later item of the same
+    symbol and date, and the errors of every rejected item by its index on
+    the body."""
+    name = 'krakenohlc-bulk-create'
+    parser_classes = (JSONParser, NDJSONParser)
+    max_items = 50000
+
+    def post(self, request, *args, **kwargs):
+        items = request.data
+        if not isinstance(items, list):
+            raise ValidationError({'non_field_errors': [
+                f'Expected a list of items but got '
+                f'"{type(items).__name__}".']})
+        if len(items) > self.max_items:
+            raise ValidationError({'non_field_errors': [
+                f'Ensure there are no more than {self.max_items} items.']})
+        rows, errors = validate_OHLC_items(items)
+        with transaction.atomic():
+            results = [save_symbol_rows(symbol_rows, symbol_id)
+                       for symbol_id, symbol_rows in rows.items()]
+        saved = sum(result.saved for result in results)
+        duplicates = sum(result.duplicates for result in results)
+        if not errors:
+            response_status = status.HTTP_201_CREATED
+        elif saved:
+            response_status = status.HTTP_207_MULTI_STATUS
+        else:
+            response_status = status.HTTP_400_BAD_REQUEST
+        return Response({'saved': saved, 'duplicates': duplicates,
+                         'rejected': len(errors), 'errors': errors},
+                        status=response_status)
+
+
+class KrakenOHLCExport(generics.GenericAPIView):
+    """Stream the KrakenOHLC matching the KrakenOHLCList filters as CSV, or
+    NDJSON with output=ndjson, in a single response. Rows are read from a
+    server side cursor chunk_size rows at a time and sent as they are read,
+    see crypto_data.export, so any amount of rows is exported in constant
+    memory."""
+    queryset = KrakenOHLC.objects.all()
+    name = 'krakenohlc-export'
     filter_backends = (d_filter.DjangoFilterBackend,
-                       filters.SearchFilter )
+                       SymbolSearchFilter)
     filterset_class = KrakenOHLCFilter
     search_fields = ('^symbol__symbol', )
+    chunk_size = 5000
+
+    def get(self, request, *args, **kwargs):
+        output = request.query_params.get('output', 'csv')
+        if output not in EXPORT_OUTPUTS:
+            raise ValidationError({'output': [
+                f'Select a valid choice. {output} is not one of the '
+                f'available choices.']})
+        # the rows are read once the view has returned, the database is
+        # chosen now
+        using = (DEFAULT_DB_ALIAS if reads_primary(request)
+                 else read_replica(KrakenOHLC))
+        queryset = self.filter_queryset(self.get_queryset()).using(using)
+        content_type, encode = EXPORT_OUTPUTS[output]
+        response = StreamingHttpResponse(
+            encode(export_rows(queryset, self.chunk_size), self.chunk_size),
+            content_type=content_type)
+        response['Content-Disposition'] = (f'attachment; '
+                                           f'filename="kraken-ohlc.{output}"')
+        return response
 
 
 class KrakenOHLCDetail(generics.RetrieveUpdateDestroyAPIView):
@@ -51,13 +191,56 @@ class KrakenOHLCDetail(generics.RetrieveUpdateDestroyAPIView):
     serializer_class = KrakenOHLCSerializer
     name = 'krakenohlc-detail'
 
+    def perform_destroy(self, instance):
+        """rollups and caches are refreshed by signals on save but not on
+        delete, see crypto_data.signals"""
+        super().perform_destroy(instance)
+        refresh_rollups(instance.symbol_id, instance.date, instance.date)
+        ohlc_written([instance.symbol_id], DEFAULT_DB_ALIAS)
+
+
+class KrakenOHLCRollupList(generics.ListAPIView):
+    """List KrakenOHLCRollup of the period on the url, weekly, monthly or
+    yearly"""
+    serializer_class = KrakenOHLCRollupSerializer
+    name = 'krakenohlc-rollup-list'
+    pagination_class = KrakenOHLCPagination
+    filter_backends = (d_filter.DjangoFilterBackend,
+                       SymbolSearchFilter)
+    filterset_class = KrakenOHLCRollupFilter
+    search_fields = ('^symbol__symbol', )
+    # url names of the periods
+    PERIODS = {name: period for period, name in KrakenOHLCRollup.PERIODS}
+
+    def get_queryset(self):
+        period = self.PERIODS[self.kwargs['period']]
+        return KrakenOHLCRollup.objects.filter(period=period)
+
+
+class KrakenOHLCCacheStats(generics.GenericAPIView):
+    """Hits, misses and evictions of the OHLC cache of the process serving
+    the request, see crypto_data.ohlc_cache"""
+    name = 'krakenohlc-cache-stats'
+    permission_classes = (permissions.IsAdminUser, )
+
+    def get(self, request, *args, **kwargs):
+        return Response(ohlc_cache.stats()._asdict())
+
 
-class APIRoot(generics.GenericAPIView):
+class APIRoot(ResponseCacheMixin, generics.GenericAPIView):
     name = 'api-root'
     def get(self, request, *args, **kwargs):
         return Response({
             'kraken-symbols': reverse(KrakenSymbolsList.name, request=request),
-            'kraken-ohlc': reverse(KrakenOHLCList.name, request=request)
+            'kraken-ohlc': reverse(KrakenOHLCList.name, request=request),
+            'kraken-ohlc-bulk': reverse(KrakenOHLCBulkCreate.name,
+                                        request=request),
+            'kraken-ohlc-export': reverse(KrakenOHLCExport.name,
+                                          request=request),
+            **{f'kraken-ohlc-{period}': reverse(KrakenOHLCRollupList.name,
+                                                kwargs={'period': period},
+                                                request=request)
+               for period in KrakenOHLCRollupList.PERIODS},
         })
 
 
@@ -23,6 +23,53 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 
 SECRET_KEY = os.environ.get('SECRET_KEY_CRYPTO', '')
 SQL_PASSWORD = os.environ.get('SQL_CRYPTO_PASSWORD', '')
+# Kraken public API, point it to a local stand-in such as
+# data_loader.kraken_stub_server to load data offline.
+KRAKEN_API_URL = os.environ.get('KRAKEN_API_URL',
+                                'https://api.kraken.com/0/public')
+
+# Directory of the columnar candle store kept in sync by the data loader,
+# see crypto_data.candle_store, not kept if empty.
+CANDLE_STORE_DIR = os.environ.get('CANDLE_STORE_DIR', '')
+
+# In process cache of the recent OHLC of the most requested symbols, see
+# crypto_data.ohlc_cache, bytes it can hold (0 disables it), days of every
+# symbol it holds, seconds before a cached symbol is read again and seconds
+# between checks of its version for writes of other processes.
+OHLC_CACHE_MAX_SIZE = int(os.environ.get('OHLC_CACHE_MAX_SIZE', 16 * 2 ** 20))
+OHLC_CACHE_DAYS = 400
+OHLC_CACHE_TTL = 60
+OHLC_CACHE_REVALIDATE = float(os.environ.get('OHLC_CACHE_REVALIDATE', 1))
+
+# In process registry of the symbol <-> id of every KrakenSymbols, see
+# crypto_data.symbol_registry, seconds before the symbols are read again.
+SYMBOL_REGISTRY_TTL = 60
+
+# Serve KrakenOHLCList pages read from the database with
+# crypto_data.serializers.KrakenOHLCListEncoder instead of the serializer,
+# the responses are the same, i.e OHLC_FAST_LIST=1
+OHLC_FAST_LIST = bool(int(os.environ.get('OHLC_FAST_LIST', 0)))
+
+# Cache of the responses of the read endpoints, see
+# crypto_data.response_cache, files on RESPONSE_CACHE_DIR shared by every
+# process on the host, i.e the data loader invalidates responses of the web
+# server. Every web server host needs the directory shared with the loader,
+# or the cache backend switched to a DatabaseCache or memcached.
+RESPONSE_CACHE_DIR = os.environ.get('RESPONSE_CACHE_DIR',
+                                    str(BASE_DIR / 'cache' / 'responses'))
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'responses': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': RESPONSE_CACHE_DIR,
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+RESPONSE_CACHE = 'responses'
+# seconds responses are kept, 0 to not cache them
+RESPONSE_CACHE_TIMEOUT = 300
 
 # SECURITY WARNING: don't run with debug turned on in production!
 
@@ -54,6 +101,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'crypto_data.middleware.ReadYourWritesMiddleware',
 ]
 
 ROOT_URLCONF = 'crypto_rest.urls'
@@ -90,6 +138,25 @@ DATABASES = {
     },
 }
 
+# Read replicas of the default database as comma separated host:port, read
+# only views read from them, see crypto_data.routers. Tests read replicas
+# under the test database name, a streaming replica of the primary has it.
+for number, replica in enumerate(
+        filter(None, os.environ.get('DATABASE_REPLICAS', '').split(',')), 1):
+    host, _, port = replica.strip().partition(':')
+    DATABASES[f'replica_{number}'] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'PORT': port or DATABASES['default']['PORT'],
+        'TEST': {'MIRROR': 'default'},
+    }
+REPLICA_DATABASES = [alias for alias in DATABASES if alias != 'default']
+# seconds a replica may lag behind the primary before reads skip it
+REPLICA_MAX_LAG = float(os.environ.get('REPLICA_MAX_LAG', 5))
+# seconds reads stay on the primary after a client writes
+READ_PRIMARY_AFTER_WRITE = 10
+DATABASE_ROUTERS = ['crypto_data.routers.ReplicaRouter']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
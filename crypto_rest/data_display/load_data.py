@@ -1,4 +1,11 @@
+import datetime
+import itertools
+import numpy as np
 from crypto_data.models import KrakenOHLC
+from crypto_data.candle_store import CandleStore, get_candle_store
+from crypto_data.export import EXPORT_FIELDS, export_rows
+from crypto_data.routers import read_replica
+from crypto_data.symbol_registry import symbol_registry
 
 
 class LoadDataFromPostSQl:
@@ -14,8 +21,8 @@ class LoadDataFromPostSQl:
     def load_data(self):
         # only load data if it has not been loaded yet
         if self._response is None:
-            query = (KrakenOHLC.objects
-                     .filter(symbol__symbol=self._symbol)
+            query = (KrakenOHLC.objects.using(read_replica(KrakenOHLC))
+                     .filter(symbol_id=symbol_registry.id_of(self._symbol))
                      .filter(date__gte=self._time))
             if not query.exists():
                 raise SystemExit(f'No data found for symbol {self._symbol} and '
@@ -27,15 +34,52 @@ class LoadDataFromPostSQl:
                              f'on class {self.__class__.__name__}')
 
     def csv_headers(self):
-        return ['symbol', 'date', 'open', 'high', 'low', 'close']
+        return list(EXPORT_FIELDS)
 
     def __iter__(self):
-        """Iterate over given response"""
+        """Iterate over given response, prices are stored as fixed point
+        integers and given as strings. Rows are streamed from a server side
+        cursor, see crypto_data.export, the response is never held in
+        memory"""
         if self._response is not None:
-            for r in self._response:
-                yield (r.symbol.symbol,
-                       r.date.strftime('%Y-%m-%d'),
-                       r.open,
-                       r.high,
-                       r.low,
-                       r.close)
\ No newline at end of file
+            yield from export_rows(self._response)
+
+class LoadDataFromCandleStore:
+    """Load candles of a symbol and interval from an start time out of the
+    columnar candle store, see crypto_data.candle_store, rows are only built
+    when iterating"""
+    def __init__(self, symbol: str, time: str, interval: int,
+                 store: CandleStore = None):
+        self._symbol = symbol
+        self._time = time
+        self._interval = interval
+        self._store = store if store is not None else get_candle_store()
+        self._response = None
+
+    def get_response(self):
+        return self._response
+
+    def load_data(self):
+        if self._response is not None:
+            raise ValueError(f'response can not be modified once initialized '
+                             f'on class {self.__class__.__name__}')
+        if self._store is None:
+            raise SystemExit('No candle store, set CANDLE_STORE_DIR')
+        start = int(datetime.datetime.fromisoformat(self._time)
+                    .replace(tzinfo=datetime.timezone.utc).timestamp())
+        candles = self._store.read(self._symbol, self._interval, start)
+        if not len(candles.time):
+            raise SystemExit(f'No data found for symbol {self._symbol} and '
+                             f'time {self._time}')
+        self._response = candles
+
+    def csv_headers(self):
+        return ['symbol', 'time', 'open', 'high', 'low', 'close', 'vwap',
+                'volume', 'count']
+
+    def __iter__(self):
+        if self._response is not None:
+            times = np.datetime_as_string(
+                self._response.time.astype('datetime64[s]'), timezone='UTC')
+            yield from zip(itertools.repeat(self._symbol), times.tolist(),
+                           *(c.tolist() for c in self._response[1:]))
@@ -1,8 +1,12 @@
 import datetime
-from django.test import TestCase
+import tempfile
+from django.test import SimpleTestCase, TestCase
+from crypto_data.candle_store import CandleStore
+from crypto_data.tests.test_candle_store import create_candles
 from data_loader.save_crypto_names import create_kraken_symbols
 from data_loader.postgres_data_loader import load_kraken_data_into_postgres
-from data_display.load_data import LoadDataFromPostSQl
+from data_display.load_data import (LoadDataFromPostSQl,
+                                    LoadDataFromCandleStore)
 
 class TestLoadDataFromPostSQl(TestCase):
 
@@ -37,4 +41,31 @@ class TestLoadDataFromPostSQl(TestCase):
         """Assert SystemExit is raised if no data is found"""
         test_instance = LoadDataFromPostSQl('NONVALID', "2021-08-01")
         with self.assertRaises(SystemExit):
-            test_instance.load_data()
\ No newline at end of file
+            test_instance.load_data()
+
+
+class TestLoadDataFromCandleStore(SimpleTestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.store = CandleStore(directory.name)
+        # 2021-08-01 00:00 UTC every 5 minutes
+        self.store.append('BTCUSD', 5,
+                          create_candles(range(1627775700, 1627776900, 300)))
+
+    def test_load_data_filter_time(self):
+        test_instance = LoadDataFromCandleStore('BTCUSD', '2021-08-01', 5,
+                                                self.store)
+        test_instance.load_data()
+        rows = list(test_instance)
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[0], ('BTCUSD', '2021-08-01T00:00:00Z', 1.0,
+                                   1.0, 1.0, 1.0, 1.0, 10.0, 1))
+        self.assertEqual(len(rows[0]), len(test_instance.csv_headers()))
+
+    def test_systemExit_is_raised(self):
+        test_instance = LoadDataFromCandleStore('BTCUSD', '2021-08-02', 5,
+                                                self.store)
+        with self.assertRaises(SystemExit):
+            test_instance.load_data()
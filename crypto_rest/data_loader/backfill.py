@@ -0,0 +1,155 @@
+"""Backfill Kraken data page by page following the 'last' cursor"""
+import logging
+import time
+from django.db import transaction
+from crypto_data.models import KrakenSymbols, KrakenBackfillCheckpoint
+from data_loader.kraken_data_loader import (KrakenResponseExtractor,
+                                            KrakenContentFetcher)
+from data_loader.response_extractor import ResponseExtractor
+from data_loader.bulk_loader import (bulk_save_OHLC_columns,
+                                     bulk_save_candle_columns)
+from data_loader.postgres_data_loader import (get_kraken_url,
+                                              INCREMENT_STEPS,
+                                              create_OHLC_params,
+                                              fetch_symbol_response,
+                                              log_symbol_error)
+from data_loader.errors import ExtractorErrorResponse, NonRelatedResponseError
+
+
+logger = logging.getLogger(__name__)
+
+
+class KrakenBackfill:
+    """Load the whole history of symbols from a start date up to now. Kraken
+    returns a limited amount of candles per response together with a 'last'
+    cursor, the backfill keeps requesting pages with that cursor until it
+    does not move forward anymore or reaches the end time.
+    Every page is saved as soon as it arrives, in the same transaction as
+    the checkpoint pointing to the next page, so an interrupted backfill
+    resumes at the first page that was not saved.
+    Daily pages are saved as KrakenOHLC, pages of any other interval as
+    KrakenCandle of that interval.
+    Methods:
+        - save_page: save the columns of a page.
+        - backfill_symbol: backfill a single symbol.
+        - run: backfill all the given symbols.
+    """
+    def __init__(self, url: str, start: int, end: int = None,
+                 interval: int = INCREMENT_STEPS, rate_limiter=None,
+                 fetcher_class=KrakenContentFetcher):
+        """Initialize instance.
+        @params:
+        - url: valid kraken OHLC url.
+        - start: unix time to start the backfill from.
+        - end: unix time to stop at, defaults to the current time.
+        - interval: candle interval in minutes.
+        - rate_limiter: instance with method acquire, i.e TokenBucket.
+        - fetcher_class: class used to fetch every page, see
+        fetch_symbol_response.
+        """
+        self._url = url
+        self._start = start
+        self._end = end if end is not None else int(time.time())
+        self._interval = interval
+        self._rate_limiter = rate_limiter
+        self._fetcher_class = fetcher_class
+
+    def get_checkpoint(self, symbol: KrakenSymbols):
+        """Get the checkpoint to resume from, a checkpoint saved for a
+        different start time is reset to this backfill start time."""
+        checkpoint, created = (KrakenBackfillCheckpoint.objects
+                               .get_or_create(symbol=symbol,
+                                              interval=self._interval,
+                                              defaults={
+                                                  'start': self._start,
+                                                  'since': self._start,
+                                              }))
+        if not created and checkpoint.start != self._start:
+            checkpoint.start = self._start
+            checkpoint.since = self._start
+            checkpoint.completed = False
+            checkpoint.save()
+        return checkpoint
+
+    def fetch_page(self, symbol: str, since: int):
+        """Fetch a page of data and return it ready to be iterated"""
+        params = create_OHLC_params(symbol, since)
+        params['interval'] = self._interval
+        response = fetch_symbol_response(self._url, params,
+                                         self._rate_limiter,
+                                         fetcher_class=self._fetcher_class)
+        kraken_extractor = KrakenResponseExtractor(response, symbol)
+        response_extractor = ResponseExtractor()
+        response_extractor.extract_response(kraken_extractor)
+        return kraken_extractor, response_extractor
+
+    def save_page(self, columns, symbol: str):
+        """Save the columns of a page as KrakenOHLC when the interval is
+        daily, as KrakenCandle of the interval otherwise"""
+        if self._interval == INCREMENT_STEPS:
+            return bulk_save_OHLC_columns(columns, symbol)
+        return bulk_save_candle_columns(columns, symbol, self._interval)
+
+    def is_last_page(self, since: int, cursor):
+        """The cursor stops moving forward once there is no newer data"""
+        return cursor is None or cursor <= since or cursor >= self._end
+
+    def backfill_symbol(self, symbol: KrakenSymbols):
+        """Request and save every page for symbol starting from its
+        checkpoint.
+        @returns:
+            - tuple with amount of pages and rows saved.
+        """
+        checkpoint = self.get_checkpoint(symbol)
+        pages = 0
+        saved = 0
+        while not checkpoint.completed:
+            kraken_extractor, page = self.fetch_page(symbol.symbol,
+                                                     checkpoint.since)
+            cursor = kraken_extractor.last
+            with transaction.atomic():
+                result = self.save_page(page.columns(), symbol.symbol)
+                checkpoint.completed = self.is_last_page(checkpoint.since,
+                                                         cursor)
+                if cursor is not None:
+                    checkpoint.since = max(checkpoint.since, cursor)
+                checkpoint.save()
+            pages += 1
+            saved += result.saved
+        logger.info(f'Backfill for {symbol.symbol} saved {saved} rows on '
+                    f'{pages} pages')
+        return pages, saved
+
+    def run(self, symbols=None):
+        """Backfill every symbol, an error on a symbol leaves its checkpoint
+        at the last saved page and the backfill carries on with the next
+        symbol.
+        @args:
+            - symbols: KrakenSymbols to backfill, defaults to all of them.
+        """
+        if symbols is None:
+            symbols = KrakenSymbols.objects.all()
+        for symbol in symbols:
+            try:
+                self.backfill_symbol(symbol)
+            except (ExtractorErrorResponse, NonRelatedResponseError) as e:
+                log_symbol_error(symbol.symbol, e)
+
+    def __repr__(self):
+        class_name = self.__class__.__name__
+        return f'{class_name}({self._url!r}, {self._start}, {self._end}, ' \
+               f'{self._interval})'
+
+    def __str__(self):
+        return f'Kraken backfill from {self._start} to {self._end}'
+
+
+def backfill_kraken_data(data_type: str, start: int, end: int = None,
+                         rate_limiter=None,
+                         fetcher_class=KrakenContentFetcher):
+    """Provided a data type (OHLC, ), backfill data for all the symbols
+    saved at KrakenSymbols from start up to end."""
+    url = get_kraken_url(data_type)
+    if url is not None:
+        KrakenBackfill(url, start, end, rate_limiter=rate_limiter,
+                       fetcher_class=fetcher_class).run()
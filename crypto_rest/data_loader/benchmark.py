@@ -0,0 +1,339 @@
+"""Measure the Kraken ingestion pipeline end to end, fetch -> extract ->
+validate -> save, over synthetic responses served by KrakenStubServer"""
+import math
+import contextlib
+import datetime
+import platform
+import time
+import tracemalloc
+from collections import defaultdict
+import django
+import numpy as np
+from rest_framework.serializers import ValidationError
+from crypto_data.models import KrakenOHLC, KrakenOHLCRollup, KrakenSymbols
+from crypto_data.serializers import KrakenOHLCSerializer
+from crypto_data.symbol_registry import symbol_registry
+from data_loader.kraken_data_loader import (KrakenContentFetcher,
+                                            KrakenResponseExtractor)
+from data_loader.response_extractor import ResponseExtractor
+from data_loader.stream_extractor import KrakenStreamExtractor
+from data_loader.bulk_loader import (validate_OHLC_batch,
+                                     validate_OHLC_columns,
+                                     save_rows)
+from data_loader.postgres_data_loader import create_OHLC_params
+from data_loader.kraken_stub_server import KrakenStubServer, HISTORY_START
+
+
+SIZES = (1000, 100000, 1000000)
+DEFAULT_SYMBOLS = 6
+# saving item by item takes milliseconds per candle, bigger sizes take
+# from minutes to hours on that pipeline
+PER_ROW_MAX_CANDLES = 10000
+# days of candles served per symbol, the candles of bigger sizes are
+# spread across more symbols instead, so the OHLC table keeps a realistic
+# amount of monthly partitions and every stage gets a sample per symbol.
+MAX_DAYS_PER_SYMBOL = 720
+DAY = 86400
+STAGES = ('fetch', 'extract', 'validate', 'save')
+
+
+class StageTimer:
+    """Measure the time spent on every stage of a pipeline, one sample per
+    stage and batch, a response or a chunk of a streamed response.
+    Methods:
+        - start_batch: start measuring a batch.
+        - measure: context manager adding the time spent in it to a stage.
+        - end_batch: record the samples of the current batch.
+        - summary: p50, p99, total seconds and samples per stage.
+    """
+    def __init__(self):
+        self._samples = defaultdict(list)
+        self._current = None
+
+    def start_batch(self):
+        self._current = defaultdict(float)
+
+    @contextlib.contextmanager
+    def measure(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._current[stage] += time.perf_counter() - start
+
+    def end_batch(self):
+        for stage, seconds in self._current.items():
+            self._samples[stage].append(seconds)
+        self._current = None
+
+    def summary(self):
+        return {stage: {'p50': float(np.percentile(samples, 50)),
+                        'p99': float(np.percentile(samples, 99)),
+                        'total': float(np.sum(samples)),
+                        'samples': len(samples)}
+                for stage, samples in self._samples.items()}
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}()'
+
+
+def extract_response(response: dict, symbol: str):
+    """Extract a decoded response as the loader does"""
+    response_extractor = ResponseExtractor()
+    response_extractor.extract_response(
+        KrakenResponseExtractor(response, symbol))
+    return response_extractor
+
+
+def run_per_row(url: str, params: dict, symbol: str, timer: StageTimer):
+    """Original pipeline, every item is validated and saved on its own as
+    save_OHLC_data_on_database does"""
+    timer.start_batch()
+    with timer.measure('fetch'):
+        response = KrakenContentFetcher(url, params).fetch()
+    with timer.measure('extract'):
+        items = list(extract_response(response, symbol))
+    for serializer_data in items:
+        serializer_data['symbol'] = symbol
+        serializer = KrakenOHLCSerializer(data=serializer_data)
+        try:
+            with timer.measure('validate'):
+                serializer.is_valid(raise_exception=True)
+        except ValidationError:
+            continue
+        with timer.measure('save'):
+            serializer.save()
+    timer.end_batch()
+
+
+def run_bulk(url: str, params: dict, symbol: str, timer: StageTimer):
+    """Items extracted one by one and saved in one batch"""
+    timer.start_batch()
+    with timer.measure('fetch'):
+        response = KrakenContentFetcher(url, params).fetch()
+    with timer.measure('extract'):
+        items = list(extract_response(response, symbol))
+    with timer.measure('validate'):
+        rows, rejected = validate_OHLC_batch(items, symbol)
+    with timer.measure('save'):
+        save_rows(rows, rejected, symbol)
+    timer.end_batch()
+
+
+def run_columns(url: str, params: dict, symbol: str, timer: StageTimer):
+    """Items extracted as columns and saved in one batch"""
+    timer.start_batch()
+    with timer.measure('fetch'):
+        response = KrakenContentFetcher(url, params).fetch()
+    with timer.measure('extract'):
+        columns = extract_response(response, symbol).columns()
+    with timer.measure('validate'):
+        rows, rejected = validate_OHLC_columns(columns, symbol)
+    with timer.measure('save'):
+        save_rows(rows, rejected, symbol)
+    timer.end_batch()
+
+
+def run_stream(url: str, params: dict, symbol: str, timer: StageTimer):
+    """Response parsed while it is received and saved in chunks, every chunk
+    is a batch. Fetch only measures the wait for the response to start, on
+    the first batch, reading the body is part of extract"""
+    timer.start_batch()
+    with timer.measure('fetch'):
+        chunks = KrakenContentFetcher(url, params).fetch_stream()
+    column_chunks = KrakenStreamExtractor(chunks, symbol).column_chunks()
+    while True:
+        with timer.measure('extract'):
+            columns = next(column_chunks, None)
+        if columns is None:
+            timer.end_batch()
+            return
+        with timer.measure('validate'):
+            rows, rejected = validate_OHLC_columns(columns, symbol)
+        with timer.measure('save'):
+            save_rows(rows, rejected, symbol)
+        timer.end_batch()
+        timer.start_batch()
+
+
+# pipelines benchmarked by default, add new loading paths here
+PIPELINES = {
+    'per_row': run_per_row,
+    'bulk': run_bulk,
+    'columns': run_columns,
+    'stream': run_stream,
+}
+
+
+def create_benchmark_symbols(amount: int):
+    """Replace the saved symbols with amount of synthetic ones"""
+    KrakenSymbols.objects.all().delete()
+    symbols = [KrakenSymbols(coin_name=f'bench coin {i}',
+                             coin_symbol=f'B{i:05d}',
+                             currency=KrakenSymbols.US_DOLLARS,
+                             symbol=f'B{i:05d}USD')
+               for i in range(amount)]
+    KrakenSymbols.objects.bulk_create(symbols)
+    # bulk_create does not send post_save
+    symbol_registry.invalidate()
+    return [s.symbol for s in symbols]
+
+
+def clear_OHLC_data():
+    """Empty the OHLC table and its rollups so every run inserts all its
+    rows, nothing references the tables so these are single DELETE queries"""
+    KrakenOHLC.objects.all().delete()
+    KrakenOHLCRollup.objects.all().delete()
+
+
+def run_pipeline(pipeline, url: str, symbols: list):
+    """Run pipeline for every symbol.
+    @returns:
+        - tuple (StageTimer, elapsed seconds).
+    """
+    timer = StageTimer()
+    start = time.perf_counter()
+    for symbol in symbols:
+        pipeline(url, create_OHLC_params(symbol, HISTORY_START), symbol,
+                 timer)
+    return timer, time.perf_counter() - start
+
+
+def measure_peak_memory(pipeline, url: str, symbols: list):
+    """Peak bytes allocated while running pipeline, measured on its own run
+    as tracing allocations slows the pipeline down. Allocations of a stub
+    server running in the same process are included."""
+    tracemalloc.start()
+    try:
+        run_pipeline(pipeline, url, symbols)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def benchmark_pipeline(name: str, url: str, symbols: list,
+                       candles_per_symbol: int, measure_memory: bool = True):
+    """Benchmark a pipeline over empty OHLC data.
+    @returns:
+        - dict with rows saved, rows per second, stages latency and peak
+        memory.
+    """
+    pipeline = PIPELINES[name]
+    clear_OHLC_data()
+    timer, seconds = run_pipeline(pipeline, url, symbols)
+    rows = KrakenOHLC.objects.count()
+    result = {
+        'pipeline': name,
+        'candles': candles_per_symbol * len(symbols),
+        'symbols': len(symbols),
+        'rows': rows,
+        'seconds': seconds,
+        'rows_per_second': rows / seconds if seconds else None,
+        'stages': timer.summary(),
+        'peak_memory_bytes': None,
+    }
+    if measure_memory:
+        clear_OHLC_data()
+        result['peak_memory_bytes'] = measure_peak_memory(pipeline, url,
+                                                          symbols)
+    return result
+
+
+def benchmark_symbols_amount(size: int, symbols: int,
+                             max_days: int = MAX_DAYS_PER_SYMBOL):
+    """Amount of symbols size candles are spread across, at least symbols
+    and enough for none to get more than max_days candles"""
+    return min(size, max(symbols, math.ceil(size / max_days)))
+
+
+def run_benchmarks(sizes=SIZES, symbols: int = DEFAULT_SYMBOLS,
+                   pipelines=None, measure_memory: bool = True,
+                   per_row_max_candles: int = PER_ROW_MAX_CANDLES,
+                   server_options: dict = None, report=print,
+                   max_days: int = MAX_DAYS_PER_SYMBOL):
+    """Benchmark every pipeline for every size of candles spread across
+    the symbols, data is served by a KrakenStubServer started for the run.
+    Candles are daily so every symbol gets candles // symbols consecutive
+    days starting at 2010, see benchmark_symbols_amount.
+    @args:
+        - sizes: total amount of candles of every run.
+        - symbols: least amount of symbols the candles are spread across.
+        - pipelines: names on PIPELINES to run, defaults to all of them.
+        - measure_memory: measure peak memory on an extra run.
+        - per_row_max_candles: skip the per_row pipeline above this size.
+        - server_options: keyword arguments for KrakenStubServer, i.e
+        latency.
+        - report: function called with a line of text after every run.
+        - max_days: most candles served per symbol.
+    @returns:
+        - dict ready to be written as JSON, with the environment and the
+        result of every run.
+    """
+    pipelines = list(pipelines or PIPELINES)
+    results = []
+    for size in sizes:
+        symbols_amount = benchmark_symbols_amount(size, symbols, max_days)
+        candles_per_symbol = size // symbols_amount
+        symbol_names = create_benchmark_symbols(symbols_amount)
+        server = KrakenStubServer(
+            candles=candles_per_symbol,
+            end=HISTORY_START + candles_per_symbol * DAY,
+            pairs=symbol_names,
+            **(server_options or {}))
+        with server:
+            for name in pipelines:
+                if name == 'per_row' and size > per_row_max_candles:
+                    report(f'{name:>8} {size:>9} candles skipped, bigger '
+                           f'than {per_row_max_candles}')
+                    continue
+                result = benchmark_pipeline(name, f'{server.url}/OHLC',
+                                            symbol_names,
+                                            candles_per_symbol,
+                                            measure_memory)
+                results.append(result)
+                report(format_result(result))
+    clear_OHLC_data()
+    return {
+        'created': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'django': django.get_version(),
+            'numpy': np.__version__,
+        },
+        'results': results,
+    }
+
+
+def format_result(result: dict):
+    """One line summary of a benchmark result"""
+    stages = ' '.join(
+        f'{stage} p50={result["stages"][stage]["p50"] * 1000:.1f}ms '
+        f'p99={result["stages"][stage]["p99"] * 1000:.1f}ms'
+        for stage in STAGES if stage in result['stages'])
+    memory = result['peak_memory_bytes']
+    memory = f'{memory / 2 ** 20:.1f}MiB' if memory is not None else '-'
+    return (f'{result["pipeline"]:>8} {result["candles"]:>9} candles '
+            f'{result["rows_per_second"]:>10.0f} rows/s peak {memory} '
+            f'{stages}')
+
+
+def compare_results(previous: dict, current: dict):
+    """Compare the throughput of two benchmark reports.
+    @returns:
+        - list of tuples (pipeline, candles, previous rows/s, current rows/s,
+        ratio), ratio below 1 is a regression.
+    """
+    def by_run(report):
+        return {(r['pipeline'], r['candles']): r['rows_per_second']
+                for r in report['results']}
+
+    previous_runs = by_run(previous)
+    comparison = []
+    for key, rows_per_second in by_run(current).items():
+        before = previous_runs.get(key)
+        if before and rows_per_second:
+            comparison.append((*key, before, rows_per_second,
+                               rows_per_second / before))
+    return comparison
+
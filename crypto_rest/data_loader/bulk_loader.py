@@ -0,0 +1,472 @@
+"""Save batches of OHLC data into Postgres sql database with COPY"""
+import datetime
+import io
+import logging
+import re
+from collections import defaultdict, namedtuple
+from collections.abc import Iterator
+from functools import partial
+import numpy as np
+from django.db import connections, transaction, DEFAULT_DB_ALIAS
+from rest_framework.fields import empty
+from rest_framework.serializers import Serializer, ValidationError
+from crypto_data.models import KrakenOHLC, KrakenCandle
+from crypto_data.candle_store import get_candle_store, StoredCandles
+from crypto_data.custom_fields import (FixedPointField,
+                                       FIXED_POINT_MAX_DIGITS,
+                                       PRICE_DECIMAL_PLACES)
+from crypto_data.partitions import ensure_partitions
+from crypto_data.signals import ohlc_batch_written
+from crypto_data.symbol_registry import symbol_registry
+from crypto_data.serializers import (KrakenOHLCRowSerializer,
+                                     KrakenOHLCSerializer)
+
+
+# duplicates are valid rows dropped for a later row of the batch with the
+# same date, or candle time, they are neither saved nor rejected
+BulkLoadResult = namedtuple('BulkLoadResult',
+                            'symbol saved rejected duplicates',
+                            defaults=(0, ))
+SavedRows = namedtuple('SavedRows', 'saved duplicates')
+# model a batch is copied into, value_fields are written on every row in the
+# order they are sent to COPY followed by the symbol, conflict_fields
+# identify a row that is updated instead of inserted and partition_field is
+# the time field the table is partitioned by.
+CopyTarget = namedtuple('CopyTarget',
+                        'model value_fields conflict_fields partition_field')
+
+OHLC_VALUE_FIELDS = ('open', 'high', 'low', 'close', 'date')
+CANDLE_VALUE_FIELDS = ('interval', 'ts', 'open', 'high', 'low', 'close',
+                       'vwap', 'volume', 'count')
+CANDLE_DECIMAL_FIELDS = ('open', 'high', 'low', 'close', 'vwap', 'volume')
+OHLC_TARGET = CopyTarget(KrakenOHLC, OHLC_VALUE_FIELDS, ('symbol', 'date'),
+                         'date')
+CANDLE_TARGET = CopyTarget(KrakenCandle, CANDLE_VALUE_FIELDS,
+                           ('symbol', 'interval', 'ts'), 'ts')
+STAGING_TABLE = 'bulk_load_staging'
+# prices as Kraken sends them, plain decimal numbers that always fit a
+# FixedPointPriceField, and ISO dates, converted without the serializer
+# fields, other values are validated by them
+PRICE_PATTERN = re.compile(
+    rf'(-?\d{{1,{FIXED_POINT_MAX_DIGITS - PRICE_DECIMAL_PLACES}}})'
+    rf'(?:\.(\d{{1,{PRICE_DECIMAL_PLACES}}}))?', re.ASCII)
+DATE_PATTERN = re.compile(r'\d{4}-\d{2}-\d{2}', re.ASCII)
+
+logger = logging.getLogger(__name__)
+
+
+def model_column(field_name: str, model=KrakenOHLC):
+    """get the database column of a model field"""
+    return model._meta.get_field(field_name).column
+
+
+def copy_columns(target: CopyTarget = OHLC_TARGET):
+    """database columns filled by COPY, the values followed by the symbol
+    foreign key"""
+    return [*(model_column(f, target.model) for f in target.value_fields),
+            model_column('symbol', target.model)]
+
+
+def validate_field(name: str, field, serializer_data: dict):
+    """validate a single value, errors are keyed by field name as the
+    serializer would do"""
+    try:
+        return field.run_validation(serializer_data.get(name))
+    except ValidationError as e:
+        raise ValidationError({name: e.detail}) from e
+
+
+def parse_OHLC_item(item: dict):
+    """Values of an item in the order of OHLC_VALUE_FIELDS if its prices are
+    plain decimal numbers and its date is ISO formatted, the same values
+    the KrakenOHLCRowSerializer fields give, None for any other item"""
+    values = []
+    for name in OHLC_VALUE_FIELDS[:-1]:
+        value = item.get(name)
+        if type(value) is not str:
+            if type(value) not in (int, float):
+                return None
+            value = str(value)
+        match = PRICE_PATTERN.fullmatch(value)
+        if match is None:
+            return None
+        units, decimals = match.groups()
+        values.append(int(units + (decimals or '')
+                          .ljust(PRICE_DECIMAL_PLACES, '0')))
+    date = item.get('date')
+    if type(date) is str and DATE_PATTERN.fullmatch(date):
+        try:
+            date = datetime.date.fromisoformat(date)
+        except ValueError:
+            return None
+    elif type(date) is not datetime.date:
+        return None
+    values.append(date)
+    return tuple(values)
+
+
+def validate_OHLC_batch(data_iterator: Iterator, related_symbol: str):
+    """Validate every dict on data_iterator as KrakenOHLCRowSerializer
+    would, no query is done as the symbol is not part of the validation.
+    Items as Kraken sends them are converted by parse_OHLC_item, others are
+    validated by the serializer fields.
+    @args:
+        - data_iterator: collection of dicts as returned by
+        KrakenResponseExtractor, None items are taken as rejected.
+        - related_symbol: symbol the data belongs to, used to log errors.
+    @returns:
+        - tuple (valid rows, amount of rejected rows), valid rows are tuples
+        with the values in the order of OHLC_VALUE_FIELDS.
+    """
+    # run the field validation directly, the serializer level validation
+    # adds nothing for these fields but it is most of the cost per row.
+    row_fields = KrakenOHLCRowSerializer().fields
+    fields = [(name, row_fields[name]) for name in OHLC_VALUE_FIELDS]
+    rows = []
+    rejected = 0
+    for serializer_data in data_iterator:
+        if serializer_data is None:
+            rejected += 1
+            continue
+        row = parse_OHLC_item(serializer_data)
+        if row is not None:
+            rows.append(row)
+            continue
+        try:
+            rows.append(tuple(validate_field(name, field, serializer_data)
+                              for name, field in fields))
+        except ValidationError as e:
+            rejected += 1
+            logger.error(f'Validation error for symbol {related_symbol}'
+                         f'{e}')
+    return rows, rejected
+
+
+def validate_OHLC_items(items: list):
+    """Validate items naming the symbol they belong to, as KrakenOHLCSerializer
+    would without querying, symbols are resolved through
+    crypto_data.symbol_registry, every error of an item is reported.
+    @args:
+        - items: list of dicts with the KrakenOHLCSerializer fields but url.
+    @returns:
+        - tuple (valid rows by symbol id, errors), valid rows are tuples with
+        the values in the order of OHLC_VALUE_FIELDS and errors are dicts
+        with the index of the item and its errors by field.
+    """
+    row_fields = KrakenOHLCRowSerializer().fields
+    fields = [(name, row_fields[name]) for name in OHLC_VALUE_FIELDS]
+    symbol_field = KrakenOHLCSerializer().fields['symbol']
+    rows = defaultdict(list)
+    errors = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            errors.append({'index': index, 'errors': {
+                'non_field_errors': [
+                    Serializer.default_error_messages['invalid'].format(
+                        datatype=type(item).__name__)]}})
+            continue
+        item_errors = {}
+        values = []
+        for name, field in fields:
+            try:
+                values.append(field.run_validation(item.get(name, empty)))
+            except ValidationError as e:
+                item_errors[name] = e.detail
+        symbol = item.get('symbol')
+        symbol_id = (symbol_registry.id_of(symbol)
+                     if isinstance(symbol, str) else None)
+        if 'symbol' not in item:
+            item_errors['symbol'] = [symbol_field.error_messages['required']]
+        elif symbol_id is None:
+            item_errors['symbol'] = [
+                symbol_field.error_messages['does_not_exist'].format(
+                    slug_name='symbol', value=symbol)]
+        if item_errors:
+            errors.append({'index': index, 'errors': item_errors})
+        else:
+            rows[symbol_id].append(tuple(values))
+    return rows, errors
+
+
+def rows_to_copy_buffer(rows: list, symbol_id: int):
+    """Write rows in COPY text format, tab separated values and one row per
+    line, every row ends with the symbol id"""
+    buffer = io.StringIO()
+    buffer.writelines('\t'.join([*(str(v) for v in row), str(symbol_id)])
+                      + '\n' for row in rows)
+    buffer.seek(0)
+    return buffer
+
+
+def copy_rows_into_staging(cursor, rows: list, symbol_id: int,
+                           target: CopyTarget = OHLC_TARGET):
+    """Create a staging table shaped like the target table, dropped at
+    commit, and stream rows into it with COPY"""
+    columns = ', '.join(copy_columns(target))
+    cursor.execute(f'CREATE TEMPORARY TABLE {STAGING_TABLE} ON COMMIT DROP '
+                   f'AS SELECT {columns} FROM {target.model._meta.db_table} '
+                   f'WITH NO DATA')
+    cursor.copy_expert(f'COPY {STAGING_TABLE} ({columns}) FROM STDIN',
+                       rows_to_copy_buffer(rows, symbol_id))
+
+
+def upsert_rows_from_staging(cursor, target: CopyTarget = OHLC_TARGET):
+    """Move rows from the staging table into the target table, a candle
+    already saved with the same conflict fields, i.e symbol and date, is
+    updated with the new values, this refreshes the last candle of a previous load which might
+    have still been open. Return the amount of inserted or updated rows.
+    The staging table is dropped straight away as the surrounding
+    transaction might hold more batches before commit."""
+    columns = copy_columns(target)
+    conflict_columns = [model_column(f, target.model)
+                        for f in target.conflict_fields]
+    updated_columns = ', '.join(f'{c} = EXCLUDED.{c}' for c in columns
+                                if c not in conflict_columns)
+    cursor.execute(f'INSERT INTO {target.model._meta.db_table} '
+                   f'({", ".join(columns)}) '
+                   f'SELECT {", ".join(columns)} FROM {STAGING_TABLE} '
+                   f'ON CONFLICT ({", ".join(conflict_columns)}) '
+                   f'DO UPDATE SET {updated_columns}')
+    saved = cursor.rowcount
+    cursor.execute(f'DROP TABLE {STAGING_TABLE}')
+    return saved
+
+
+def unique_by_date(rows: list, target: CopyTarget = OHLC_TARGET):
+    """keep the last row for every date, or every value of the conflict
+    fields other than the symbol, an upsert can not update the same row
+    twice in one statement"""
+    key_indexes = [target.value_fields.index(f)
+                   for f in target.conflict_fields if f != 'symbol']
+    return list({tuple(row[i] for i in key_indexes): row
+                 for row in rows}.values())
+
+
+def as_date(value):
+    """date of a date, datetime or ISO formatted value"""
+    if isinstance(value, datetime.datetime):
+        return value.astimezone(datetime.timezone.utc).date()
+    if isinstance(value, datetime.date):
+        return value
+    return datetime.date.fromisoformat(str(value)[:10])
+
+
+def partitions_range(rows: list, target: CopyTarget = OHLC_TARGET):
+    """dates of the first and last rows by the partition field"""
+    index = target.value_fields.index(target.partition_field)
+    dates = [as_date(row[index]) for row in rows]
+    return min(dates), max(dates)
+
+
+def ensure_rows_partitions(rows: list, using: str = DEFAULT_DB_ALIAS,
+                           target: CopyTarget = OHLC_TARGET):
+    """Create the partitions of the rows, candles are partitioned by
+    interval first so the partitions of every interval, held as text by
+    the rows, are created"""
+    if 'interval' not in target.value_fields:
+        ensure_partitions(target.model, *partitions_range(rows, target),
+                          using=using)
+        return
+    index = target.value_fields.index('interval')
+    for interval in {row[index] for row in rows}:
+        interval_rows = [row for row in rows if row[index] == interval]
+        ensure_partitions(target.model,
+                          *partitions_range(interval_rows, target),
+                          using=using, interval=int(interval))
+
+
+def save_rows(rows: list, rejected: int, related_symbol: str,
+              using: str = DEFAULT_DB_ALIAS,
+              target: CopyTarget = OHLC_TARGET):
+    """Resolve the related symbol through crypto_data.symbol_registry and
+    upsert the already validated rows of the target model with
+    save_symbol_rows.
+    @returns:
+        - BulkLoadResult with the amount of saved (inserted or updated) and
+        rejected rows.
+    """
+    symbol_id = symbol_registry.id_of(related_symbol)
+    if symbol_id is None:
+        logger.error(f'Symbol {related_symbol} does not exist, rejecting '
+                     f'{len(rows)} rows')
+        return BulkLoadResult(related_symbol, 0, rejected + len(rows))
+    saved, duplicates = save_symbol_rows(rows, symbol_id, using, target)
+    result = BulkLoadResult(related_symbol, saved, rejected, duplicates)
+    logger.info(f'Bulk load for {related_symbol} saved {saved} rows, '
+                f'rejected {rejected} and dropped {duplicates} duplicates')
+    return result
+
+
+def save_symbol_rows(rows: list, symbol_id: int,
+                     using: str = DEFAULT_DB_ALIAS,
+                     target: CopyTarget = OHLC_TARGET):
+    """Upsert already validated rows of a symbol through a staging table,
+    the partitions the rows belong to are created first and
+    ohlc_batch_written is sent once they are written.
+    @returns:
+        - SavedRows with the amount of saved (inserted or updated) rows and
+        of rows dropped for a later row of the same date, only the last row
+        of a date is saved.
+    """
+    unique_rows = unique_by_date(rows, target)
+    duplicates = len(rows) - len(unique_rows)
+    if duplicates:
+        logger.warning(f'Dropped {duplicates} rows of symbol {symbol_id} '
+                       f'repeating the date of a later row of the batch')
+    rows = unique_rows
+    if not rows:
+        return SavedRows(0, duplicates)
+    first, last = partitions_range(rows, target)
+    ensure_rows_partitions(rows, using, target)
+    with transaction.atomic(using=using):
+        with connections[using].cursor() as cursor:
+            copy_rows_into_staging(cursor, rows, symbol_id, target)
+            saved = upsert_rows_from_staging(cursor, target)
+        # in the same transaction, what is derived from the rows is
+        # never out of date with them
+        ohlc_batch_written.send(sender=target.model, symbol_id=symbol_id,
+                                first=first, last=last, using=using)
+    return SavedRows(saved, duplicates)
+
+
+def bulk_save_OHLC_data_on_database(data_iterator: Iterator,
+                                    related_symbol: str,
+                                    using: str = DEFAULT_DB_ALIAS):
+    """Save a batch of OHLC data with a handful of queries no matter the
+    batch size, as opposed to save_OHLC_data_on_database which does several
+    queries per item.
+    1 - validate the whole batch in memory.
+    2 - resolve the related symbol once.
+    3 - COPY the valid rows into a staging table and upsert them from there.
+    @args:
+        - data_iterator: instance with __iter__ or __getitem__ implemented
+        yielding dicts as KrakenResponseExtractor does.
+        - related_symbol: symbol the data belongs to.
+        - using: database alias to write to.
+    @returns:
+        - BulkLoadResult with the amount of saved (inserted or updated) and
+        rejected rows.
+    """
+    rows, rejected = validate_OHLC_batch(data_iterator, related_symbol)
+    return save_rows(rows, rejected, related_symbol, using)
+
+
+def price_limit(field_name: str, model=KrakenOHLC):
+    """Smallest absolute value that does not fit in a price column"""
+    field = model._meta.get_field(field_name)
+    return 10 ** (field.max_digits - field.decimal_places)
+
+
+def format_price_column(column, field_name: str, model=KrakenOHLC):
+    """Format a price column with the decimal places of its model field,
+    formatting rounds the same way round() does on the per item path. Prices
+    of a FixedPointField are written as the scaled integers."""
+    field = model._meta.get_field(field_name)
+    if isinstance(field, FixedPointField):
+        scaled = np.rint(column * 10 ** field.decimal_places)
+        return scaled.astype(np.int64).astype(str)
+    return np.char.mod(f'%.{field.decimal_places}f', column)
+
+
+def valid_decimals_mask(columns, field_names, model=KrakenOHLC):
+    """Rows whose values are finite and fit in their decimal column once
+    rounded"""
+    valid = np.ones(len(columns.time), dtype=bool)
+    for field_name in field_names:
+        column = getattr(columns, field_name)
+        decimal_places = model._meta.get_field(field_name).decimal_places
+        valid &= np.isfinite(column)
+        valid &= np.abs(np.round(column, decimal_places)) < price_limit(
+            field_name, model)
+    return valid
+
+
+def validate_OHLC_columns(columns, related_symbol: str):
+    """Validate OHLC_columns with vectorized checks equivalent to the
+    KrakenOHLCRowSerializer fields validation, prices must be finite and
+    fit in their column once rounded.
+    @returns:
+        - tuple (valid rows, amount of rejected rows), valid rows are tuples
+        of strings in the order of OHLC_VALUE_FIELDS.
+    """
+    price_fields = OHLC_VALUE_FIELDS[:-1]
+    valid = valid_decimals_mask(columns, price_fields)
+    rejected = int(np.count_nonzero(~valid))
+    if rejected:
+        logger.error(f'Validation error for symbol {related_symbol}, '
+                     f'{rejected} rows with invalid prices')
+    formatted = [format_price_column(getattr(columns, f)[valid], f)
+                 for f in price_fields]
+    formatted.append(np.datetime_as_string(columns.date[valid], unit='D'))
+    return list(zip(*(c.tolist() for c in formatted))), rejected
+
+
+def bulk_save_OHLC_columns(columns, related_symbol: str,
+                           using: str = DEFAULT_DB_ALIAS):
+    """Same as bulk_save_OHLC_data_on_database for data extracted as
+    OHLC_columns, validation and formatting run on whole columns instead of
+    item by item.
+    @args:
+        - columns: OHLC_columns as returned by KrakenResponseExtractor.columns
+        - related_symbol: symbol the data belongs to.
+        - using: database alias to write to.
+    """
+    rows, rejected = validate_OHLC_columns(columns, related_symbol)
+    return save_rows(rows, rejected, related_symbol, using)
+
+
+def validate_candle_columns(columns, interval: int, related_symbol: str):
+    """Validate OHLC_columns to be saved as KrakenCandle, prices and volume
+    must be finite and fit in their column once rounded.
+    @returns:
+        - tuple (valid rows, amount of rejected rows), valid rows are tuples
+        of strings in the order of CANDLE_VALUE_FIELDS.
+    """
+    valid = valid_decimals_mask(columns, CANDLE_DECIMAL_FIELDS, KrakenCandle)
+    rejected = int(np.count_nonzero(~valid))
+    if rejected:
+        logger.error(f'Validation error for symbol {related_symbol}, '
+                     f'{rejected} candles with invalid values')
+    formatted = {f: format_price_column(getattr(columns, f)[valid], f,
+                                        KrakenCandle)
+                 for f in CANDLE_DECIMAL_FIELDS}
+    times = columns.time[valid]
+    formatted['interval'] = np.full(len(times), str(interval))
+    formatted['ts'] = np.datetime_as_string(times.astype('datetime64[s]'),
+                                            timezone='UTC')
+    formatted['count'] = columns.count[valid].astype(str)
+    return list(zip(*(formatted[f].tolist()
+                      for f in CANDLE_VALUE_FIELDS))), rejected
+
+
+def bulk_save_candle_columns(columns, related_symbol: str, interval: int,
+                             using: str = DEFAULT_DB_ALIAS):
+    """Save OHLC_columns of any Kraken interval as KrakenCandle, candles
+    already saved for the same symbol, interval and time are updated.
+    @args:
+        - columns: OHLC_columns as returned by KrakenResponseExtractor.columns
+        - related_symbol: symbol the data belongs to.
+        - interval: candle interval in minutes, one of KrakenCandle.INTERVALS
+        - using: database alias to write to.
+    """
+    rows, rejected = validate_candle_columns(columns, interval,
+                                             related_symbol)
+    result = save_rows(rows, rejected, related_symbol, using, CANDLE_TARGET)
+    store = get_candle_store()
+    if store is not None and result.saved:
+        # the store only gets candles the database committed
+        transaction.on_commit(partial(store.append, related_symbol, interval,
+                                      stored_candles(columns)),
+                              using=using)
+    return result
+
+
+def stored_candles(columns):
+    """Valid candles of OHLC_columns as StoredCandles, decimals rounded as
+    the database does"""
+    valid = valid_decimals_mask(columns, CANDLE_DECIMAL_FIELDS, KrakenCandle)
+    decimals = {f: np.round(getattr(columns, f)[valid],
+                            KrakenCandle._meta.get_field(f).decimal_places)
+                for f in CANDLE_DECIMAL_FIELDS}
+    return StoredCandles(time=columns.time[valid], count=columns.count[valid],
+                         **decimals)
@@ -0,0 +1,155 @@
+"""Shared HTTP session and retry policy for requests to Kraken API"""
+import datetime
+import email.utils
+import random
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+
+
+POOL_SIZE = 10
+MAX_RETRIES = 3
+BACKOFF_BASE = 0.5  # seconds waited before the first retry, doubles after
+BACKOFF_MAX = 30  # never back off longer than this between retries
+# a Retry-After longer than this is not waited for, the request fails
+RETRY_AFTER_MAX = 300
+RETRY_STATUS_CODES = frozenset([429, 500, 502, 503, 504])
+
+
+class TransportStats:
+    """Thread safe counters of the requests sent through the shared session.
+    Methods:
+        - increment: add to a counter.
+        - as_dict: counters together with the connection pool usage.
+    """
+    COUNTERS = ('requests', 'retries')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = dict.fromkeys(self.COUNTERS, 0)
+
+    def increment(self, counter: str, amount: int = 1):
+        with self._lock:
+            self._counters[counter] += amount
+
+    def __getattr__(self, name):
+        if name in self.COUNTERS:
+            return self._counters[name]
+        raise AttributeError(name)
+
+    def as_dict(self, session: requests.Session = None):
+        """Get counters, when session is provided include how many
+        connections were opened and how many requests reused one."""
+        with self._lock:
+            stats = dict(self._counters)
+        if session is not None:
+            opened, sent = pool_usage(session)
+            stats['connections_opened'] = opened
+            stats['connections_reused'] = sent - opened
+        return stats
+
+    def reset(self):
+        with self._lock:
+            self._counters = dict.fromkeys(self.COUNTERS, 0)
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}()'
+
+    def __str__(self):
+        return f'Transport stats {self.as_dict()}'
+
+
+def pool_usage(session: requests.Session):
+    """Sum the connections opened and requests sent by every connection
+    pool of the session"""
+    opened = 0
+    sent = 0
+    # the same adapter can be mounted for several prefixes
+    adapters = {id(a): a for a in session.adapters.values()}
+    for adapter in adapters.values():
+        pools = adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools[key]
+            opened += pool.num_connections
+            sent += pool.num_requests
+    return opened, sent
+
+
+def create_session(pool_size: int = POOL_SIZE):
+    """Create a session keeping up to pool_size connections alive per host,
+    enough for every worker thread to hold its own connection"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size,
+                          pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+_session = None
+_pool_size = None
+_session_lock = threading.Lock()
+stats = TransportStats()
+
+
+def get_session():
+    """Get the session shared by all fetchers, created on first use"""
+    global _session, _pool_size
+    with _session_lock:
+        if _session is None:
+            _session = create_session()
+            _pool_size = POOL_SIZE
+        return _session
+
+
+def configure_session(pool_size: int = POOL_SIZE):
+    """Replace the shared session with one using pool_size connections"""
+    global _session, _pool_size
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+        _session = create_session(pool_size)
+        _pool_size = pool_size
+        return _session
+
+
+def ensure_pool_size(pool_size: int):
+    """Make the shared session keep at least pool_size connections alive,
+    so every worker thread of a load holds its own connection. The session
+    is only replaced when its pool is smaller."""
+    with _session_lock:
+        current = _pool_size if _session is not None else None
+    if current is None or current < pool_size:
+        configure_session(max(pool_size, POOL_SIZE))
+
+
+def backoff_time(attempt: int, base: float = BACKOFF_BASE,
+                 maximum: float = BACKOFF_MAX):
+    """Exponential backoff with full jitter, a random time between 0 and
+    base * 2 ** attempt so workers retrying at once spread out"""
+    return random.uniform(0, min(maximum, base * 2 ** attempt))
+
+
+def retry_after_time(response):
+    """Seconds requested by the Retry-After header of response, which can
+    be either seconds or a HTTP date. Return None when there is no valid
+    header. The time is not capped, callers wait for it or give up, see
+    RETRY_AFTER_MAX."""
+    value = response.headers.get('Retry-After')
+    if value is None:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            retry_date = email.utils.parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        now = datetime.datetime.now(datetime.timezone.utc)
+        seconds = (retry_date - now).total_seconds()
+    return max(0.0, seconds)
+
+
+def is_retryable_status(status_code: int):
+    """Kraken throttling (429) and server errors are worth retrying"""
+    return status_code in RETRY_STATUS_CODES
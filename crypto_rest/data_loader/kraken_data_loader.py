@@ -3,14 +3,22 @@ import datetime
 import logging
 import numbers
 import pprint
+import time
 from collections import namedtuple
+import numpy as np
 import requests
-from requests.exceptions import Timeout, HTTPError
+from requests.exceptions import Timeout, HTTPError, ConnectionError
+from data_loader import http_transport
 from data_loader.resource_content_abs import ContentResourceFetcher
 from data_loader.errors import NonRelatedResponseError
+from crypto_data.custom_fields import PRICE_DECIMAL_PLACES
 
 
 OHLC_data = namedtuple('OHLC_data', 'open high low close')
+# every Kraken OHLC item as column arrays, time in unix seconds and date as
+# numpy datetime64 days.
+OHLC_columns = namedtuple('OHLC_columns',
+                          'time date open high low close vwap volume count')
 
 # Define loggers
 logger = logging.getLogger(__name__)
@@ -29,6 +37,8 @@ f_handler.setFormatter(f_format)
 logger.addHandler(c_handler)
 logger.addHandler(f_handler)
 
+REQUEST_TIMEOUT = 5
+STREAM_CHUNK_SIZE = 65536  # bytes read at once from streamed responses
 UNIX_TIME_2010 = 1262304000
 CURRENT_TIME = int(datetime.datetime.utcnow().timestamp())
 
@@ -73,24 +83,74 @@ class KrakenResponseIndex:
     HIGH = 2
     LOW = 3
     CLOSE = 4
+    VWAP = 5
+    VOLUME = 6
+    COUNT = 7
+    LENGTH = 8
+
+
+def create_OHLC_columns(OHLC_sequence: list, symbol: str = None):
+    """Convert a sequence of Kraken OHLC items into OHLC_columns in one pass,
+    numbers provided as JSON strings are parsed by numpy while building the
+    array and dates are converted for the whole column at once.
+    Items with missing values are logged and left out.
+    @args:
+        - OHLC_sequence: list of Kraken OHLC items.
+        - symbol: symbol the data belongs to, used to log errors.
+    """
+    try:
+        values = np.array(OHLC_sequence, dtype=np.float64).reshape(
+            -1, KrakenResponseIndex.LENGTH)
+    except ValueError:
+        # items of different length can not build a 2 dimension array,
+        # drop the incomplete ones and try again.
+        complete = [i for i in OHLC_sequence
+                    if len(i) == KrakenResponseIndex.LENGTH]
+        logger.error(f'Index exception at symbol {symbol}, '
+                     f'{len(OHLC_sequence) - len(complete)} incomplete items')
+        values = np.array(complete, dtype=np.float64).reshape(
+            -1, KrakenResponseIndex.LENGTH)
+    time_column = values[:, KrakenResponseIndex.DATE].astype(np.int64)
+    return OHLC_columns(
+        time=time_column,
+        date=time_column.astype('datetime64[s]').astype('datetime64[D]'),
+        open=values[:, KrakenResponseIndex.OPEN],
+        high=values[:, KrakenResponseIndex.HIGH],
+        low=values[:, KrakenResponseIndex.LOW],
+        close=values[:, KrakenResponseIndex.CLOSE],
+        vwap=values[:, KrakenResponseIndex.VWAP],
+        volume=values[:, KrakenResponseIndex.VOLUME],
+        count=values[:, KrakenResponseIndex.COUNT].astype(np.int64),
+    )
 
 
 class KrakenContentFetcher(ContentResourceFetcher):
-    """Fetch data from Kraken API or report error.
+    """Fetch data from Kraken API or report error. Requests go through a
+    session shared by all fetchers so connections are kept alive between
+    symbols, throttled responses, server errors and time outs are retried
+    with exponential backoff before reporting the error. A Retry-After sent
+    by Kraken is waited for in full, or the request fails straight away
+    when it is longer than http_transport.RETRY_AFTER_MAX.
     Methods:
         - fetch: fetch data.
+        - fetch_stream: fetch data as an iterator of bytes chunks.
     Properties:
     - kraken_symbol: Kraken symbol for requested information
     - request_since: start time for requested information.
     """
-    def __init__(self, url: str, params: dict):
+    def __init__(self, url: str, params: dict, session=None,
+                 max_retries: int = http_transport.MAX_RETRIES):
         """Initialize instance.
         @params:
         - Url: valid kraken base URL
         - params: valid kraken parameters to be used on building query URL
+        - session: requests session, defaults to the shared session.
+        - max_retries: times a failed request is retried.
         """
         self._url = url
         self._params = params
+        self._session = session
+        self._max_retries = max_retries
 
     @property
     def kraken_symbol(self):
@@ -103,20 +163,85 @@ class KrakenContentFetcher(ContentResourceFetcher):
         """starting date for which data is requested, this is in unix time"""
         return self._params.get('since')
 
+    @property
+    def session(self):
+        if self._session is None:
+            return http_transport.get_session()
+        return self._session
+
+    def _send_request(self, **kwargs):
+        http_transport.stats.increment('requests')
+        return self.session.get(self._url,
+                                params=self._params,
+                                timeout=REQUEST_TIMEOUT,
+                                **kwargs)
+
+    def _wait_before_retry(self, attempt: int, reason: str, wait_time=None):
+        """Log the retry and wait, by default with exponential backoff"""
+        if wait_time is None:
+            wait_time = http_transport.backoff_time(attempt)
+        http_transport.stats.increment('retries')
+        logger.warning(f'Retrying request for symbol {self.kraken_symbol} '
+                       f'in {wait_time:.2f} seconds because {reason}')
+        time.sleep(wait_time)
+
+    def _get_response(self, **kwargs):
+        """Send the request retrying on failures that are likely to be
+        transient, a Retry-After header sent by Kraken is honored.
+        @returns:
+            - On Success: response with status code ok.
+            - On Failure: raise HTTPError.
+        """
+        for attempt in range(self._max_retries + 1):
+            is_last_attempt = attempt == self._max_retries
+            try:
+                response = self._send_request(**kwargs)
+            except (Timeout, ConnectionError) as e:
+                if is_last_attempt:
+                    # requests' ConnectTimeout is both, it is a time out
+                    error = 'Time out' if isinstance(e, Timeout) \
+                        else 'Connection error'
+                    raise HTTPError(f'{error} when requesting url '
+                                    f'{self._url} with params '
+                                    f'{self._params}') from e
+                self._wait_before_retry(attempt, repr(e))
+                continue
+            if response.status_code == requests.codes.ok:
+                return response
+            if (is_last_attempt or
+                    not http_transport.is_retryable_status(
+                        response.status_code)):
+                raise HTTPError(f'Error response at requesting data for '
+                                f'symbol {self.kraken_symbol} for starting '
+                                f'date '
+                                f'{convert_unix_to_date(self.request_since)}')
+            retry_after = http_transport.retry_after_time(response)
+            if (retry_after is not None
+                    and retry_after > http_transport.RETRY_AFTER_MAX):
+                raise HTTPError(f'Kraken asked to retry the request for '
+                                f'symbol {self.kraken_symbol} after '
+                                f'{retry_after:.0f} seconds, giving up')
+            self._wait_before_retry(attempt,
+                                    f'status {response.status_code}',
+                                    retry_after)
+
     def fetch(self):
         """Fetch data from kraken API"""
+        return self._get_response().json()
+
+    def fetch_stream(self, chunk_size: int = STREAM_CHUNK_SIZE):
+        """Send the request straight away and return an iterator over the
+        response body in bytes chunks, the body is read from the connection
+        while it is iterated so it is never held in memory as a whole."""
+        response = self._get_response(stream=True)
+        return self._iter_chunks(response, chunk_size)
+
+    @staticmethod
+    def _iter_chunks(response, chunk_size: int):
         try:
-            response = requests.get(self._url,
-                                    params=self._params,
-                                    timeout=5)
-            if response.status_code == requests.codes.ok:
-                return response.json()
-            raise HTTPError(f'Error response at requesting data for symbol '
-                            f'{self.kraken_symbol} for starting date '
-                            f'{convert_unix_to_date(self.request_since)}')
-        except Timeout as e:
-            raise HTTPError(f'Time out when requesting url {self._url} with '
-                            f'params {self._params}') from e
+            yield from response.iter_content(chunk_size)
+        finally:
+            response.close()
 
     def __repr__(self):
         class_name = self.__class__.__name__
@@ -141,6 +266,10 @@ class KrakenResponseExtractor:
         - set_response_sequence: Response from Kraken is contained in a list
         , this method saves that list to self._response_sequence so later it
         can be iterated.
+        - columns: all the items as numpy column arrays, iterate over the
+        instance instead to get one dictionary per item.
+    Properties:
+        - last: cursor to request the data following this response.
 
     """
     def __init__(self, response: dict, symbol: str, *args, **kwargs):
@@ -159,6 +288,13 @@ class KrakenResponseExtractor:
         """Get result object from kraken response."""
         return self._response.get('result')
 
+    @property
+    def last(self):
+        """Cursor returned by Kraken to request the data following this
+        response, it must be used as 'since' on the next request."""
+        if self.response_result is not None:
+            return self.response_result.get('last')
+
     def _is_length_of_result_1(self):
         """check if the request result returned results belonging to one
         crypto coin or to multiple or empty"""
@@ -190,6 +326,9 @@ class KrakenResponseExtractor:
         might be no data from that specific date but the Kraken API returns the
         data from the closest date to the requested one, therefore is important
         to log this date so we are aware."""
+        if not self._response_sequence:
+            logger.info(f'No data returned for {self._symbol}')
+            return
         first_item = self._response_sequence[0][0]
         if is_valid_unix_time(first_item):
             logger.info(f'First date for {self._symbol} is '
@@ -218,10 +357,14 @@ class KrakenResponseExtractor:
         try:
             # create a dictionary that can be used by KrakenSymbolSerializer
             return {
-                'open': round(OHLC_response[KrakenResponseIndex.OPEN], 2),
-                'high': round(OHLC_response[KrakenResponseIndex.HIGH], 2),
-                'low': round(OHLC_response[KrakenResponseIndex.LOW], 2),
-                'close': round(OHLC_response[KrakenResponseIndex.CLOSE], 2),
+                'open': round(OHLC_response[KrakenResponseIndex.OPEN],
+                              PRICE_DECIMAL_PLACES),
+                'high': round(OHLC_response[KrakenResponseIndex.HIGH],
+                              PRICE_DECIMAL_PLACES),
+                'low': round(OHLC_response[KrakenResponseIndex.LOW],
+                             PRICE_DECIMAL_PLACES),
+                'close': round(OHLC_response[KrakenResponseIndex.CLOSE],
+                               PRICE_DECIMAL_PLACES),
                 'date': convert_unix_to_date(
                     OHLC_response[KrakenResponseIndex.DATE])
             }
@@ -229,6 +372,11 @@ class KrakenResponseExtractor:
             # log error to analyze later and try next OHLC item.
             logger.error(f'Index exception at symbol {self._symbol} {e.args}')
 
+    def columns(self):
+        """Get all the items obtained from Kraken api as OHLC_columns, an
+        alternative to iterating over the items one by one"""
+        return create_OHLC_columns(self._response_sequence, self._symbol)
+
     def __iter__(self):
         """iterate over the items obtained from Kraken api and pass them in a
          format that ca be used to be saved on database."""
@@ -0,0 +1,290 @@
+"""Local stand-in for the Kraken public API, serves the OHLC and AssetPairs
+endpoints with generated data so loads can be run and benchmarked offline.
+
+Run it on its own and point settings.KRAKEN_API_URL to it:
+    python -m data_loader.kraken_stub_server --port 8080 --candles 720
+    KRAKEN_API_URL=http://127.0.0.1:8080/0/public python manage.py shell
+"""
+import argparse
+import json
+import logging
+import math
+import random
+import sys
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+from data_loader.rate_limiter import TokenBucket
+
+
+API_PATH = '/0/public'
+DEFAULT_CANDLES = 720  # Kraken returns up to 720 candles per request
+DEFAULT_INTERVAL = 1  # minutes, as Kraken when no interval is requested
+HISTORY_START = 1262304000  # 01/Jan/2010, no candles are served before it
+DEFAULT_PAIRS = [f'{coin}{currency}'
+                 for coin in ('BTC', 'ETH', 'USDT', 'ADA', 'XRP', 'SOL')
+                 for currency in ('USD', 'EUR')]
+WRITE_CANDLES = 1000  # candles encoded and sent at once on the response
+
+logger = logging.getLogger(__name__)
+
+
+def candle_price(pair: str, time_stamp: int):
+    """Deterministic price for pair at time_stamp, every pair oscillates
+    around its own base price so repeated runs serve the same data."""
+    base_price = 1 + zlib.crc32(pair.encode()) % 50000
+    return base_price * (1 + 0.1 * math.sin(time_stamp / 864000))
+
+
+def create_candle(pair: str, time_stamp: int, interval: int):
+    """Kraken OHLC item [time, open, high, low, close, vwap, volume, count],
+    prices and volume are strings as Kraken sends them."""
+    open_price = candle_price(pair, time_stamp)
+    close_price = candle_price(pair, time_stamp + interval * 60)
+    high = max(open_price, close_price) * 1.01
+    low = min(open_price, close_price) * 0.99
+    return [time_stamp,
+            f'{open_price:.5f}',
+            f'{high:.5f}',
+            f'{low:.5f}',
+            f'{close_price:.5f}',
+            f'{(open_price + close_price) / 2:.5f}',
+            f'{1 + time_stamp % 97:.8f}',
+            1 + time_stamp % 1009]
+
+
+def candle_times(since: int, interval: int, candles: int, end: int):
+    """Times of the candles following since, aligned to the interval and
+    never later than end"""
+    step = interval * 60
+    first = max(since // step + 1, -(-HISTORY_START // step)) * step
+    last = min(first + step * (candles - 1), end // step * step)
+    return range(first, last + 1, step)
+
+
+class KrakenStubHandler(BaseHTTPRequestHandler):
+    """Answer requests with the behaviour configured on the server"""
+    protocol_version = 'HTTP/1.1'  # keep connections alive as Kraken does
+    # buffer the response chunks and send them without waiting for acks,
+    # small writes would otherwise add the delayed ack time to every request
+    wbufsize = 65536
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    def send_json(self, status: int, content: dict, headers: dict = None):
+        body = json.dumps(content).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_chunk(self, data: bytes):
+        self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+
+    def send_OHLC(self, pair: str, times: range, interval: int):
+        """Send the OHLC response with chunked encoding, candles are encoded
+        while they are sent so big responses are never held in memory."""
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        self.send_chunk(f'{{"error":[],"result":{{"{pair}":['.encode())
+        for start in range(0, len(times), WRITE_CANDLES):
+            candles = [create_candle(pair, t, interval)
+                       for t in times[start:start + WRITE_CANDLES]]
+            data = json.dumps(candles, separators=(',', ':'))[1:-1]
+            self.send_chunk((',' if start else '').encode() + data.encode())
+        last = times[-1] if times else 0
+        self.send_chunk(f'],"last":{last}}}}}'.encode())
+        self.send_chunk(b'')
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        endpoint = url.path[len(API_PATH) + 1:] \
+            if url.path.startswith(API_PATH + '/') else None
+        handle = {'OHLC': self.handle_OHLC,
+                  'AssetPairs': self.handle_asset_pairs}.get(endpoint)
+        if handle is None:
+            self.send_json(404, {'error': ['EGeneral:Unknown method']})
+            return
+        if not self.server.before_response(self):
+            return
+        handle(query)
+
+    def handle_OHLC(self, query: dict):
+        pair = query.get('pair')
+        if pair not in self.server.pairs:
+            self.send_json(200, {'error': ['EQuery:Unknown asset pair']})
+            return
+        try:
+            interval = int(query.get('interval', DEFAULT_INTERVAL))
+            since = int(query.get('since', 0))
+        except ValueError:
+            self.send_json(200, {'error': ['EGeneral:Invalid arguments']})
+            return
+        times = candle_times(since, interval, self.server.candles,
+                             self.server.end or int(time.time()))
+        self.send_OHLC(pair, times, interval)
+
+    def handle_asset_pairs(self, query: dict):
+        requested = query.get('pair')
+        pairs = requested.split(',') if requested else self.server.pairs
+        unknown = [p for p in pairs if p not in self.server.pairs]
+        if unknown:
+            self.send_json(200, {'error': ['EQuery:Unknown asset pair']})
+            return
+        result = {p: {'altname': p, 'base': p[:-3], 'quote': p[-3:],
+                      'wsname': f'{p[:-3]}/{p[-3:]}'}
+                  for p in pairs}
+        self.send_json(200, {'error': [], 'result': result})
+
+
+class KrakenStubServer(ThreadingHTTPServer):
+    """HTTP server standing in for Kraken public API, every request is
+    answered on its own thread.
+    Methods:
+        - start: serve on a background thread.
+        - stop: stop serving and close the socket.
+    Properties:
+        - url: base url to set as settings.KRAKEN_API_URL.
+        - requests: amount of requests received.
+    """
+    daemon_threads = True
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0,
+                 candles: int = DEFAULT_CANDLES, latency: float = 0,
+                 error_rate: float = 0, throttle_rate: float = None,
+                 throttle_burst: int = 1, pairs: list = None,
+                 end: int = None, seed: int = 0):
+        """Initialize instance.
+        @params:
+        - host, port: address to listen on, port 0 picks a free port.
+        - candles: maximum candles returned per OHLC response.
+        - latency: seconds waited before answering every request.
+        - error_rate: fraction of requests answered with status 500.
+        - throttle_rate: requests per second allowed, requests above it
+        are answered with status 429 and a Retry-After header. None does
+        not throttle.
+        - throttle_burst: requests allowed at once before throttling.
+        - pairs: known pairs, defaults to DEFAULT_PAIRS.
+        - end: unix time of the newest candle served, defaults to now.
+        - seed: seed of the random errors, same seed same errors.
+        """
+        super().__init__((host, port), KrakenStubHandler)
+        self.candles = candles
+        self.latency = latency
+        self.error_rate = error_rate
+        self.pairs = list(pairs or DEFAULT_PAIRS)
+        self.end = end
+        self._throttle = TokenBucket(throttle_rate, throttle_burst) \
+            if throttle_rate is not None else None
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}{API_PATH}'
+
+    @property
+    def requests(self):
+        return self._requests
+
+    def before_response(self, handler: KrakenStubHandler):
+        """Apply latency, throttling and errors to a request, return False
+        when it has already been answered"""
+        with self._lock:
+            self._requests += 1
+            is_error = self._random.random() < self.error_rate
+        if self.latency:
+            time.sleep(self.latency)
+        if self._throttle is not None:
+            wait_time = self._throttle.try_acquire()
+            if wait_time:
+                handler.send_json(429, {'error': ['EAPI:Rate limit exceeded']},
+                                  {'Retry-After': f'{wait_time:.3f}'})
+                return False
+        if is_error:
+            handler.send_json(500, {'error': ['EService:Unavailable']})
+            return False
+        return True
+
+    def handle_error(self, request, client_address):
+        """Clients closing the connection, i.e a streamed response that is
+        not read to the end, are not an error of the server"""
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            logger.debug(f'Connection closed by {client_address}')
+            return
+        super().handle_error(request, client_address)
+
+    def start(self):
+        """Serve requests on a daemon thread and return the instance"""
+        self._thread = threading.Thread(target=self.serve_forever,
+                                        daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def __repr__(self):
+        class_name = self.__class__.__name__
+        return f'{class_name}(candles={self.candles}, ' \
+               f'latency={self.latency}, error_rate={self.error_rate})'
+
+    def __str__(self):
+        return f'Kraken stand-in at {self.url}'
+
+
+parser = argparse.ArgumentParser(prog='kraken_stub_server',
+                                 allow_abbrev=False,
+                                 description='Serve a local stand-in for '
+                                             'Kraken public API')
+parser.add_argument('--host', default='127.0.0.1')
+parser.add_argument('--port', type=int, default=8080)
+parser.add_argument('--candles', type=int, default=DEFAULT_CANDLES,
+                    help='maximum candles per OHLC response')
+parser.add_argument('--latency', type=float, default=0,
+                    help='seconds waited before every response')
+parser.add_argument('--error-rate', type=float, default=0,
+                    help='fraction of requests failing with status 500')
+parser.add_argument('--throttle-rate', type=float, default=None,
+                    help='requests per second before answering 429')
+parser.add_argument('--throttle-burst', type=int, default=1)
+parser.add_argument('--seed', type=int, default=0)
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    server = KrakenStubServer(args.host, args.port,
+                              candles=args.candles,
+                              latency=args.latency,
+                              error_rate=args.error_rate,
+                              throttle_rate=args.throttle_rate,
+                              throttle_burst=args.throttle_burst,
+                              seed=args.seed)
+    print(f'{server}, press Ctrl+C to stop')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
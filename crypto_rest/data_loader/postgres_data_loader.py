@@ -1,12 +1,25 @@
 """load crypto data into Postgres sql database"""
+import calendar
+import functools
+import itertools
 import logging
 from collections.abc import Iterator
-from requests.exceptions import HTTPError
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from requests.exceptions import HTTPError, RequestException
+from django.conf import settings
+from django.db.models import Max
 from rest_framework.serializers import ValidationError
-from crypto_data.models import KrakenSymbols
+from crypto_data.models import KrakenSymbols, KrakenOHLC, KrakenCandle
 from crypto_data.serializers import KrakenOHLCSerializer
 from data_loader.kraken_data_loader import KrakenContentFetcher, KrakenResponseExtractor
 from data_loader.response_extractor import ResponseExtractor
+from data_loader.bulk_loader import (bulk_save_OHLC_columns,
+                                     bulk_save_candle_columns,
+                                     BulkLoadResult)
+from data_loader.stream_extractor import (KrakenStreamExtractor,
+                                          COLUMNS_CHUNK_SIZE)
+from data_loader.rate_limiter import TokenBucket
+from data_loader import http_transport
 from data_loader.errors import ExtractorErrorResponse, NonRelatedResponseError
 
 
@@ -14,9 +27,18 @@ from data_loader.errors import ExtractorErrorResponse, NonRelatedResponseError
 START_DATE = 1627772400
 END_DATE = 1633993200  # 12/oct/2021 00:00:00
 INCREMENT_STEPS = 1440  # 60 minutes * 24 hours, increments by day
-KRAKEN_URLS = {
-    'OHLC': 'https://api.kraken.com/0/public/OHLC'
+# endpoints under settings.KRAKEN_API_URL for every data type
+KRAKEN_ENDPOINTS = {
+    'OHLC': 'OHLC'
 }
+# Kraken throttles public endpoints per IP address at around 1 call per
+# second, allow small bursts so concurrent workers do not start idle.
+KRAKEN_PUBLIC_CALLS_PER_SECOND = 1
+KRAKEN_PUBLIC_BURST = 5
+# errors loading a symbol that are logged before carrying on with the next
+# one, requests errors are raised while reading streamed bodies
+SYMBOL_ERRORS = (ExtractorErrorResponse, NonRelatedResponseError,
+                 RequestException)
 
 logger = logging.getLogger(__name__)
 f_handler = logging.FileHandler('logs/kraken_extractor.log',
@@ -34,12 +56,15 @@ c_handler.setFormatter(c_format)
 logger.addHandler(c_handler)
 
 
-def fetch_data(fetcher):
+def fetch_data(fetcher, stream: bool = False):
     """
     Fetch data from a given instance, the instance must follow interface as
-    ABC class ContentResourceFetcher at resource_content_abs.
+    ABC class ContentResourceFetcher at resource_content_abs, when stream is
+    True the instance must also implement fetch_stream.
     """
     try:
+        if stream:
+            return fetcher.fetch_stream()
         return fetcher.fetch()
     except HTTPError as e:
         logger.error(f'HTTPError because {e.args}')
@@ -74,36 +99,307 @@ def save_OHLC_data_on_database(data_iterator: Iterator, related_symbol: str):
                          f'{e}')
 
 
-def load_kraken_data_into_postgres(data_type: str):
+def get_kraken_url(data_type: str):
+    """Url to request data_type from, None for an unknown data type"""
+    endpoint = KRAKEN_ENDPOINTS.get(data_type)
+    if endpoint is not None:
+        return f'{settings.KRAKEN_API_URL.rstrip("/")}/{endpoint}'
+
+
+def create_kraken_rate_limiter():
+    """Create a token bucket that respects Kraken public API limits"""
+    return TokenBucket(KRAKEN_PUBLIC_CALLS_PER_SECOND, KRAKEN_PUBLIC_BURST)
+
+
+def create_OHLC_params(symbol: str, since: int = START_DATE,
+                       interval: int = INCREMENT_STEPS):
+    """Create query parameters to request OHLC data for symbol, interval is
+    the candle size in minutes"""
+    return {
+        'pair': symbol,
+        'since': since,
+        'interval': interval,
+    }
+
+
+def date_to_unix(date):
+    """convert a date into the unix time of its midnight in UTC, or a UTC
+    datetime into its unix time"""
+    return calendar.timegm(date.timetuple())
+
+
+def get_symbols_watermarks():
+    """Get the date of the latest saved candle for every symbol with data,
+    all symbols are resolved with a single grouped query.
+    @returns:
+        - dict symbol: latest saved date.
+    """
+    # clear the default ordering, its fields would be grouped by too
+    watermarks = (KrakenOHLC.objects
+                  .order_by()
+                  .values('symbol__symbol')
+                  .annotate(last_date=Max('date')))
+    return {w['symbol__symbol']: w['last_date'] for w in watermarks}
+
+
+def get_candles_watermarks(interval: int):
+    """Same as get_symbols_watermarks for the candles saved at interval.
+    @returns:
+        - dict symbol: latest saved candle time.
+    """
+    watermarks = (KrakenCandle.objects
+                  .filter(interval=interval)
+                  .values('symbol__symbol')
+                  .annotate(last_ts=Max('ts')))
+    return {w['symbol__symbol']: w['last_ts'] for w in watermarks}
+
+
+def create_incremental_since(watermark):
+    """Starting time to request data after the watermark date, one second
+    before the watermark candle opens so that candle, which might have still
+    been open when it was saved, is requested again and refreshed."""
+    if watermark is None:
+        return START_DATE
+    return date_to_unix(watermark) - 1
+
+
+def create_symbols_params(symbols: list, incremental: bool = False,
+                          interval: int = None):
+    """Create the query parameters for each symbol
+    @args:
+        - symbols: symbols to request data for.
+        - incremental: request every symbol from its latest saved candle
+        instead of from START_DATE, symbols without data use START_DATE.
+        - interval: request KrakenCandle data at this interval, by default
+        daily data for KrakenOHLC.
+    @returns:
+        - dict symbol: query parameters.
+    """
+    watermarks = {}
+    if incremental:
+        watermarks = get_symbols_watermarks() if interval is None \
+            else get_candles_watermarks(interval)
+    return {symbol: create_OHLC_params(
+                symbol, create_incremental_since(watermarks.get(symbol)),
+                interval or INCREMENT_STEPS)
+            for symbol in symbols}
+
+
+def fetch_symbol_response(url: str, params: dict, rate_limiter=None,
+                          stream: bool = False,
+                          fetcher_class=KrakenContentFetcher):
+    """Fetch Kraken response for the given query parameters, waiting on the
+    rate_limiter first if one is provided. Safe to call from worker threads
+    as it does not touch the database.
+    @args:
+        - url: Kraken url for the requested data type.
+        - params: query parameters as created by create_OHLC_params.
+        - rate_limiter: instance with method acquire, i.e TokenBucket.
+        - stream: return the response body as an iterator of bytes chunks
+        instead of the decoded response.
+        - fetcher_class: ContentResourceFetcher created with url and params,
+        i.e ReplayContentFetcher to load recorded responses.
+    @returns:
+        - On Success: Kraken response.
+        - On Failure: raise ExtractorErrorResponse.
+    """
+    if rate_limiter is not None:
+        rate_limiter.acquire()
+    fetcher = fetcher_class(url, params)
+    return fetch_data(fetcher, stream)
+
+
+def save_kraken_response(response: dict, symbol: str):
+    """use a KrakenResponseExtractor with the returned response from kraken
+    to extract data as columns and save the whole response as one batch."""
+    kraken_extractor = KrakenResponseExtractor(response, symbol)
+    response_extractor = ResponseExtractor()
+    response_extractor.extract_response(kraken_extractor)
+    return bulk_save_OHLC_columns(response_extractor.columns(), symbol)
+
+
+def save_kraken_stream(byte_chunks, symbol: str,
+                       chunk_size: int = COLUMNS_CHUNK_SIZE):
+    """Save a streamed response in batches of chunk_size candles while it is
+    being received, so the memory used does not depend on its size.
+    @returns:
+        - BulkLoadResult adding up the result of every batch.
+    """
+    stream_extractor = KrakenStreamExtractor(byte_chunks, symbol)
+    saved = 0
+    rejected = 0
+    duplicates = 0
+    for columns in stream_extractor.column_chunks(chunk_size):
+        result = bulk_save_OHLC_columns(columns, symbol)
+        saved += result.saved
+        rejected += result.rejected
+        duplicates += result.duplicates
+    return BulkLoadResult(symbol, saved, rejected, duplicates)
+
+
+def save_kraken_candles(response: dict, symbol: str, interval: int):
+    """Same as save_kraken_response saving the response as KrakenCandle of
+    the given interval"""
+    kraken_extractor = KrakenResponseExtractor(response, symbol)
+    response_extractor = ResponseExtractor()
+    response_extractor.extract_response(kraken_extractor)
+    return bulk_save_candle_columns(response_extractor.columns(), symbol,
+                                    interval)
+
+
+def save_kraken_candles_stream(byte_chunks, symbol: str, interval: int,
+                               chunk_size: int = COLUMNS_CHUNK_SIZE):
+    """Same as save_kraken_stream saving the response as KrakenCandle of
+    the given interval"""
+    stream_extractor = KrakenStreamExtractor(byte_chunks, symbol)
+    saved = 0
+    rejected = 0
+    duplicates = 0
+    for columns in stream_extractor.column_chunks(chunk_size):
+        result = bulk_save_candle_columns(columns, symbol, interval)
+        saved += result.saved
+        rejected += result.rejected
+        duplicates += result.duplicates
+    return BulkLoadResult(symbol, saved, rejected, duplicates)
+
+
+def get_response_saver(stream: bool, interval: int = None):
+    """Function to save the responses fetched with or without stream, as
+    daily KrakenOHLC or as KrakenCandle when an interval is given"""
+    if interval is None:
+        return save_kraken_stream if stream else save_kraken_response
+    save_response = save_kraken_candles_stream if stream \
+        else save_kraken_candles
+    return functools.partial(save_response, interval=interval)
+
+
+def log_symbol_error(symbol: str, error: Exception):
+    """at this stage the error that provoked this has already been logged into
+    log file, so just print the error and try next symbol"""
+    print(f'ERROR FETCHING DATA FOR  {symbol} {error}')
+
+
+def load_symbols_sequentially(url: str, symbols_params: dict,
+                              rate_limiter=None, stream: bool = False,
+                              fetcher_class=KrakenContentFetcher,
+                              interval: int = None):
+    """Fetch and save data for each symbol one after the other"""
+    save_response = get_response_saver(stream, interval)
+    for symbol, params in symbols_params.items():
+        try:
+            response = fetch_symbol_response(url, params, rate_limiter,
+                                             stream, fetcher_class)
+            save_response(response, symbol)
+        except SYMBOL_ERRORS as e:
+            log_symbol_error(symbol, e)
+
+
+def load_symbols_concurrently(url: str, symbols_params: dict,
+                              max_workers: int, rate_limiter=None,
+                              stream: bool = False,
+                              fetcher_class=KrakenContentFetcher,
+                              interval: int = None):
+    """Fetch data for all symbols on a pool of threads and save each response
+    as soon as it arrives. Only the network calls run on the worker threads,
+    responses are saved on the calling thread so all database writes share
+    its connection and transaction. With stream the workers only wait for
+    the response to start, its body is read on the calling thread while it
+    is saved. The shared session is sized so every worker keeps its own
+    connection alive.
+    At most max_workers symbols are in flight, a symbol is only requested
+    once another one is saved, so responses fetched but not saved yet, and
+    with stream their connections, never pile up while the calling thread
+    saves. An error loading a symbol is logged and the rest carry on."""
+    save_response = get_response_saver(stream, interval)
+    http_transport.ensure_pool_size(max_workers)
+    pending = iter(symbols_params.items())
+    futures = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+
+        def submit(amount: int):
+            for symbol, params in itertools.islice(pending, amount):
+                future = executor.submit(fetch_symbol_response, url, params,
+                                         rate_limiter, stream, fetcher_class)
+                futures[future] = symbol
+
+        submit(max_workers)
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                symbol = futures.pop(future)
+                try:
+                    save_response(future.result(), symbol)
+                except SYMBOL_ERRORS as e:
+                    log_symbol_error(symbol, e)
+                submit(1)
+
+
+def load_symbols(url: str, symbols_params: dict, max_workers: int = 1,
+                 rate_limiter=None, stream: bool = False,
+                 fetcher_class=KrakenContentFetcher, interval: int = None):
+    """Load every symbol sequentially or on max_workers threads, see
+    load_kraken_data_into_postgres"""
+    if max_workers > 1:
+        if rate_limiter is None:
+            rate_limiter = create_kraken_rate_limiter()
+        load_symbols_concurrently(url, symbols_params, max_workers,
+                                  rate_limiter, stream, fetcher_class,
+                                  interval)
+    else:
+        load_symbols_sequentially(url, symbols_params, rate_limiter,
+                                  stream, fetcher_class, interval)
+
+
+def load_kraken_data_into_postgres(data_type: str, max_workers: int = 1,
+                                   rate_limiter=None,
+                                   incremental: bool = False,
+                                   stream: bool = False,
+                                   fetcher_class=KrakenContentFetcher):
     """Provided a data type (OHLC, ), Load data from kraken api of that specific type,
     data is related to all the symbols already saved at KrakenSymbols.
+    @args:
+        - data_type: type of data to load, must be a key on KRAKEN_ENDPOINTS,
+        it is requested from settings.KRAKEN_API_URL.
+        - max_workers: amount of threads fetching data at the same time, 1
+        fetches symbols one after the other.
+        - rate_limiter: instance with method acquire shared by all the
+        requests, when not provided and max_workers is bigger than 1 a
+        TokenBucket respecting Kraken public API limits is used.
+        - incremental: only request data after the latest candle saved for
+        each symbol, candles already saved are updated instead of duplicated.
+        - stream: parse every response while it is received and save it in
+        fixed size batches instead of decoding it whole in memory.
+        - fetcher_class: class used to fetch every symbol, see
+        fetch_symbol_response.
     """
-    url = KRAKEN_URLS.get(data_type)
+    url = get_kraken_url(data_type)
     if url is not None:
         # get all the saved symbols
         # iterate over each one to extract all the data from a specified time.
-        kraken_symbols = KrakenSymbols.objects.all()
-        for symbol in kraken_symbols:
-            # prepare query parameters
-            params = {
-                'pair': symbol.symbol,
-                'since': START_DATE,
-                'interval': INCREMENT_STEPS,
-            }
-            try:
-                # create fetcher and try to fetch the data
-                fetcher = KrakenContentFetcher(url, params)
-                response = fetch_data(fetcher)
-                """use a KrakenResponseExtractor with the returned response 
-                from kraken to extract data in a format that serializer 
-                KrakenOHLCSerializer can use."""
-                kraken_extractor = KrakenResponseExtractor(response,
-                                                           symbol.symbol)
-                response_extractor = ResponseExtractor()
-                response_extractor.extract_response(kraken_extractor)
-                save_OHLC_data_on_database(response_extractor, symbol.symbol)
-            except (ExtractorErrorResponse, NonRelatedResponseError) as e:
-                # at this stage the error that provoked this has already
-                # been logged into log file, so just print the error and try
-                # next symbol
-                print(f'ERROR FETCHING DATA FOR  {symbol.symbol} {e}')
+        symbols = [symbol.symbol for symbol in KrakenSymbols.objects.all()]
+        symbols_params = create_symbols_params(symbols, incremental)
+        load_symbols(url, symbols_params, max_workers, rate_limiter, stream,
+                     fetcher_class)
+
+
+def load_kraken_candles_into_postgres(interval: int, max_workers: int = 1,
+                                      rate_limiter=None,
+                                      incremental: bool = False,
+                                      stream: bool = False,
+                                      fetcher_class=KrakenContentFetcher):
+    """Load OHLC candles of any Kraken interval as KrakenCandle for all the
+    symbols saved at KrakenSymbols, the rest of the arguments work as on
+    load_kraken_data_into_postgres.
+    @args:
+        - interval: candle size in minutes, one of KrakenCandle.INTERVALS.
+    @returns:
+        - On Failure: raise ValueError for intervals Kraken does not provide.
+    """
+    intervals = [i for i, _ in KrakenCandle.INTERVALS]
+    if interval not in intervals:
+        raise ValueError(f'interval must be one of {intervals}, got '
+                         f'{interval}')
+    symbols = [symbol.symbol for symbol in KrakenSymbols.objects.all()]
+    symbols_params = create_symbols_params(symbols, incremental, interval)
+    load_symbols(get_kraken_url('OHLC'), symbols_params, max_workers,
+                 rate_limiter, stream, fetcher_class, interval)
@@ -0,0 +1,87 @@
+"""Define rate limiters to be shared by the threads that call an external API"""
+import threading
+import time
+
+
+class TokenBucket:
+    """Thread safe token bucket, every call to an API takes a token from the
+    bucket and the bucket refills at a constant rate, so calls can go out in
+    bursts of up to `capacity` but on the long run never faster than `rate`.
+    Methods:
+        - acquire: block until the requested tokens are available.
+        - try_acquire: take the tokens only if they are available.
+    Properties:
+        - rate: tokens added to the bucket per second.
+        - capacity: maximum amount of tokens the bucket can hold.
+    """
+    def __init__(self, rate: float, capacity: float,
+                 clock=time.monotonic, sleep=time.sleep):
+        """Initialize instance.
+        @params:
+        - rate: tokens added per second, must be bigger than 0.
+        - capacity: maximum tokens stored, must be at least 1.
+        - clock: function returning seconds, used to measure refills.
+        - sleep: function used to wait for tokens.
+        """
+        if rate <= 0:
+            raise ValueError(f'rate must be bigger than 0, got {rate}')
+        if capacity < 1:
+            raise ValueError(f'capacity must be at least 1, got {capacity}')
+        self._rate = rate
+        self._capacity = capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = capacity
+        self._last_refill = clock()
+        self._lock = threading.Lock()
+
+    @property
+    def rate(self):
+        return self._rate
+
+    @property
+    def capacity(self):
+        return self._capacity
+
+    def _refill(self):
+        """Add the tokens accumulated since the last refill"""
+        now = self._clock()
+        elapsed = now - self._last_refill
+        self._tokens = min(self._capacity, self._tokens + elapsed * self._rate)
+        self._last_refill = now
+
+    def acquire(self, tokens: float = 1):
+        """Take tokens from the bucket, blocking the calling thread until they
+        are available. The lock is not held while sleeping so other threads
+        can check the bucket meanwhile."""
+        if tokens > self._capacity:
+            raise ValueError(f'can not acquire {tokens} tokens from a bucket '
+                             f'with capacity {self._capacity}')
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait_time = (tokens - self._tokens) / self._rate
+            self._sleep(wait_time)
+
+    def try_acquire(self, tokens: float = 1):
+        """Take tokens from the bucket without blocking.
+        @returns:
+            - 0 when the tokens were taken, otherwise the seconds to wait
+            until they are available.
+        """
+        with self._lock:
+            self._refill()
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return 0
+            return (tokens - self._tokens) / self._rate
+
+    def __repr__(self):
+        class_name = self.__class__.__name__
+        return f'{class_name}(rate={self._rate}, capacity={self._capacity})'
+
+    def __str__(self):
+        return f'Token bucket at {self._rate} tokens per second'
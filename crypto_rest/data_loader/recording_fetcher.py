@@ -0,0 +1,165 @@
+"""Record responses fetched from Kraken API and replay them later, so a load
+can be repeated with exactly the same data without network access"""
+import hashlib
+import json
+import logging
+from pathlib import Path
+from urllib.parse import urlsplit
+from requests.exceptions import HTTPError
+from data_loader.kraken_data_loader import (KrakenContentFetcher,
+                                            STREAM_CHUNK_SIZE)
+from data_loader.resource_content_abs import ContentResourceFetcher
+
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseCassette:
+    """Directory holding one recorded response per request, each response
+    is saved as a JSON file named after a hash of the requested endpoint and
+    parameters. The host is left out of the hash so responses recorded from
+    Kraken can be replayed with any base url.
+    Methods:
+        - save: record the response body of a request.
+        - load: recorded response body of a request.
+    """
+    def __init__(self, path):
+        self._path = Path(path)
+
+    @staticmethod
+    def request_key(url: str, params: dict):
+        """Key identifying a request no matter the order of its parameters"""
+        endpoint = urlsplit(url).path.rsplit('/', 1)[-1]
+        request = json.dumps([endpoint, params], sort_keys=True, default=str)
+        return hashlib.sha1(request.encode()).hexdigest()
+
+    def response_path(self, url: str, params: dict):
+        return self._path / f'{self.request_key(url, params)}.json'
+
+    def save(self, url: str, params: dict, body: bytes):
+        self._path.mkdir(parents=True, exist_ok=True)
+        self.response_path(url, params).write_bytes(body)
+
+    def load(self, url: str, params: dict):
+        """Get the recorded response body, raise KeyError when the request
+        was not recorded"""
+        try:
+            return self.response_path(url, params).read_bytes()
+        except FileNotFoundError:
+            raise KeyError(f'No response recorded for url {url} with params '
+                           f'{params}') from None
+
+    def __len__(self):
+        if not self._path.is_dir():
+            return 0
+        return len(list(self._path.glob('*.json')))
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({str(self._path)!r})'
+
+    def __str__(self):
+        return f'Response cassette at {self._path}'
+
+
+def iter_body(body: bytes, chunk_size: int):
+    """Split a response body in chunks as a streamed response is read"""
+    for start in range(0, len(body), chunk_size):
+        yield body[start:start + chunk_size]
+
+
+class RecordingContentFetcher(ContentResourceFetcher):
+    """Fetch data with another fetcher and record every response on a
+    cassette before returning it. To use it on a load pass it with the
+    cassette already bound, i.e
+    functools.partial(RecordingContentFetcher, cassette=cassette).
+    Methods:
+        - fetch: fetch and record data.
+        - fetch_stream: fetch and record data, returned as bytes chunks.
+    """
+    def __init__(self, url: str, params: dict, cassette: ResponseCassette,
+                 fetcher_class=KrakenContentFetcher):
+        """Initialize instance.
+        @params:
+        - url, params: request to fetch, as for KrakenContentFetcher.
+        - cassette: ResponseCassette to record responses on.
+        - fetcher_class: class fetching the responses to record.
+        """
+        self._url = url
+        self._params = params
+        self._cassette = cassette
+        self._fetcher = fetcher_class(url, params)
+
+    @property
+    def kraken_symbol(self):
+        return self._params.get('pair')
+
+    @property
+    def request_since(self):
+        return self._params.get('since')
+
+    def _fetch_body(self):
+        """Fetch the response body and record it, the body is recorded as
+        received so replaying it parses exactly the same bytes"""
+        if hasattr(self._fetcher, 'fetch_stream'):
+            body = b''.join(self._fetcher.fetch_stream())
+        else:
+            body = json.dumps(self._fetcher.fetch()).encode()
+        self._cassette.save(self._url, self._params, body)
+        return body
+
+    def fetch(self):
+        return json.loads(self._fetch_body())
+
+    def fetch_stream(self, chunk_size: int = STREAM_CHUNK_SIZE):
+        return iter_body(self._fetch_body(), chunk_size)
+
+    def __repr__(self):
+        class_name = self.__class__.__name__
+        return f'{class_name}({self._url!r}, {self._params}, ' \
+               f'{self._cassette!r})'
+
+    def __str__(self):
+        return f'Recording fetcher for params {self._params}'
+
+
+class ReplayContentFetcher(ContentResourceFetcher):
+    """Return the responses recorded by RecordingContentFetcher without any
+    network access, a request that was not recorded fails the same way a
+    failed request to Kraken does, raising HTTPError.
+    Methods:
+        - fetch: recorded data.
+        - fetch_stream: recorded data as bytes chunks.
+    """
+    def __init__(self, url: str, params: dict, cassette: ResponseCassette):
+        self._url = url
+        self._params = params
+        self._cassette = cassette
+
+    @property
+    def kraken_symbol(self):
+        return self._params.get('pair')
+
+    @property
+    def request_since(self):
+        return self._params.get('since')
+
+    def _load_body(self):
+        try:
+            return self._cassette.load(self._url, self._params)
+        except KeyError as e:
+            logger.error(f'Replay error {e}')
+            raise HTTPError(*e.args) from e
+
+    def fetch(self):
+        return json.loads(self._load_body())
+
+    def fetch_stream(self, chunk_size: int = STREAM_CHUNK_SIZE):
+        return iter_body(self._load_body(), chunk_size)
+
+    def __repr__(self):
+        class_name = self.__class__.__name__
+        return f'{class_name}({self._url!r}, {self._params}, ' \
+               f'{self._cassette!r})'
+
+    def __str__(self):
+        return f'Replay fetcher for params {self._params}'
@@ -22,6 +22,11 @@ class ResponseExtractor:
         else:
             raise ExtractorErrorResponse
 
+    def columns(self):
+        """Get extracted data as column arrays, as opposed to iterating over
+        it item by item"""
+        return self.extractor.columns()
+
     def __iter__(self):
         """Iterate over extracted data"""
         return (i for i in self.extractor)
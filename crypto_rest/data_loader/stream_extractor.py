@@ -0,0 +1,235 @@
+"""Extract Kraken OHLC data while the response is still being received"""
+import codecs
+import itertools
+import json
+import logging
+import re
+from requests.exceptions import RequestException
+from data_loader.kraken_data_loader import create_OHLC_columns
+from data_loader.errors import ExtractorErrorResponse, NonRelatedResponseError
+
+
+COLUMNS_CHUNK_SIZE = 10000
+WHITESPACE = ' \t\n\r'
+NON_WHITESPACE = re.compile(r'[^ \t\n\r]')
+# characters that can start a JSON value which is not a number or literal
+DELIMITED_VALUE_START = '[{"'
+VALUE_END = ',]}' + WHITESPACE
+
+logger = logging.getLogger(__name__)
+
+
+class JSONStreamReader:
+    """Read JSON tokens and values from a sequence of text chunks, keeping
+    in memory only the part of the text that has not been read yet.
+    Methods:
+        - peek: next non whitespace character.
+        - expect: consume the given character.
+        - read_value: decode the next JSON value.
+    """
+    # drop the text already read once it is longer than this
+    COMPACT_SIZE = 65536
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buffer = ''
+        self._position = 0
+        self._decoder = json.JSONDecoder()
+
+    def _fill(self):
+        """Append the next chunk to the buffer, False once there are no more
+        chunks"""
+        chunk = next(self._chunks, None)
+        if chunk is None:
+            return False
+        if self._position > self.COMPACT_SIZE:
+            self._buffer = self._buffer[self._position:]
+            self._position = 0
+        self._buffer += chunk
+        return True
+
+    def peek(self):
+        """Skip whitespace and return the next character without consuming
+        it, an empty string at the end of the stream"""
+        buffer = self._buffer
+        # compact JSON has no whitespace, check that case first
+        if (self._position < len(buffer) and
+                buffer[self._position] not in WHITESPACE):
+            return buffer[self._position]
+        while True:
+            found = NON_WHITESPACE.search(self._buffer, self._position)
+            if found is not None:
+                self._position = found.start()
+                return self._buffer[self._position]
+            self._position = len(self._buffer)
+            if not self._fill():
+                return ''
+
+    def expect(self, character: str):
+        """Consume character or raise ValueError if it is not next"""
+        found = self.peek()
+        if found != character:
+            raise ValueError(f'Expected {character!r} but found {found!r} '
+                             f'reading JSON stream')
+        self._position += 1
+
+    def _is_value_complete(self):
+        """Numbers and literals are only complete once a character that can
+        not be part of them has been received"""
+        if self._buffer[self._position] in DELIMITED_VALUE_START:
+            return True
+        return any(c in VALUE_END for c in self._buffer[self._position:])
+
+    def read_value(self):
+        """Decode the next JSON value, reading chunks until it is complete"""
+        self.peek()
+        while True:
+            if self._is_value_complete():
+                try:
+                    value, end = self._decoder.raw_decode(self._buffer,
+                                                          self._position)
+                    self._position = end
+                    return value
+                except json.JSONDecodeError:
+                    pass
+            if not self._fill():
+                # decode again at the end of the stream to raise the error
+                value, end = self._decoder.raw_decode(self._buffer,
+                                                      self._position)
+                self._position = end
+                return value
+
+    def read_key(self):
+        """Read an object key and the colon after it"""
+        key = self.read_value()
+        self.expect(':')
+        return key
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}()'
+
+
+def decode_chunks(byte_chunks, encoding: str = 'utf-8'):
+    """Decode bytes chunks into text, characters split between chunks are
+    kept until the next chunk arrives"""
+    decoder = codecs.getincrementaldecoder(encoding)()
+    for chunk in byte_chunks:
+        text = decoder.decode(chunk)
+        if text:
+            yield text
+    text = decoder.decode(b'', final=True)
+    if text:
+        yield text
+
+
+class KrakenStreamExtractor:
+    """Extract OHLC items from a Kraken response body while it is being
+    received, as opposed to KrakenResponseExtractor that requires the whole
+    response decoded in memory. Items are yielded one by one or in column
+    chunks of fixed size, so memory used does not depend on the response
+    size.
+    Methods:
+        - __iter__: iterate over the Kraken OHLC items.
+        - column_chunks: iterate over OHLC_columns of up to a given size.
+    Properties:
+        - last: cursor returned by Kraken, available once iterated.
+        - errors: errors returned by Kraken.
+    """
+    def __init__(self, byte_chunks, symbol: str):
+        """Initialize instance.
+        @params:
+        - byte_chunks: iterable of bytes with the response body.
+        - symbol: requested symbol.
+        """
+        self._reader = JSONStreamReader(decode_chunks(byte_chunks))
+        self._symbol = symbol
+        self._errors = []
+        self._last = None
+        self._consumed = False
+
+    @property
+    def last(self):
+        return self._last
+
+    @property
+    def errors(self):
+        return self._errors
+
+    def _check_errors(self):
+        if self._errors:
+            logger.error(f'Error response for {self._symbol} {self._errors}')
+            raise ExtractorErrorResponse(self._errors)
+
+    def _iter_items(self, reader):
+        """Yield every item of the OHLC array the reader is placed on"""
+        reader.expect('[')
+        while reader.peek() != ']':
+            yield reader.read_value()
+            if reader.peek() == ',':
+                reader.expect(',')
+        reader.expect(']')
+
+    def _iter_result(self, reader):
+        """Walk through the result object yielding the OHLC items, the
+        items are listed under the symbol returned by Kraken, which might
+        not be the requested one, and next to the 'last' cursor."""
+        found_items = False
+        reader.expect('{')
+        while reader.peek() != '}':
+            key = reader.read_key()
+            if key == 'last':
+                self._last = reader.read_value()
+            elif found_items:
+                # Kraken returns one symbol per request, a second one
+                # means the response is not the requested data.
+                raise NonRelatedResponseError
+            else:
+                found_items = True
+                yield from self._iter_items(reader)
+            if reader.peek() == ',':
+                reader.expect(',')
+        reader.expect('}')
+
+    def __iter__(self):
+        """Iterate over the Kraken OHLC items as they are received, the
+        response can only be iterated once."""
+        if self._consumed:
+            raise ValueError(f'response can only be iterated once on class '
+                             f'{self.__class__.__name__}')
+        self._consumed = True
+        reader = self._reader
+        try:
+            reader.expect('{')
+            while reader.peek() != '}':
+                key = reader.read_key()
+                if key == 'error':
+                    self._errors = reader.read_value()
+                    self._check_errors()
+                elif key == 'result':
+                    self._check_errors()
+                    yield from self._iter_result(reader)
+                else:
+                    reader.read_value()
+                if reader.peek() == ',':
+                    reader.expect(',')
+            reader.expect('}')
+        except (ValueError, RequestException) as e:
+            logger.error(f'Error reading response for {self._symbol} {e}')
+            raise ExtractorErrorResponse from e
+
+    def column_chunks(self, chunk_size: int = COLUMNS_CHUNK_SIZE):
+        """Iterate over the items in OHLC_columns of up to chunk_size rows"""
+        items = iter(self)
+        while True:
+            chunk = list(itertools.islice(items, chunk_size))
+            if not chunk:
+                return
+            yield create_OHLC_columns(chunk, self._symbol)
+
+    def __repr__(self):
+        class_name = self.__class__.__name__
+        return f'<{class_name} symbol={self._symbol}>'
+
+    def __str__(self):
+        class_name = self.__class__.__name__
+        return f'{class_name} for symbol {self._symbol}'
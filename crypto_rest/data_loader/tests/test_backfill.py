@@ -0,0 +1,101 @@
+from unittest.mock import patch
+from django.test import TestCase
+from requests.exceptions import HTTPError
+from data_loader.save_crypto_names import create_kraken_symbols
+from data_loader.backfill import KrakenBackfill
+from crypto_data.models import (KrakenOHLC, KrakenSymbols, KrakenCandle,
+                                KrakenBackfillCheckpoint)
+
+
+DAY = 86400
+START = 1630454400  # 01/Sep/2021
+PAGE_SIZE = 3
+PAGES = 4
+END = START + DAY * PAGE_SIZE * PAGES
+
+
+def create_page(since):
+    """Create a Kraken like response with PAGE_SIZE candles after since, the
+    'last' cursor is the time of the last candle or since when there is no
+    more data"""
+    candles = [[t, "10.00", "12.00", "9.00", "11.00", "10.50", "1.0", 1]
+               for t in range(since + DAY, since + DAY * (PAGE_SIZE + 1), DAY)
+               if t <= END]
+    last = candles[-1][0] if candles else since
+    return {"error": [], "result": {"XXBTZUSD": candles, "last": last}}
+
+
+class TestKrakenBackfill(TestCase):
+    """Test class KrakenBackfill"""
+    URL = 'https://api.kraken.com/0/public/OHLC'
+
+    def setUp(self):
+        create_kraken_symbols('USD')
+        self.symbol = KrakenSymbols.objects.get(symbol='BTCUSD')
+        self.requested_since = []
+
+    def fetch_page(self, fetcher):
+        self.requested_since.append(fetcher.request_since)
+        return create_page(fetcher.request_since)
+
+    def test_cursor_is_followed_until_end(self):
+        """Test every page is requested with the previous page cursor"""
+        backfill = KrakenBackfill(self.URL, START, END)
+        with patch('data_loader.kraken_data_loader.KrakenContentFetcher.fetch',
+                   autospec=True, side_effect=self.fetch_page):
+            pages, saved = backfill.backfill_symbol(self.symbol)
+        self.assertEqual(pages, PAGES)
+        self.assertEqual(saved, PAGE_SIZE * PAGES)
+        self.assertEqual(self.requested_since,
+                         [START + DAY * PAGE_SIZE * i for i in range(PAGES)])
+        self.assertEqual(KrakenOHLC.objects.count(), PAGE_SIZE * PAGES)
+        checkpoint = KrakenBackfillCheckpoint.objects.get(symbol=self.symbol)
+        self.assertTrue(checkpoint.completed)
+
+    def test_interrupted_backfill_resumes(self):
+        """Test a backfill failing in the middle resumes from the first page
+        that was not saved"""
+        def fail_on_third_page(fetcher):
+            if len(self.requested_since) == 2:
+                raise HTTPError('Time out')
+            return self.fetch_page(fetcher)
+
+        backfill = KrakenBackfill(self.URL, START, END)
+        with patch('data_loader.kraken_data_loader.KrakenContentFetcher.fetch',
+                   autospec=True, side_effect=fail_on_third_page):
+            with self.assertLogs('data_loader.postgres_data_loader'):
+                backfill.run([self.symbol])
+        self.assertEqual(KrakenOHLC.objects.count(), PAGE_SIZE * 2)
+        self.requested_since = []
+        with patch('data_loader.kraken_data_loader.KrakenContentFetcher.fetch',
+                   autospec=True, side_effect=self.fetch_page):
+            backfill.run([self.symbol])
+        self.assertEqual(self.requested_since[0], START + DAY * PAGE_SIZE * 2)
+        self.assertEqual(KrakenOHLC.objects.count(), PAGE_SIZE * PAGES)
+
+    def test_completed_backfill_is_not_requested_again(self):
+        """Test a completed checkpoint skips the symbol"""
+        backfill = KrakenBackfill(self.URL, START, END)
+        with patch('data_loader.kraken_data_loader.KrakenContentFetcher.fetch',
+                   autospec=True, side_effect=self.fetch_page) as mock_fetch:
+            backfill.backfill_symbol(self.symbol)
+            mock_fetch.reset_mock()
+            backfill.backfill_symbol(self.symbol)
+        self.assertEqual(mock_fetch.call_count, 0)
+
+    def test_intraday_backfill_saves_candles(self):
+        """Test pages of an interval other than daily are saved as
+        KrakenCandle of that interval and not as KrakenOHLC"""
+        backfill = KrakenBackfill(self.URL, START, END,
+                                  interval=KrakenCandle.ONE_HOUR)
+        with patch('data_loader.kraken_data_loader.KrakenContentFetcher.fetch',
+                   autospec=True, side_effect=self.fetch_page):
+            pages, saved = backfill.backfill_symbol(self.symbol)
+        self.assertEqual((pages, saved), (PAGES, PAGE_SIZE * PAGES))
+        self.assertEqual(KrakenOHLC.objects.count(), 0)
+        candles = KrakenCandle.objects.filter(symbol=self.symbol,
+                                              interval=KrakenCandle.ONE_HOUR)
+        self.assertEqual(candles.count(), PAGE_SIZE * PAGES)
+        checkpoint = KrakenBackfillCheckpoint.objects.get(
+            symbol=self.symbol, interval=KrakenCandle.ONE_HOUR)
+        self.assertTrue(checkpoint.completed)
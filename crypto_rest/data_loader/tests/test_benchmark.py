@@ -0,0 +1,71 @@
+import json
+from django.test import TestCase
+from data_loader.benchmark import (run_benchmarks, compare_results,
+                                   benchmark_symbols_amount, StageTimer,
+                                   PIPELINES, STAGES)
+
+
+class TestBenchmark(TestCase):
+    """Test module benchmark on small sizes"""
+
+    def test_every_pipeline_saves_every_candle(self):
+        """Test every pipeline is run and reports its stages"""
+        lines = []
+        report = run_benchmarks(sizes=[30], symbols=3, measure_memory=False,
+                                report=lines.append)
+        results = report['results']
+        self.assertEqual([r['pipeline'] for r in results], list(PIPELINES))
+        for result in results:
+            self.assertEqual(result['rows'], 30)
+            self.assertEqual(result['symbols'], 3)
+            self.assertGreater(result['rows_per_second'], 0)
+            self.assertEqual(set(result['stages']), set(STAGES))
+        self.assertEqual(len(lines), len(PIPELINES))
+        # the report can be written as JSON
+        json.dumps(report)
+
+    def test_candles_are_spread_across_symbols(self):
+        """Test no symbol gets more than max_days candles and every batch
+        is a sample of every stage"""
+        report = run_benchmarks(sizes=[40], symbols=2, pipelines=['columns'],
+                                measure_memory=False, max_days=10,
+                                report=lambda line: None)
+        result, = report['results']
+        self.assertEqual((result['symbols'], result['rows']), (4, 40))
+        for stage in STAGES:
+            self.assertEqual(result['stages'][stage]['samples'], 4)
+        self.assertEqual(benchmark_symbols_amount(1000000, 6), 1389)
+        self.assertEqual(benchmark_symbols_amount(1000, 6), 6)
+
+    def test_per_row_is_skipped_above_limit(self):
+        report = run_benchmarks(sizes=[20], symbols=2, pipelines=['per_row',
+                                                                  'columns'],
+                                per_row_max_candles=10,
+                                report=lambda line: None)
+        self.assertEqual([r['pipeline'] for r in report['results']],
+                         ['columns'])
+        self.assertGreater(report['results'][0]['peak_memory_bytes'], 0)
+
+    def test_compare_results(self):
+        """Test the throughput ratio of runs in both reports"""
+        previous = {'results': [{'pipeline': 'bulk', 'candles': 10,
+                                 'rows_per_second': 100}]}
+        current = {'results': [{'pipeline': 'bulk', 'candles': 10,
+                                'rows_per_second': 50},
+                               {'pipeline': 'stream', 'candles': 10,
+                                'rows_per_second': 80}]}
+        self.assertEqual(compare_results(previous, current),
+                         [('bulk', 10, 100, 50, 0.5)])
+
+    def test_stage_timer_percentiles(self):
+        timer = StageTimer()
+        for _ in range(3):
+            timer.start_batch()
+            with timer.measure('fetch'):
+                pass
+            timer.end_batch()
+        summary = timer.summary()
+        self.assertEqual(set(summary['fetch']),
+                         {'p50', 'p99', 'total', 'samples'})
+        self.assertLessEqual(summary['fetch']['p50'],
+                             summary['fetch']['p99'])
@@ -0,0 +1,197 @@
+from decimal import Decimal
+import datetime
+from django.test import TestCase
+from data_loader.save_crypto_names import create_kraken_symbols
+from data_loader.bulk_loader import (bulk_save_OHLC_data_on_database,
+                                     validate_OHLC_batch, validate_field,
+                                     parse_OHLC_item, OHLC_VALUE_FIELDS,
+                                     bulk_save_OHLC_columns,
+                                     bulk_save_candle_columns)
+from data_loader.kraken_data_loader import (KrakenResponseExtractor,
+                                            create_OHLC_columns)
+from data_loader.response_extractor import ResponseExtractor
+from crypto_data.models import KrakenOHLC, KrakenCandle
+from crypto_data.serializers import KrakenOHLCRowSerializer
+
+
+VALID_RESPONSE = {"error": [], "result": {"SOLUSD": [
+    [1632441600, "149.92", "151.30", "126.60", "139.24", "138.06",
+     "254005.29576624", 19338],
+    [1632528000, "139.19", "144.00", "133.71", "136.07", "138.33",
+     "122860.44860293", 8251],
+    [1632614400, "135.81", "140.67", "125.00", "135.71", "133.44",
+     "177607.42934785", 11195]],
+    "last": 1632614400}}
+
+
+class TestBulkSaveOHLCData(TestCase):
+    """Test method bulk_save_OHLC_data_on_database"""
+
+    def setUp(self):
+        create_kraken_symbols('USD')
+
+    def extract_response(self, response, symbol):
+        kraken_extractor = KrakenResponseExtractor(response, symbol)
+        response_extractor = ResponseExtractor()
+        response_extractor.extract_response(kraken_extractor)
+        return response_extractor
+
+    def test_batch_is_saved(self):
+        """Test every valid row in the batch is saved for the symbol"""
+        result = bulk_save_OHLC_data_on_database(
+            self.extract_response(VALID_RESPONSE, 'SOLUSD'), 'SOLUSD')
+        self.assertEqual(result.saved, 3)
+        self.assertEqual(result.rejected, 0)
+        saved = KrakenOHLC.objects.filter(symbol__symbol='SOLUSD')
+        self.assertEqual(saved.count(), 3)
+        first = saved.order_by('date').first()
+        self.assertEqual(first.open, Decimal('149.92'))
+        self.assertEqual(str(first.date), '2021-09-24')
+
+    def test_invalid_rows_are_rejected(self):
+        """Test invalid rows are counted as rejected and valid ones saved"""
+        rows = [
+            {'open': 1.5, 'high': 2, 'low': 1, 'close': 1.7,
+             'date': '2021-10-01'},
+            {'open': 10 ** 12, 'high': 2, 'low': 1, 'close': 1.7,
+             'date': '2021-10-02'},
+            None,
+        ]
+        with self.assertLogs('data_loader.bulk_loader'):
+            result = bulk_save_OHLC_data_on_database(rows, 'BTCUSD')
+        self.assertEqual(result.saved, 1)
+        self.assertEqual(result.rejected, 2)
+
+    def test_parsed_items_match_serializer_fields(self):
+        """Test items converted without the serializer fields get the same
+        values, and items it can not convert are left to them"""
+        fields = KrakenOHLCRowSerializer().fields
+        prices = ['149.92', '0.00000001', '-3', '9999999999.99999999', 7,
+                  0.1, '0012.50']
+        for price in prices:
+            item = {'open': price, 'high': price, 'low': price,
+                    'close': price, 'date': '2021-10-01'}
+            expected = tuple(validate_field(name, fields[name], item)
+                             for name in OHLC_VALUE_FIELDS)
+            self.assertEqual(parse_OHLC_item(item), expected)
+        for price in ('1e-5', ' 1', '1.123456789', '12345678901', True,
+                      '١', None):
+            item = {'open': price, 'high': 1, 'low': 1, 'close': 1,
+                    'date': '2021-10-01'}
+            self.assertIsNone(parse_OHLC_item(item))
+        for date in ('2021-02-30', '20211001', None):
+            item = {'open': 1, 'high': 1, 'low': 1, 'close': 1,
+                    'date': date}
+            self.assertIsNone(parse_OHLC_item(item))
+        with self.assertLogs('data_loader.bulk_loader'):
+            rows, rejected = validate_OHLC_batch(
+                [{'open': '1e-5', 'high': 1, 'low': 1, 'close': 1,
+                  'date': '2021-10-01'},
+                 {'open': '1.123456789', 'high': 1, 'low': 1, 'close': 1,
+                  'date': '2021-10-01'}], 'BTCUSD')
+        self.assertEqual(rows, [(1000, 100000000, 100000000, 100000000,
+                                 datetime.date(2021, 10, 1))])
+        self.assertEqual(rejected, 1)
+
+    def test_duplicate_rows_are_counted(self):
+        """Test rows repeating the date of a later row are dropped and
+        counted, neither saved nor rejected"""
+        rows = [{'open': 1, 'high': 2, 'low': 1, 'close': close,
+                 'date': '2021-10-01'} for close in (1.5, 1.6, 1.7)]
+        with self.assertLogs('data_loader.bulk_loader', 'WARNING') as logs:
+            result = bulk_save_OHLC_data_on_database(rows, 'BTCUSD')
+        self.assertEqual((result.saved, result.rejected, result.duplicates),
+                         (1, 0, 2))
+        self.assertIn('Dropped 2 rows', logs.output[0])
+        self.assertEqual(KrakenOHLC.objects.get().close, Decimal('1.7'))
+
+    def test_several_batches_in_same_transaction(self):
+        """Test the staging table does not clash between batches"""
+        for symbol in ('BTCUSD', 'ETHUSD'):
+            result = bulk_save_OHLC_data_on_database(
+                self.extract_response(VALID_RESPONSE, symbol), symbol)
+            self.assertEqual(result.saved, 3)
+        self.assertEqual(KrakenOHLC.objects.count(), 6)
+
+    def test_unknown_symbol_rejects_batch(self):
+        """Test rows for a symbol that is not saved are rejected"""
+        with self.assertLogs('data_loader.bulk_loader'):
+            result = bulk_save_OHLC_data_on_database(
+                self.extract_response(VALID_RESPONSE, 'SOLUSD'), 'NOPEUSD')
+        self.assertEqual(result.saved, 0)
+        self.assertEqual(result.rejected, 3)
+        # every row is rejected, rows of the same date too
+        rows = [{'open': 1, 'high': 1, 'low': 1, 'close': 1,
+                 'date': '2021-10-01'}] * 2
+        with self.assertLogs('data_loader.bulk_loader'):
+            result = bulk_save_OHLC_data_on_database(rows, 'NOPEUSD')
+        self.assertEqual(result.rejected, 2)
+
+    def test_columns_are_saved(self):
+        """Test columns save the same values as the item by item path"""
+        result = bulk_save_OHLC_columns(
+            self.extract_response(VALID_RESPONSE, 'SOLUSD').columns(),
+            'SOLUSD')
+        self.assertEqual(result.saved, 3)
+        first = (KrakenOHLC.objects
+                 .filter(symbol__symbol='SOLUSD')
+                 .order_by('date')
+                 .first())
+        self.assertEqual(first.open, Decimal('149.92'))
+        self.assertEqual(str(first.date), '2021-09-24')
+
+    def test_columns_with_invalid_prices_are_rejected(self):
+        """Test rows with prices that do not fit or are not numbers are
+        rejected"""
+        columns = create_OHLC_columns([
+            [1632441600, "1.5", "2", "1", "1.7", "1.6", "10", 1],
+            [1632528000, "1e12", "2", "1", "1.7", "1.6", "10", 1],
+            [1632614400, "nan", "2", "1", "1.7", "1.6", "10", 1]])
+        with self.assertLogs('data_loader.bulk_loader'):
+            result = bulk_save_OHLC_columns(columns, 'BTCUSD')
+        self.assertEqual(result.saved, 1)
+        self.assertEqual(result.rejected, 2)
+
+
+class TestBulkSaveCandleColumns(TestCase):
+    """Test method bulk_save_candle_columns"""
+    CANDLES = [
+        [1632441600, "0.58412", "0.58500", "0.58300", "0.58450", "0.58401",
+         "12500.12345678", 42],
+        [1632441900, "0.58450", "0.58600", "0.58400", "0.58550", "0.58500",
+         "8000.5", 17],
+    ]
+
+    def setUp(self):
+        create_kraken_symbols('USD')
+
+    def test_candles_are_saved_with_time_and_interval(self):
+        result = bulk_save_candle_columns(create_OHLC_columns(self.CANDLES),
+                                          'XRPUSD', 5)
+        self.assertEqual(result.saved, 2)
+        candle = KrakenCandle.objects.get(symbol__symbol='XRPUSD',
+                                          ts='2021-09-24T00:05:00Z')
+        self.assertEqual(candle.interval, 5)
+        self.assertEqual(str(candle.open), '0.58450000')
+        self.assertEqual(str(candle.volume), '8000.50000000')
+        self.assertEqual(candle.count, 17)
+
+    def test_intervals_are_kept_apart(self):
+        """Test the same time at different intervals are different candles
+        and saving an interval again updates its candles"""
+        columns = create_OHLC_columns(self.CANDLES)
+        bulk_save_candle_columns(columns, 'XRPUSD', 5)
+        bulk_save_candle_columns(columns, 'XRPUSD', 1)
+        result = bulk_save_candle_columns(columns, 'XRPUSD', 5)
+        self.assertEqual(result.saved, 2)
+        self.assertEqual(KrakenCandle.objects.count(), 4)
+
+    def test_invalid_candles_are_rejected(self):
+        columns = create_OHLC_columns([
+            self.CANDLES[0],
+            [1632442200, "nan", "1", "1", "1", "1", "1", 1],
+            [1632442500, "1", "1", "1", "1", "1", "1e30", 1]])
+        with self.assertLogs('data_loader.bulk_loader'):
+            result = bulk_save_candle_columns(columns, 'XRPUSD', 5)
+        self.assertEqual(result.saved, 1)
+        self.assertEqual(result.rejected, 2)
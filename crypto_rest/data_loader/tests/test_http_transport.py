@@ -0,0 +1,80 @@
+import threading
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from django.test import TestCase
+from data_loader import http_transport
+
+
+class OkHandler(BaseHTTPRequestHandler):
+    """Answer every request with an empty JSON object keeping the connection
+    alive"""
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'{}')
+
+    def log_message(self, *args):
+        pass
+
+
+class TestHttpTransport(TestCase):
+    """Test session and retry helpers at module http_transport"""
+
+    def test_backoff_time_is_bounded(self):
+        """Test backoff grows exponentially but never above the maximum"""
+        for attempt in range(10):
+            wait = http_transport.backoff_time(attempt, base=1, maximum=8)
+            self.assertGreaterEqual(wait, 0)
+            self.assertLessEqual(wait, min(8, 2 ** attempt))
+
+    def test_retry_after_time(self):
+        """Test Retry-After header in seconds, HTTP date or missing"""
+        class Response:
+            def __init__(self, headers):
+                self.headers = headers
+
+        self.assertEqual(
+            http_transport.retry_after_time(Response({'Retry-After': '3'})),
+            3)
+        self.assertEqual(
+            http_transport.retry_after_time(
+                Response({'Retry-After': 'Wed, 21 Oct 2015 07:28:00 GMT'})),
+            0)
+        self.assertIsNone(http_transport.retry_after_time(Response({})))
+        # not capped at the maximum backoff
+        self.assertEqual(
+            http_transport.retry_after_time(Response({'Retry-After': '120'})),
+            120)
+
+    def test_pool_is_sized_for_workers(self):
+        """Test the shared session is only replaced when its pool is
+        smaller than the workers"""
+        self.addCleanup(http_transport.configure_session)
+        session = http_transport.configure_session()
+        http_transport.ensure_pool_size(3)
+        self.assertIs(http_transport.get_session(), session)
+        http_transport.ensure_pool_size(http_transport.POOL_SIZE + 5)
+        session = http_transport.get_session()
+        adapter = session.get_adapter('https://api.kraken.com')
+        self.assertEqual(adapter._pool_maxsize, http_transport.POOL_SIZE + 5)
+
+    def test_connections_are_reused(self):
+        """Test consecutive requests on a session reuse the connection"""
+        server = HTTPServer(('127.0.0.1', 0), OkHandler)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        session = http_transport.create_session(pool_size=2)
+        try:
+            url = f'http://127.0.0.1:{server.server_port}/'
+            for _ in range(5):
+                session.get(url, timeout=5)
+            stats = http_transport.TransportStats().as_dict(session)
+        finally:
+            session.close()
+            server.shutdown()
+            server.server_close()
+        self.assertEqual(stats['connections_opened'], 1)
+        self.assertEqual(stats['connections_reused'], 4)
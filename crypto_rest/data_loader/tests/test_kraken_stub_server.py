@@ -0,0 +1,146 @@
+from unittest.mock import patch
+import requests
+from requests.exceptions import HTTPError
+from django.test import TestCase, override_settings
+from data_loader.save_crypto_names import create_kraken_symbols
+from data_loader.kraken_stub_server import KrakenStubServer, candle_times
+from data_loader import http_transport
+from data_loader.kraken_data_loader import KrakenContentFetcher
+from data_loader.postgres_data_loader import (load_kraken_data_into_postgres,
+                                              create_OHLC_params,
+                                              START_DATE)
+from data_loader.backfill import backfill_kraken_data
+from crypto_data.models import KrakenOHLC
+
+
+DAY = 86400
+END = START_DATE + DAY * 40
+CANDLES = 15
+
+
+class TestKrakenStubServer(TestCase):
+    """Test class KrakenStubServer answers as Kraken API"""
+
+    def start_server(self, **kwargs):
+        kwargs.setdefault('candles', CANDLES)
+        kwargs.setdefault('end', END)
+        server = KrakenStubServer(**kwargs).start()
+        self.addCleanup(server.stop)
+        return server
+
+    def test_candle_times_follow_since(self):
+        """Test candles start after since, aligned to the interval and end
+        at the given end"""
+        day = 1630454400  # 01/Sep/2021
+        times = candle_times(day + 5, 1440, 5, day + DAY * 3)
+        self.assertEqual(list(times), [day + DAY, day + DAY * 2,
+                                       day + DAY * 3])
+        self.assertEqual(list(candle_times(day, 1440, 2, END)),
+                         [day + DAY, day + DAY * 2])
+        self.assertEqual(list(candle_times(day, 1440, 5, day)), [])
+
+    def test_OHLC_response(self):
+        """Test OHLC responses can be fetched and are deterministic"""
+        server = self.start_server()
+        url = f'{server.url}/OHLC'
+        params = create_OHLC_params('BTCUSD')
+        response = KrakenContentFetcher(url, params).fetch()
+        candles = response['result']['BTCUSD']
+        self.assertEqual(response['error'], [])
+        self.assertEqual(len(candles), CANDLES)
+        self.assertEqual(response['result']['last'], candles[-1][0])
+        self.assertEqual(KrakenContentFetcher(url, params).fetch(), response)
+
+    def test_asset_pairs_response(self):
+        """Test AssetPairs lists the configured pairs"""
+        server = self.start_server(pairs=['BTCUSD', 'ETHEUR'])
+        response = requests.get(f'{server.url}/AssetPairs').json()
+        self.assertEqual(set(response['result']), {'BTCUSD', 'ETHEUR'})
+        self.assertEqual(response['result']['ETHEUR']['quote'], 'EUR')
+
+    def test_unknown_pair_is_an_error_response(self):
+        server = self.start_server(pairs=['BTCUSD'])
+        response = requests.get(f'{server.url}/OHLC',
+                                params={'pair': 'ETHUSD'}).json()
+        self.assertEqual(response['error'], ['EQuery:Unknown asset pair'])
+
+    def test_throttled_requests_are_retried(self):
+        """Test requests above the throttle rate get status 429 and the
+        fetcher retries them after Retry-After"""
+        server = self.start_server(throttle_rate=0.01, throttle_burst=1)
+        url = f'{server.url}/OHLC'
+        response = requests.get(url, params={'pair': 'BTCUSD'})
+        self.assertEqual(response.status_code, 200)
+        response = requests.get(url, params={'pair': 'BTCUSD'})
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response.headers)
+        fetcher = KrakenContentFetcher(url, {'pair': 'BTCUSD', 'since': 0},
+                                       max_retries=2)
+        with patch('time.sleep') as mock_sleep:
+            with self.assertRaises(HTTPError):
+                fetcher.fetch()
+        # Retry-After asks for about 100 seconds, waited for in full
+        waits = [c.args[0] for c in mock_sleep.call_args_list]
+        self.assertEqual(len(waits), 2)
+        for wait in waits:
+            self.assertGreater(wait, http_transport.BACKOFF_MAX)
+            self.assertAlmostEqual(wait, 100, delta=1)
+        self.assertEqual(server.requests, 5)
+
+    def test_long_retry_after_is_not_waited_for(self):
+        """Test the fetcher gives up when Retry-After is longer than
+        RETRY_AFTER_MAX instead of retrying early"""
+        server = self.start_server(throttle_rate=0.001, throttle_burst=1)
+        url = f'{server.url}/OHLC'
+        requests.get(url, params={'pair': 'BTCUSD'})
+        fetcher = KrakenContentFetcher(url, {'pair': 'BTCUSD', 'since': 0},
+                                       max_retries=2)
+        with patch('time.sleep') as mock_sleep:
+            with self.assertRaisesRegex(HTTPError, 'giving up'):
+                fetcher.fetch()
+        self.assertEqual(mock_sleep.call_count, 0)
+        self.assertEqual(server.requests, 2)
+
+    def test_connection_error_is_reported(self):
+        """Test a refused connection is reported as a connection error"""
+        server = self.start_server()
+        url = f'{server.url}/OHLC'
+        server.stop()
+        fetcher = KrakenContentFetcher(url, {'pair': 'BTCUSD', 'since': 0},
+                                       max_retries=1)
+        with patch('time.sleep'):
+            with self.assertRaisesRegex(HTTPError, '^Connection error'):
+                fetcher.fetch()
+
+    def test_error_rate(self):
+        """Test every request fails with error rate 1"""
+        server = self.start_server(error_rate=1)
+        response = requests.get(f'{server.url}/OHLC',
+                                params={'pair': 'BTCUSD'})
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(server.requests, 1)
+
+
+class TestLoadFromStubServer(TestCase):
+    """Test loads run end to end against KrakenStubServer"""
+
+    def setUp(self):
+        create_kraken_symbols('USD')
+        self.server = KrakenStubServer(candles=CANDLES, end=END).start()
+        self.addCleanup(self.server.stop)
+
+    def test_load_kraken_data_into_postgres(self):
+        with override_settings(KRAKEN_API_URL=self.server.url):
+            load_kraken_data_into_postgres('OHLC', max_workers=3)
+        self.assertEqual(KrakenOHLC.objects.count(), 6 * CANDLES)
+
+    def test_stream_load(self):
+        with override_settings(KRAKEN_API_URL=self.server.url):
+            load_kraken_data_into_postgres('OHLC', stream=True)
+        self.assertEqual(KrakenOHLC.objects.count(), 6 * CANDLES)
+
+    def test_backfill_follows_pages(self):
+        """Test a backfill pages through the whole range served"""
+        with override_settings(KRAKEN_API_URL=self.server.url):
+            backfill_kraken_data('OHLC', START_DATE, END)
+        self.assertEqual(KrakenOHLC.objects.count(), 6 * 40)
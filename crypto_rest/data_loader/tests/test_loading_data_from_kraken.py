@@ -11,15 +11,20 @@ from data_loader.kraken_data_loader import (convert_unix_to_date,
                                             KrakenResponseExtractor)
 from data_loader.response_extractor import ResponseExtractor
 from data_loader.errors import ExtractorErrorResponse
-from requests.exceptions import HTTPError, ConnectionError
+from requests.exceptions import HTTPError, ConnectionError, Timeout
 
 
-def mocked_requests_get(response_json_data, response_status_code):
+def mocked_requests_get(response_json_data, response_status_code,
+                        headers=None):
     """Create mock response for request get"""
     class MockResponse:
         def __init__(self, json_data, status_code):
             self.json_data = json_data
             self.status_code = status_code
+            self.headers = headers or {}
+
+        def json(self):
+            return self.json_data
 
     return MockResponse(response_json_data, response_status_code)
 
@@ -59,11 +64,46 @@ class TestKrakenContentFetcher(TestCase):
     def test_kraken_content_fetcher_raises_HTTPError(self):
         """Fetch method raises error when response status code is not ok"""
         mocked_response = mocked_requests_get({'error': 'error'}, 500)
-        with patch('requests.get', return_value=mocked_response):
+        with patch('requests.Session.get', return_value=mocked_response), \
+                patch('data_loader.kraken_data_loader.time.sleep'):
+            kraken_fetcher = KrakenContentFetcher(self.KRAKEN_OHLC_URL,
+                                                  self.correct_request_params)
+            with self.assertRaises(HTTPError):
+                kraken_fetcher.fetch()
+
+    def test_non_retryable_status_is_not_retried(self):
+        """Fetch method raises straight away on a client error"""
+        mocked_response = mocked_requests_get({'error': 'error'}, 404)
+        with patch('requests.Session.get',
+                   return_value=mocked_response) as mock_get:
             kraken_fetcher = KrakenContentFetcher(self.KRAKEN_OHLC_URL,
                                                   self.correct_request_params)
             with self.assertRaises(HTTPError):
                 kraken_fetcher.fetch()
+        self.assertEqual(mock_get.call_count, 1)
+
+    def test_transient_errors_are_retried(self):
+        """Fetch method retries throttled responses and time outs and
+        returns the response once the request succeeds"""
+        responses = [mocked_requests_get({}, 429, {'Retry-After': '2'}),
+                     Timeout(),
+                     mocked_requests_get({'result': {}}, 200)]
+        with patch('requests.Session.get', side_effect=responses), \
+                patch('data_loader.kraken_data_loader.time.sleep') as sleep:
+            kraken_fetcher = KrakenContentFetcher(self.KRAKEN_OHLC_URL,
+                                                  self.correct_request_params)
+            self.assertEqual(kraken_fetcher.fetch(), {'result': {}})
+        self.assertEqual(sleep.call_count, 2)
+        # the first wait comes from the Retry-After header
+        self.assertEqual(sleep.call_args_list[0].args[0], 2)
+
+    def test_session_is_shared_between_fetchers(self):
+        """Fetchers use the same session so connections are reused"""
+        first = KrakenContentFetcher(self.KRAKEN_OHLC_URL,
+                                     self.correct_request_params)
+        second = KrakenContentFetcher(self.KRAKEN_OHLC_URL,
+                                      self.correct_request_params)
+        self.assertIs(first.session, second.session)
 
 
 
@@ -108,6 +148,12 @@ class TestKrakenResponseExtractor(TestCase):
                                                        self.VALID_RESPONSE_SYMBOL)
             expected_result(kraken_extractor.is_error_response())
 
+    def test_last(self):
+        """Test property last returns the cursor for the next request"""
+        kraken_extractor = KrakenResponseExtractor(self.VALID_RESPONSE,
+                                                   self.VALID_RESPONSE_SYMBOL)
+        self.assertEqual(kraken_extractor.last, 1633996800)
+
     def test_set_response_sequence(self):
         """test method set_response_sequence gets response sequence when the
          returned response has the same symbol as the requested one"""
@@ -140,6 +186,36 @@ class TestKrakenResponseExtractor(TestCase):
                                 round(float(high), 2),
                                 delta=0.01)
 
+    def test_columns_match_serializer_input(self):
+        """Test method columns returns the same values as iterating over the
+        extractor item by item"""
+        kraken_extractor = KrakenResponseExtractor(self.VALID_RESPONSE,
+                                                   self.VALID_RESPONSE_SYMBOL)
+        kraken_extractor.set_response_sequence()
+        columns = kraken_extractor.columns()
+        items = list(kraken_extractor)
+        self.assertEqual(len(columns.date), len(items))
+        for index, item in enumerate(items):
+            self.assertEqual(str(columns.date[index]), item['date'])
+            for field in ('open', 'high', 'low', 'close'):
+                self.assertEqual(round(getattr(columns, field)[index], 2),
+                                 item[field])
+        self.assertEqual(columns.count[0], 19338)
+        self.assertAlmostEqual(columns.volume[0], 254005.29576624)
+
+    def test_columns_drop_incomplete_items(self):
+        """Test incomplete items are logged and left out of the columns"""
+        response = {"error": [], "result": {self.VALID_RESPONSE_SYMBOL: [
+            [1632441600, "149.92", "151.30", "126.60", "139.24", "138.06",
+             "254005.29576624", 19338],
+            [1632528000, "139.19"]]}}
+        with self.assertLogs('data_loader.kraken_data_loader'):
+            kraken_extractor = KrakenResponseExtractor(
+                response, self.VALID_RESPONSE_SYMBOL)
+            kraken_extractor.set_response_sequence()
+            columns = kraken_extractor.columns()
+        self.assertEqual(len(columns.time), 1)
+
     def test_IndexError_logs_correct_error(self):
         """test logs when IndexError raises on method
         create_serializer_input"""
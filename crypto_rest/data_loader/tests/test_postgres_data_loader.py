@@ -1,14 +1,30 @@
-from django.test import TestCase
+from decimal import Decimal
+import copy
+from django.test import TestCase, override_settings
 from unittest.mock import patch, Mock
 from unittest import skip
-from requests.exceptions import HTTPError
+from requests.exceptions import HTTPError, ConnectionError
 from data_loader.save_crypto_names import create_kraken_symbols
 from data_loader.postgres_data_loader import (load_kraken_data_into_postgres,
-                                              save_OHLC_data_on_database)
+                                              load_kraken_candles_into_postgres,
+                                              save_OHLC_data_on_database,
+                                              START_DATE)
 from data_loader.kraken_data_loader import (KrakenContentFetcher,
                                             is_valid_unix_time)
 from data_loader.response_extractor import ResponseExtractor
-from crypto_data.models import KrakenOHLC
+from data_loader.rate_limiter import TokenBucket
+from data_loader.kraken_stub_server import KrakenStubServer
+from crypto_data.models import KrakenOHLC, KrakenCandle
+
+
+OHLC_RESPONSE = {"error": [], "result": {"XXBTZUSD": [
+    [1632441600, "149.92", "151.30", "126.60", "139.24", "138.06",
+     "254005.29576624", 19338],
+    [1632528000, "139.19", "144.00", "133.71", "136.07", "138.33",
+     "122860.44860293", 8251],
+    [1632614400, "135.81", "140.67", "125.00", "135.71", "133.44",
+     "177607.42934785", 11195]],
+    "last": 1632614400}}
 
 
 class TestLoadkrakenData(TestCase):
@@ -69,4 +85,152 @@ class TestLoadkrakenData(TestCase):
         print(f'saved_items {saved_items}')
 
 
+class TestLoadKrakenDataConcurrently(TestCase):
+    """test method load_kraken_data_into_postgres with multiple workers"""
+
+    def setUp(self) -> None:
+        """initalize KrakenSymbols."""
+        create_kraken_symbols('USD')
+
+    @staticmethod
+    def fetch_or_fail(fetcher):
+        """return a valid response for every symbol but BTCUSD"""
+        if fetcher.kraken_symbol == 'BTCUSD':
+            raise HTTPError('Time out')
+        return OHLC_RESPONSE
+
+    @patch('data_loader.kraken_data_loader.KrakenContentFetcher.fetch')
+    def test_every_symbol_is_fetched(self, mock_fetcher):
+        """test fetch is called once per symbol when using several workers"""
+        mock_fetcher.return_value = OHLC_RESPONSE
+        load_kraken_data_into_postgres('OHLC', max_workers=3)
+        self.assertEqual(mock_fetcher.call_count, 6)
+
+    def test_failing_symbol_does_not_stop_other_symbols(self):
+        """test an error fetching one symbol is isolated and the responses
+        for the rest of the symbols are saved"""
+        with patch('data_loader.kraken_data_loader.KrakenContentFetcher.fetch',
+                   autospec=True, side_effect=self.fetch_or_fail):
+            with self.assertLogs('data_loader.postgres_data_loader'):
+                load_kraken_data_into_postgres('OHLC', max_workers=3)
+        saved_symbols = set(KrakenOHLC.objects
+                            .values_list('symbol__symbol', flat=True))
+        self.assertEqual(len(saved_symbols), 5)
+        self.assertNotIn('BTCUSD', saved_symbols)
+
+    def test_connection_error_does_not_stop_other_symbols(self):
+        """test a requests error other than HTTPError, i.e raised reading a
+        streamed body, is isolated as well"""
+        def fetch_or_disconnect(fetcher):
+            if fetcher.kraken_symbol == 'BTCUSD':
+                raise ConnectionError('Connection reset')
+            return OHLC_RESPONSE
+
+        with patch('data_loader.kraken_data_loader.KrakenContentFetcher.fetch',
+                   autospec=True, side_effect=fetch_or_disconnect):
+            load_kraken_data_into_postgres('OHLC', max_workers=3)
+        saved_symbols = set(KrakenOHLC.objects
+                            .values_list('symbol__symbol', flat=True))
+        self.assertEqual(len(saved_symbols), 5)
+
+    def test_symbols_in_flight_are_bounded(self):
+        """test no more than max_workers responses are fetched and not
+        saved yet at any time"""
+        fetched, saved, in_flight = [], [], []
+
+        def fetch(fetcher):
+            fetched.append(fetcher.kraken_symbol)
+            in_flight.append(len(fetched) - len(saved))
+            return OHLC_RESPONSE
+
+        with patch('data_loader.kraken_data_loader.KrakenContentFetcher.fetch',
+                   autospec=True, side_effect=fetch):
+            with patch('data_loader.postgres_data_loader.save_kraken_response',
+                       side_effect=lambda response, symbol:
+                       saved.append(symbol)):
+                load_kraken_data_into_postgres('OHLC', max_workers=2)
+        self.assertEqual(len(saved), 6)
+        self.assertLessEqual(max(in_flight), 2)
+
+    def test_rate_limiter_is_acquired_per_request(self):
+        """test the provided rate limiter is used for every request"""
+        rate_limiter = Mock(spec=TokenBucket)
+        with patch('data_loader.kraken_data_loader.KrakenContentFetcher.fetch',
+                   return_value=OHLC_RESPONSE):
+            load_kraken_data_into_postgres('OHLC',
+                                           max_workers=2,
+                                           rate_limiter=rate_limiter)
+        self.assertEqual(rate_limiter.acquire.call_count, 6)
+
+
+class TestIncrementalLoad(TestCase):
+    """test method load_kraken_data_into_postgres in incremental mode"""
+
+    def setUp(self) -> None:
+        """initalize KrakenSymbols."""
+        create_kraken_symbols('USD')
+
+    @patch('data_loader.kraken_data_loader.KrakenContentFetcher.fetch',
+           autospec=True, return_value=OHLC_RESPONSE)
+    def test_since_starts_at_latest_saved_candle(self, mock_fetcher):
+        """test symbols with saved data are requested from their latest
+        candle and symbols without data from START_DATE"""
+        load_kraken_data_into_postgres('OHLC')
+        KrakenOHLC.objects.filter(symbol__symbol='ETHUSD').delete()
+        mock_fetcher.reset_mock()
+        load_kraken_data_into_postgres('OHLC', incremental=True)
+        since = {call.args[0].kraken_symbol: call.args[0].request_since
+                 for call in mock_fetcher.call_args_list}
+        # latest saved candle opens at 1632614400
+        self.assertEqual(since['BTCUSD'], 1632614399)
+        self.assertEqual(since['ETHUSD'], START_DATE)
+
+    def test_reload_updates_instead_of_duplicating(self):
+        """test loading the same candles again updates the saved ones"""
+        with patch('data_loader.kraken_data_loader.KrakenContentFetcher.fetch',
+                   return_value=OHLC_RESPONSE):
+            load_kraken_data_into_postgres('OHLC')
+        updated_response = copy.deepcopy(OHLC_RESPONSE)
+        updated_response['result']['XXBTZUSD'][-1][4] = '140.50'
+        with patch('data_loader.kraken_data_loader.KrakenContentFetcher.fetch',
+                   return_value=updated_response):
+            load_kraken_data_into_postgres('OHLC', incremental=True)
+        btc_candles = KrakenOHLC.objects.filter(symbol__symbol='BTCUSD')
+        self.assertEqual(btc_candles.count(), 3)
+        self.assertEqual(btc_candles.latest('date').close,
+                         Decimal('140.50'))
+
+
+class TestLoadKrakenCandles(TestCase):
+    """test method load_kraken_candles_into_postgres"""
+    CANDLES = 50
+
+    def setUp(self) -> None:
+        create_kraken_symbols('USD')
+        self.server = KrakenStubServer(candles=self.CANDLES,
+                                       end=START_DATE + 86400).start()
+        self.addCleanup(self.server.stop)
+
+    def test_intraday_candles_are_loaded(self):
+        with override_settings(KRAKEN_API_URL=self.server.url):
+            load_kraken_candles_into_postgres(15)
+            load_kraken_candles_into_postgres(60, stream=True)
+        self.assertEqual(KrakenCandle.objects.filter(interval=15).count(),
+                         6 * self.CANDLES)
+        self.assertEqual(KrakenCandle.objects.filter(interval=60).count(),
+                         6 * 24)
+
+    def test_incremental_load_starts_at_latest_candle(self):
+        with override_settings(KRAKEN_API_URL=self.server.url):
+            load_kraken_candles_into_postgres(15)
+            latest = KrakenCandle.objects.latest('ts').ts
+            with patch('data_loader.kraken_data_loader.KrakenContentFetcher'
+                       '.fetch', autospec=True,
+                       return_value={'error': [], 'result': {}}) as fetch:
+                load_kraken_candles_into_postgres(15, incremental=True)
+        since = {call.args[0].request_since for call in fetch.call_args_list}
+        self.assertEqual(since, {int(latest.timestamp()) - 1})
 
+    def test_unknown_interval(self):
+        with self.assertRaises(ValueError):
+            load_kraken_candles_into_postgres(7)
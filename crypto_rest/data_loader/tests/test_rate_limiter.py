@@ -0,0 +1,67 @@
+from django.test import TestCase
+from data_loader.rate_limiter import TokenBucket
+
+
+class FakeClock:
+    """Clock that only moves forward when sleep is called"""
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class TestTokenBucket(TestCase):
+    """Test class TokenBucket"""
+
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def create_bucket(self, rate, capacity):
+        return TokenBucket(rate, capacity,
+                           clock=self.clock,
+                           sleep=self.clock.sleep)
+
+    def test_burst_does_not_wait(self):
+        """Test up to capacity tokens can be acquired without waiting"""
+        bucket = self.create_bucket(rate=1, capacity=3)
+        for _ in range(3):
+            bucket.acquire()
+        self.assertEqual(self.clock.sleeps, [])
+
+    def test_acquire_waits_for_refill(self):
+        """Test once the bucket is empty acquire waits for the refill rate"""
+        bucket = self.create_bucket(rate=2, capacity=1)
+        bucket.acquire()
+        bucket.acquire()
+        self.assertAlmostEqual(sum(self.clock.sleeps), 0.5)
+
+    def test_rate_is_respected_on_the_long_run(self):
+        """Test acquiring many tokens takes as long as the rate requires"""
+        bucket = self.create_bucket(rate=1, capacity=5)
+        for _ in range(25):
+            bucket.acquire()
+        self.assertAlmostEqual(self.clock.now, 20)
+
+    def test_try_acquire_does_not_wait(self):
+        """Test try_acquire returns the time to wait instead of waiting"""
+        bucket = self.create_bucket(rate=2, capacity=1)
+        self.assertEqual(bucket.try_acquire(), 0)
+        self.assertAlmostEqual(bucket.try_acquire(), 0.5)
+        self.assertEqual(self.clock.sleeps, [])
+        self.clock.now += 0.5
+        self.assertEqual(bucket.try_acquire(), 0)
+
+    def test_invalid_arguments(self):
+        """Test ValueError is raised for invalid rate or capacity"""
+        with self.assertRaises(ValueError):
+            TokenBucket(0, 1)
+        with self.assertRaises(ValueError):
+            TokenBucket(1, 0)
+        with self.assertRaises(ValueError):
+            TokenBucket(1, 1).acquire(2)
@@ -0,0 +1,85 @@
+import functools
+import tempfile
+from django.test import TestCase, override_settings
+from requests.exceptions import HTTPError
+from data_loader.save_crypto_names import create_kraken_symbols
+from data_loader.kraken_stub_server import KrakenStubServer
+from data_loader.recording_fetcher import (ResponseCassette,
+                                           RecordingContentFetcher,
+                                           ReplayContentFetcher)
+from data_loader.postgres_data_loader import (load_kraken_data_into_postgres,
+                                              START_DATE)
+from crypto_data.models import KrakenOHLC
+
+
+PARAMS = {'pair': 'BTCUSD', 'since': 1627772400, 'interval': 1440}
+BODY = b'{"error": [], "result": {"BTCUSD": [], "last": 0}}'
+
+
+class TestResponseCassette(TestCase):
+    """Test class ResponseCassette"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.cassette = ResponseCassette(directory.name)
+
+    def test_saved_response_is_loaded(self):
+        """Test responses are found no matter the host or the order of the
+        parameters"""
+        self.cassette.save('https://api.kraken.com/0/public/OHLC', PARAMS,
+                           BODY)
+        reordered = dict(reversed(list(PARAMS.items())))
+        self.assertEqual(self.cassette.load('http://127.0.0.1/0/public/OHLC',
+                                            reordered), BODY)
+        self.assertEqual(len(self.cassette), 1)
+
+    def test_missing_response(self):
+        with self.assertRaises(KeyError):
+            self.cassette.load('https://api.kraken.com/0/public/OHLC', PARAMS)
+
+    def test_replay_missing_response_raises_HTTPError(self):
+        fetcher = ReplayContentFetcher('OHLC', PARAMS, self.cassette)
+        with self.assertLogs('data_loader.recording_fetcher'):
+            with self.assertRaises(HTTPError):
+                fetcher.fetch()
+
+    def test_replay_stream(self):
+        """Test the recorded body is streamed in chunks"""
+        self.cassette.save('OHLC', PARAMS, BODY)
+        fetcher = ReplayContentFetcher('OHLC', PARAMS, self.cassette)
+        self.assertEqual(b''.join(fetcher.fetch_stream(chunk_size=8)), BODY)
+        self.assertEqual(fetcher.fetch()['result']['last'], 0)
+
+
+class TestRecordAndReplay(TestCase):
+    """Test a load recorded from the stand-in server is replayed without
+    the server"""
+
+    def setUp(self):
+        create_kraken_symbols('USD')
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.cassette = ResponseCassette(directory.name)
+
+    def saved_rows(self):
+        return list(KrakenOHLC.objects
+                    .order_by('symbol__symbol', 'date')
+                    .values_list('symbol__symbol', 'date', 'open', 'close'))
+
+    def test_replayed_load_saves_the_same_rows(self):
+        server = KrakenStubServer(candles=10, end=START_DATE + 86400 * 20)
+        recorder = functools.partial(RecordingContentFetcher,
+                                     cassette=self.cassette)
+        with server, override_settings(KRAKEN_API_URL=server.url):
+            load_kraken_data_into_postgres('OHLC', fetcher_class=recorder)
+        recorded = self.saved_rows()
+        self.assertEqual(len(recorded), 60)
+        self.assertEqual(len(self.cassette), 6)
+
+        KrakenOHLC.objects.all().delete()
+        replayer = functools.partial(ReplayContentFetcher,
+                                     cassette=self.cassette)
+        load_kraken_data_into_postgres('OHLC', fetcher_class=replayer,
+                                       stream=True)
+        self.assertEqual(self.saved_rows(), recorded)
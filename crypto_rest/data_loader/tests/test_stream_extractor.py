@@ -0,0 +1,109 @@
+import json
+from unittest.mock import patch
+from django.test import TestCase
+from data_loader.stream_extractor import KrakenStreamExtractor
+from data_loader.save_crypto_names import create_kraken_symbols
+from data_loader.postgres_data_loader import load_kraken_data_into_postgres
+from data_loader.errors import ExtractorErrorResponse, NonRelatedResponseError
+from crypto_data.models import KrakenOHLC
+
+
+def create_candles(amount, start=1632441600):
+    return [[start + 86400 * i, "149.92", "151.30", "126.60", "139.24",
+             "138.06", "254005.29576624", 19338 + i] for i in range(amount)]
+
+
+def split_bytes(response: dict, chunk_size: int):
+    """Serialize response and split it in chunks of chunk_size bytes"""
+    body = json.dumps(response).encode('utf-8')
+    return [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)]
+
+
+class TestKrakenStreamExtractor(TestCase):
+    """Test class KrakenStreamExtractor"""
+    SYMBOL = 'SOLUSD'
+
+    def create_response(self, candles, symbol='SOLUSD'):
+        return {"error": [], "result": {symbol: candles,
+                                        "last": candles[-1][0]}}
+
+    def test_items_are_extracted_from_any_chunk_size(self):
+        """Test items are the same no matter where the chunks split"""
+        candles = create_candles(20)
+        response = self.create_response(candles)
+        for chunk_size in (1, 7, 64, 100000):
+            extractor = KrakenStreamExtractor(
+                split_bytes(response, chunk_size), self.SYMBOL)
+            self.assertEqual(list(extractor), candles)
+            self.assertEqual(extractor.last, candles[-1][0])
+
+    def test_returned_symbol_can_differ_from_requested(self):
+        """Test items under a different symbol name are extracted"""
+        candles = create_candles(3)
+        response = self.create_response(candles, symbol='XXBTZUSD')
+        extractor = KrakenStreamExtractor(split_bytes(response, 10), 'BTCUSD')
+        self.assertEqual(list(extractor), candles)
+
+    def test_items_are_yielded_before_the_body_is_received(self):
+        """Test the first item is available before reading the whole body"""
+        chunks = split_bytes(self.create_response(create_candles(500)), 50)
+        received = []
+
+        def receive():
+            for chunk in chunks:
+                received.append(chunk)
+                yield chunk
+
+        next(iter(KrakenStreamExtractor(receive(), self.SYMBOL)))
+        self.assertLess(len(received), len(chunks) / 10)
+
+    def test_column_chunks(self):
+        """Test columns are returned in chunks of the requested size"""
+        response = self.create_response(create_candles(25))
+        extractor = KrakenStreamExtractor(split_bytes(response, 13),
+                                          self.SYMBOL)
+        sizes = [len(c.time) for c in extractor.column_chunks(10)]
+        self.assertEqual(sizes, [10, 10, 5])
+
+    def test_error_response(self):
+        """Test errors returned by Kraken raise ExtractorErrorResponse"""
+        response = {"error": ["EQuery:Unknown asset pair"]}
+        extractor = KrakenStreamExtractor(split_bytes(response, 5),
+                                          self.SYMBOL)
+        with self.assertLogs('data_loader.stream_extractor'):
+            with self.assertRaises(ExtractorErrorResponse):
+                list(extractor)
+
+    def test_several_symbols_raise_NonRelatedResponseError(self):
+        """Test a result with more than one symbol is not related"""
+        response = {"error": [], "result": {"A": create_candles(1),
+                                            "B": create_candles(1)}}
+        extractor = KrakenStreamExtractor(split_bytes(response, 5),
+                                          self.SYMBOL)
+        with self.assertRaises(NonRelatedResponseError):
+            list(extractor)
+
+    def test_truncated_body(self):
+        """Test a body cut before the end raises ExtractorErrorResponse"""
+        chunks = split_bytes(self.create_response(create_candles(5)), 20)
+        extractor = KrakenStreamExtractor(chunks[:-3], self.SYMBOL)
+        with self.assertLogs('data_loader.stream_extractor'):
+            with self.assertRaises(ExtractorErrorResponse):
+                list(extractor)
+
+
+class TestLoadKrakenDataStream(TestCase):
+    """test method load_kraken_data_into_postgres with stream"""
+
+    def setUp(self):
+        create_kraken_symbols('USD')
+
+    def test_streamed_responses_are_saved(self):
+        """Test every streamed candle is saved"""
+        response = {"error": [], "result": {"XXBTZUSD": create_candles(30),
+                                            "last": 0}}
+        with patch('data_loader.kraken_data_loader.KrakenContentFetcher'
+                   '.fetch_stream',
+                   side_effect=lambda: iter(split_bytes(response, 100))):
+            load_kraken_data_into_postgres('OHLC', stream=True)
+        self.assertEqual(KrakenOHLC.objects.count(), 6 * 30)